@@ -1,120 +1,65 @@
 #Updated with themocouple selection and live plotting
 #Developed and Created by:Richard Manimtim |RE|Eastwood City PH
+import time
+STARTUP_STARTED = time.perf_counter()
+import argparse
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox, Menu
+from tkinter import ttk, scrolledtext, messagebox, filedialog, Menu
 from ttkthemes import ThemedStyle
 import asyncio
 import queue
 import threading
-import pyvisa
-import time
 import logging
-import math
 import re
-import csv
 from datetime import datetime
 import os
 import sys
 import traceback
-import cv2
-from PIL import Image, ImageTk
-from enum import Enum
 from collections import deque
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.dates as mdates
-from matplotlib.animation import FuncAnimation
-import configparser
-
-config = configparser.ConfigParser()
-config.read('config.ini')
-
-ver = config.get('DEFAULT', 'version', fallback="v3.12")
-
-# Configure logging
-log_directory = config.get('paths', 'log_directory', fallback='logs')
-os.makedirs(log_directory, exist_ok=True)
-log_file = os.path.join(log_directory, f'temperature_monitor_{datetime.now().strftime("%Y%m%d")}.log')
-logging.basicConfig(filename=log_file, level=logging.DEBUG,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-
-class ConnectionState(Enum):
-    DISCONNECTED = 0
-    CONNECTING = 1
-    CONNECTED = 2
-    RECONNECTING = 3
-
-class VisaCommunication:
-    def __init__(self, resource_name):
-        self.resource_name = resource_name
-        self.inst = None
-        self.state = ConnectionState.DISCONNECTED
-        self.lock = asyncio.Lock()
-        self.last_heartbeat = 0
-        self.heartbeat_interval = config.getint('connection', 'heartbeat_interval', fallback=5)
-
-    async def connect(self):
-        async with self.lock:
-            if self.state != ConnectionState.DISCONNECTED:
-                return
-            
-            self.state = ConnectionState.CONNECTING
-            try:
-                rm = pyvisa.ResourceManager()
-                self.inst = await asyncio.to_thread(rm.open_resource, self.resource_name)
-                await asyncio.to_thread(self.inst.write, "*CLS")
-                self.state = ConnectionState.CONNECTED
-                self.last_heartbeat = asyncio.get_event_loop().time()
-            except Exception as e:
-                self.state = ConnectionState.DISCONNECTED
-                raise ConnectionError(f"Failed to connect: {str(e)}")
-
-    async def disconnect(self):
-        async with self.lock:
-            if self.state == ConnectionState.DISCONNECTED:
-                return
-            
-            try:
-                if self.inst:
-                    await asyncio.to_thread(self.inst.close)
-            finally:
-                self.inst = None
-                self.state = ConnectionState.DISCONNECTED
-
-    async def _perform_operation(self, operation, command, max_retries=3):
-        async with self.lock:
-            if self.state != ConnectionState.CONNECTED:
-                raise ConnectionError("Not connected to the instrument")
-
-            current_time = asyncio.get_event_loop().time()
-            if current_time - self.last_heartbeat >= self.heartbeat_interval:
-                try:
-                    await asyncio.to_thread(self.inst.query, "*OPC?")
-                    self.last_heartbeat = current_time
-                except Exception as e:
-                    self.state = ConnectionState.DISCONNECTED
-                    raise ConnectionError(f"Heartbeat failed: {str(e)}")
-
-            for attempt in range(max_retries):
-                try:
-                    result = await asyncio.to_thread(operation, command)
-                    self.last_heartbeat = asyncio.get_event_loop().time()
-                    return result
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        self.state = ConnectionState.DISCONNECTED
-                        raise ConnectionError(f"Operation failed after {max_retries} attempts: {str(e)}")
-                    await asyncio.sleep(1)
-
-    async def query(self, command, max_retries=3):
-        return await self._perform_operation(self.inst.query, command, max_retries)
-
-    async def write(self, command, max_retries=3):
-        return await self._perform_operation(self.inst.write, command, max_retries)
+from settings import config, ver, log_directory, configure_logging, logging_stats, get_temperature_channels, get_fan_channels, fan_zone_sections
+from acquisition import AcquisitionClient, Sample, clear_checkpoint, engine_running, read_checkpoint
+from profiling import DiagnosticsProfiler, StartupTimer
+from plot_history import EnvelopeHistory
+from replay import read_log_header, read_tail_samples
+
+READOUT_COLUMNS = 10
+
+# Imported off the Tk thread after the window is up (see load_deferred_subsystems);
+# the code that needs them imports them locally.
+PLOT_MODULES = ('matplotlib.figure', 'matplotlib.dates', 'matplotlib.animation', 'matplotlib.backends.backend_tkagg')
+VIDEO_MODULES = ('cv2', 'PIL.ImageTk')
+
+PLOT_WINDOWS = {
+    "1 min": 60,
+    "10 min": 600,
+    "1 h": 3600,
+    "8 h": 8 * 3600,
+    "1 day": 86400,
+    "1 week": 7 * 86400,
+    "All": None,
+}
+
+def format_interval(seconds):
+    # Inverse of get_sleep_interval_in_seconds for the values it accepts.
+    if seconds < 1:
+        return f"{round(seconds * 1000)}ms"
+    if seconds >= 60 and seconds % 60 == 0:
+        return f"{int(seconds // 60)}m"
+    return f"{int(seconds)}s"
+
+
+def prepare_video_frame(frame, size=(440, 300)):
+    import cv2
+    from PIL import Image
+    frame = cv2.resize(frame, size)
+    cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+    return Image.fromarray(cv2image)
 
 class TemperatureMonitorApp(tk.Tk):
-    def __init__(self, loop):
+    def __init__(self, loop, startup=None, startup_timing=False):
         super().__init__()
+        self.startup = startup or StartupTimer()
+        self.startup_timing = startup_timing or config.getboolean('diagnostics', 'startup_timing', fallback=False)
         self.title(f"Base Plate Temperature Monitoring System ({ver}) Copyright (c) 2024, Reliability Engineering")
         self.geometry("1200x950")
         self.configure(bg='#f0f0f0')
@@ -123,25 +68,23 @@ class TemperatureMonitorApp(tk.Tk):
         self.loop = loop
         self.running = True
         
-        self.visa_comm = None
-        self.monitoring_task = None
+        self.acquisition = AcquisitionClient(isolated=config.getboolean('acquisition', 'isolated', fallback=True),
+                                             capacity=config.getint('acquisition', 'ring_capacity', fallback=4096))
+        self.instrument_connected = False
+        self.engine_stopped = False
         self.stop_video_event = threading.Event()
         self.frame_queue = queue.Queue(maxsize=1)
         self.monitoring_flag = asyncio.Event()
         self.stop_instrument_event = asyncio.Event()
         self.data_queue = asyncio.Queue()
         
-        self.csv_file = None
-        self.csv_writer = None
-        self.last_save_time = time.time()
-        self.save_interval = config.getint('monitoring', 'save_interval', fallback=30)
         self.gui_update_interval = config.getfloat('monitoring', 'gui_update_interval', fallback=0.5)
-        self.logging_task = None
         
         default_channels_str = config.get('channels', 'default_temp_channels', fallback='101, 102, 103')
         self.channels = [int(c.strip()) for c in default_channels_str.split(',')]
         self.channel_vars = []
         self.thermocouple_vars = {}
+        self.thermocouple_combos = []
         self.fan_channel_var = tk.IntVar(value=config.getint('channels', 'default_fan_channel', fallback=203))
         
         self.status_var = tk.StringVar(value="Ready")
@@ -149,9 +92,6 @@ class TemperatureMonitorApp(tk.Tk):
         self.rotating_video = config.get('paths', 'rotating_video', fallback='videos/rotating_fan.mp4')
         self.stopped_video = config.get('paths', 'stopped_video', fallback='videos/stopped_fan.mp4')
         
-        if not os.path.exists(self.rotating_video) or not os.path.exists(self.stopped_video):
-            messagebox.showwarning("Video Files Missing", "One or both video files are missing. The fan animation may not work correctly.")
-        
         self.fan_video_frame = None
         self.video_label = None
         self.video_thread = None
@@ -162,34 +102,168 @@ class TemperatureMonitorApp(tk.Tk):
         self.sleep_interval = None
         
         self.connection_status_var = tk.StringVar(value="Disconnected")
-        self.reconnection_attempts = 0
-        self.max_reconnection_attempts = config.getint('connection', 'max_reconnection_attempts', fallback=5)
-        self.reconnection_timeout = config.getint('connection', 'reconnection_timeout', fallback=30)
-        self.communication_error_threshold = config.getint('connection', 'communication_error_threshold', fallback=3)
-        self.consecutive_errors = 0
-        self.is_reconnecting = False
-        
-        self.max_errors = 5
-        self.error_count = 0
-        self.reconnection_task = None
-        self.heartbeat_task = None
+        self.channel_health_var = tk.StringVar(value="OK")
+        self.quarantined_channels = set()
 
         self.plot_data = {'time': deque(maxlen=config.getint('monitoring', 'max_plot_points', fallback=100))}
+        self.plot_mode = config.get('monitoring', 'plot_mode', fallback='points').strip().lower()
+        history_block_samples = config.getint('monitoring', 'history_block_samples', fallback=256)
+        # Compressed histories start the pyramid at 16-sample buckets; finer
+        # windows are decoded from the blocks instead.
+        self.history = EnvelopeHistory(capacity=config.getint('monitoring', 'history_max_samples', fallback=604800),
+                                       first_level_bits=4 if history_block_samples else 2,
+                                       block_size=history_block_samples,
+                                       recent_samples=config.getint('monitoring', 'history_recent_samples', fallback=3600),
+                                       resolution=config.getfloat('monitoring', 'history_resolution', fallback=0.1))
+        self.plot_window_var = tk.StringVar(value=config.get('monitoring', 'plot_window', fallback='All'))
+
+        self.profiler = DiagnosticsProfiler(log_directory, top_stats=config.getint('diagnostics', 'top_stats', fallback=25))
+        self.diagnostics_sample_interval = config.getfloat('diagnostics', 'sample_interval', fallback=10)
+        self.diagnostics_snapshot_interval = config.getfloat('diagnostics', 'snapshot_interval', fallback=0)
+        self.cpu_profiling_var = tk.BooleanVar(value=False)
+        self.memory_tracing_var = tk.BooleanVar(value=False)
+        self.resource_sampling_var = tk.BooleanVar(value=False)
+        self.adaptive_var = tk.BooleanVar(value=config.getboolean('adaptive', 'enabled', fallback=False))
+
+        self.replay_speed_var = tk.DoubleVar(value=config.getfloat('replay', 'default_speed', fallback=1.0))
+        self.samples_consumed = 0
+        self.replay_overruns_start = 0
+        # Checkpoint of a crashed session the user chose to resume.
+        self.resume_session = None
+
+        # Plot and fan video only run while they can be seen; the plot also
+        # waits for new data. See update_render_state.
+        self.ani = None
+        self.window_iconified = False
+        self.window_obscured = False
+        self.monitor_tab_selected = True
+        self.plot_dirty = True
+        self.plot_paused = False
+        self.video_active = False
+        self.video_resumed = asyncio.Event()
+        self.video_ready = False
+        self.fig = None
+        self.cpu_sample = (time.monotonic(), time.process_time())
         
         self.create_menu()
         self.create_widgets()
+        self.startup.mark('controls built')
         self.start_asyncio_tasks()
         
         sys.excepthook = self.handle_exception
 
-        self.ani = FuncAnimation(self.fig, self.animate_plot, interval=1000, blit=False, cache_frame_data=False)
+        self.plot_window_var.trace_add('write', lambda *args: self.mark_plot_dirty())
+        self.bind('<Map>', self.on_window_map)
+        self.bind('<Unmap>', self.on_window_unmap)
 
     def start_asyncio_tasks(self):
+        self.acquisition.start(self.loop)
         self.loop.create_task(self.update_video_frame_async())
         self.loop.create_task(self.process_queue_async())
+        self.loop.create_task(self.process_acquisition_events_async())
+        self.loop.create_task(self.read_samples_async())
+        self.loop.create_task(self.load_deferred_subsystems())
+        if config.getboolean('diagnostics', 'profiling_enabled', fallback=False):
+            self.start_diagnostics()
+
+    async def load_deferred_subsystems(self):
+        # The window and acquisition controls come first; the plot and fan
+        # video are attached as soon as their modules are imported.
+        for name in PLOT_MODULES:
+            await asyncio.to_thread(self.startup.timed_import, name)
+        self.attach_plot()
+        self.startup.mark('plot attached')
+        for name in VIDEO_MODULES:
+            await asyncio.to_thread(self.startup.timed_import, name)
+        self.attach_video()
+        self.startup.mark('fan video attached')
+
+        if not os.path.exists(self.rotating_video) or not os.path.exists(self.stopped_video):
+            messagebox.showwarning("Video Files Missing", "One or both video files are missing. The fan animation may not work correctly.")
+
+        budget = config.getfloat('diagnostics', 'startup_budget', fallback=2.0)
+        window_shown = self.startup.elapsed('window shown')
+        if budget and window_shown is not None and window_shown > budget:
+            logging.warning(f"Window took {window_shown:.2f} s to appear (startup budget {budget:g} s)")
+        if self.startup_timing:
+            report = self.startup.report()
+            logging.info(report)
+            print(report)
+
+        if config.getboolean('restart', 'enabled', fallback=True):
+            await self.offer_warm_restart()
+
+    async def offer_warm_restart(self):
+        checkpoint = read_checkpoint()
+        if checkpoint is None:
+            return
+        log_file = checkpoint.get('log_file')
+        owner = checkpoint.get('pid')
+        if owner and owner != os.getpid() and engine_running(owner):
+            # An engine left over from an earlier GUI is still writing this log
+            # and driving the relays; resuming would add a second writer.
+            logging.warning(f"Session {log_file} is still running in process {owner}; not offering to resume it")
+            messagebox.showwarning(
+                "Session Still Running",
+                f"The session logging to {os.path.basename(log_file or '')} is still running in process {owner}.\n\n"
+                f"Stop that process before starting a new session on this instrument.")
+            return
+        if not log_file or not os.path.exists(log_file):
+            logging.warning(f"Session checkpoint points to a missing log {log_file}; discarding it")
+            clear_checkpoint()
+            return
+
+        # Only the tail is read; envelope mode gets a longer one.
+        rows = config.getint('monitoring', 'max_plot_points', fallback=100)
+        if self.plot_mode == 'envelope':
+            rows = max(rows, config.getint('restart', 'tail_rows', fallback=3600))
+        try:
+            samples = await asyncio.to_thread(read_tail_samples, log_file, rows)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read the tail of {log_file}: {e}")
+            samples = []
+
+        last_reading = samples[-1][0].strftime("%Y-%m-%d %H:%M:%S") if samples else "unknown"
+        if not messagebox.askyesno(
+                "Resume Session",
+                f"The session started {checkpoint.get('started', 'earlier')} did not stop cleanly.\n"
+                f"Log: {os.path.basename(log_file)}\nLast reading: {last_reading}\n\n"
+                f"Restore its channels and settings and keep logging to the same file?"):
+            logging.info(f"Warm restart declined for {log_file}")
+            clear_checkpoint()
+            return
+        self.restore_session(checkpoint, samples)
+
+    def restore_session(self, checkpoint, samples):
+        self.channels = sorted(checkpoint['channels'])
+        for channel, tc_type in checkpoint['thermocouple_types'].items():
+            self.thermocouple_vars.setdefault(channel, tk.StringVar()).set(tc_type)
+        for channel, var, _ in self.channel_vars:
+            var.set(channel in self.channels)
+        self.entry_set_temp.delete(0, tk.END)
+        self.entry_set_temp.insert(0, f"{checkpoint['set_temperature']:g}")
+        self.entry_sleep_interval.delete(0, tk.END)
+        self.entry_sleep_interval.insert(0, format_interval(checkpoint['sleep_interval']))
+        self.adaptive_var.set(checkpoint.get('adaptive_min_interval') is not None)
+        if checkpoint.get('adaptive_min_interval') is not None:
+            self.entry_min_interval.delete(0, tk.END)
+            self.entry_min_interval.insert(0, format_interval(checkpoint['adaptive_min_interval']))
+        if checkpoint.get('fan_channel') is not None:
+            self.fan_channel_var.set(checkpoint['fan_channel'])
+        self.update_temperature_labels()
+
+        self.reset_plot_data()
+        if samples:
+            self.consume_samples([Sample(0, timestamp.timestamp(), average, fan_on, temperatures)
+                                  for timestamp, average, fan_on, temperatures in samples])
+        self.resume_session = checkpoint
+        logging.info(f"Restored session {checkpoint['log_file']} with {len(samples)} rows of history")
+        self.update_status(f"Session restored; connect and press Start to continue logging to {os.path.basename(checkpoint['log_file'])}")
 
     async def update_video_frame_async(self):
         while self.running:
+            if not self.video_active:
+                await self.video_resumed.wait()
             self.update_video_frame()
             await asyncio.sleep(0.03)
 
@@ -203,6 +277,70 @@ class TemperatureMonitorApp(tk.Tk):
             except Exception as e:
                 logging.error(f"Error in process_queue_async: {e}")
 
+    async def process_acquisition_events_async(self):
+        while self.running:
+            try:
+                # Checked before draining, so the engine's last messages come first.
+                alive = self.acquisition.is_alive()
+                for message in self.acquisition.poll_events():
+                    await self.data_queue.put(message)
+                if not alive and not self.engine_stopped and self.running:
+                    self.engine_stopped = True
+                    await self.data_queue.put(self.engine_stopped_message())
+            except Exception as e:
+                logging.error(f"Error in process_acquisition_events_async: {e}")
+            await asyncio.sleep(0.1)
+
+    def engine_stopped_message(self):
+        exit_code = self.acquisition.exit_code()
+        logging.critical(f"Acquisition engine stopped unexpectedly (exit code {exit_code})")
+        return {
+            'status': "Acquisition engine stopped; no readings are being taken. Restart the application.",
+            'connection_status': "Disconnected",
+            'connection_address': "Data Logger: Not Connected",
+            'connected': False,
+            'monitoring_stopped': True,
+            'enable_connect_button': False,
+            'enable_start_button': False,
+            'enable_stop_button': False,
+            'error': f"The acquisition engine stopped unexpectedly (exit code {exit_code}). "
+                     f"Readings, logging and fan control have stopped; restart the application.",
+        }
+
+    async def read_samples_async(self):
+        while self.running:
+            try:
+                samples = self.acquisition.read_samples()
+                if samples and self.is_monitoring:
+                    self.consume_samples(samples)
+            except Exception as e:
+                logging.error(f"Error in read_samples_async: {e}")
+            await asyncio.sleep(self.gui_update_interval)
+
+    def consume_samples(self, samples):
+        self.samples_consumed += len(samples)
+        for sample in samples:
+            self.plot_data['time'].append(datetime.fromtimestamp(sample.timestamp))
+            if 'average' in self.plot_data:
+                self.plot_data['average'].append(sample.average if sample.average is not None else float('nan'))
+            for ch in self.channels:
+                if ch in self.plot_data:
+                    temp = sample.temperatures.get(ch)
+                    self.plot_data[ch].append(temp if temp is not None else float('nan'))
+            if self.plot_mode == 'envelope':
+                import matplotlib.dates as mdates
+                self.history.append(mdates.date2num(datetime.fromtimestamp(sample.timestamp)), {'average': sample.average, **sample.temperatures})
+
+        self.mark_plot_dirty()
+
+        # Only the newest reading is worth drawing in the labels.
+        latest = samples[-1]
+        self.update_gui({
+            'temperatures': latest.temperatures,
+            'average': latest.average,
+            'fan_status': "Fan Rotating" if latest.fan_on else "Fan Stopped"
+        })
+
     def create_menu(self):
         menubar = Menu(self)
         self.config(menu=menubar)
@@ -212,10 +350,93 @@ class TemperatureMonitorApp(tk.Tk):
         theme_menu.add_command(label="Light", command=lambda: self.set_theme("radiance"))
         theme_menu.add_command(label="Dark", command=lambda: self.set_theme("clam"))
 
+        diagnostics_menu = Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Diagnostics", menu=diagnostics_menu)
+        diagnostics_menu.add_checkbutton(label="CPU Profiling", variable=self.cpu_profiling_var, command=self.toggle_cpu_profiling)
+        diagnostics_menu.add_checkbutton(label="Memory Tracing", variable=self.memory_tracing_var, command=self.toggle_memory_tracing)
+        diagnostics_menu.add_command(label="Take Memory Snapshot", command=self.take_memory_snapshot)
+        diagnostics_menu.add_checkbutton(label="Resource Sampling", variable=self.resource_sampling_var, command=self.toggle_resource_sampling)
+
+        replay_menu = Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Replay", menu=replay_menu)
+        replay_menu.add_command(label="Open Log for Replay...", command=self.open_replay_log)
+        replay_menu.add_separator()
+        for label, speed in (("Real Time (1x)", 1.0), ("10x", 10.0), ("60x", 60.0), ("As Fast as Possible", 0.0)):
+            replay_menu.add_radiobutton(label=label, variable=self.replay_speed_var, value=speed)
+
         about_menu = Menu(menubar, tearoff=0)
         menubar.add_cascade(label="About", menu=about_menu)
         about_menu.add_command(label="About This Program", command=self.show_about)
 
+    def start_diagnostics(self):
+        self.cpu_profiling_var.set(True)
+        self.memory_tracing_var.set(True)
+        self.resource_sampling_var.set(True)
+        self.toggle_cpu_profiling()
+        self.toggle_memory_tracing()
+        self.toggle_resource_sampling()
+        self.profiler.start_periodic_snapshots(self.loop, self.diagnostics_snapshot_interval)
+
+    def toggle_cpu_profiling(self):
+        if self.cpu_profiling_var.get():
+            self.profiler.start_cpu_profile()
+            self.update_status("CPU profiling started")
+        else:
+            report_path = self.profiler.stop_cpu_profile()
+            self.update_status(f"CPU profile saved to {report_path}")
+
+    def toggle_memory_tracing(self):
+        if self.memory_tracing_var.get():
+            self.profiler.start_memory_tracing()
+            self.update_status("Memory tracing started")
+        else:
+            self.profiler.stop_memory_tracing()
+            self.update_status("Memory tracing stopped")
+
+    def take_memory_snapshot(self):
+        self.memory_tracing_var.set(True)
+        self.update_status("Taking memory snapshot...")
+        self.loop.create_task(self._take_memory_snapshot_async())
+
+    async def _take_memory_snapshot_async(self):
+        try:
+            report_path = await asyncio.to_thread(self.profiler.take_memory_snapshot)
+            await self.data_queue.put({'status': f"Memory snapshot saved to {report_path}"})
+        except Exception as e:
+            logging.error(f"Error taking memory snapshot: {e}")
+
+    def toggle_resource_sampling(self):
+        if self.resource_sampling_var.get():
+            self.profiler.start_sampling(self.loop, self.collect_diagnostics_sample, self.diagnostics_sample_interval)
+            self.update_status("Resource sampling started")
+        else:
+            self.profiler.stop_sampling()
+            self.update_status("Resource sampling stopped")
+
+    def collect_diagnostics_sample(self):
+        return {
+            'asyncio_tasks': len(asyncio.all_tasks(self.loop)),
+            'data_queue': self.data_queue.qsize(),
+            'frame_queue': self.frame_queue.qsize(),
+            'threads': threading.active_count(),
+            'plot_points': len(self.plot_data['time']),
+            'axes_artists': len(self.ax.get_children()) if self.fig else None,
+            'figure_artists': len(self.fig.get_children()) if self.fig else None,
+            'tk_images': len(self.tk.call('image', 'names')),
+            'history_bytes': self.history.memory_bytes(),
+            'history_bytes_per_channel_day': self.history.memory_per_channel_day(),
+            'cpu_percent': self.sample_cpu_percent(),
+            'plot_paused': self.plot_paused,
+            'video_active': self.video_active,
+            **logging_stats(),
+        }
+
+    def sample_cpu_percent(self):
+        wall, cpu = time.monotonic(), time.process_time()
+        previous_wall, previous_cpu = self.cpu_sample
+        self.cpu_sample = (wall, cpu)
+        return round(100 * (cpu - previous_cpu) / (wall - previous_wall), 1) if wall > previous_wall else None
+
     def show_about(self):
         about_text = f"""
         Base Plate Temperature Monitoring System ({ver})
@@ -251,10 +472,12 @@ class TemperatureMonitorApp(tk.Tk):
         # Create a Notebook (tabbed interface)
         notebook = ttk.Notebook(self)
         notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
 
         # Create frames for each tab
         monitor_tab = ttk.Frame(notebook)
         instructions_tab = ttk.Frame(notebook)
+        self.monitor_tab = monitor_tab
 
         notebook.add(monitor_tab, text="Monitoring")
         notebook.add(instructions_tab, text="Instructions")
@@ -273,6 +496,8 @@ class TemperatureMonitorApp(tk.Tk):
         status_frame.pack(fill=tk.X, padx=5, pady=5)
         ttk.Label(status_frame, text="Connection Status:").pack(side=tk.LEFT)
         ttk.Label(status_frame, textvariable=self.connection_status_var).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Label(status_frame, text="Channel Health:").pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Label(status_frame, textvariable=self.channel_health_var).pack(side=tk.LEFT, padx=(5, 0))
 
         input_frame = ttk.LabelFrame(top_frame, text="Input Parameters", padding="10 5 10 5")
         input_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -285,6 +510,12 @@ class TemperatureMonitorApp(tk.Tk):
         self.entry_sleep_interval = ttk.Entry(input_frame, width=20)
         self.entry_sleep_interval.grid(row=1, column=1, padx=5, pady=5)
 
+        # With adaptive sampling the sleep interval above is the slowest one.
+        ttk.Checkbutton(input_frame, text="Adaptive sampling, fastest interval:", variable=self.adaptive_var).grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
+        self.entry_min_interval = ttk.Entry(input_frame, width=20)
+        self.entry_min_interval.insert(0, config.get('adaptive', 'min_interval', fallback='1s'))
+        self.entry_min_interval.grid(row=2, column=1, padx=5, pady=5)
+
         button_frame = ttk.Frame(top_frame)
         button_frame.pack(fill=tk.X, padx=5, pady=5)
 
@@ -311,8 +542,7 @@ class TemperatureMonitorApp(tk.Tk):
 
         ttk.Label(fan_control_frame, text="Fan Channel:").pack(anchor=tk.W, pady=(0,2))
         
-        fan_channels = list(range(config.getint('channels', 'fan_channels_start', fallback=201),
-                                  config.getint('channels', 'fan_channels_end', fallback=215) + 1))
+        fan_channels = get_fan_channels()
         self.fan_channel_combo = ttk.Combobox(
             fan_control_frame,
             textvariable=self.fan_channel_var,
@@ -322,24 +552,39 @@ class TemperatureMonitorApp(tk.Tk):
         )
         self.fan_channel_combo.pack(anchor=tk.W)
         self.fan_channel_combo.bind("<<ComboboxSelected>>", self.on_fan_channel_selected)
-
-        self.temp_channels_frame = ttk.Frame(horizontal_frame)
+        # Zones in config.ini bring their own relays; the single fan channel is unused.
+        self.fan_zones = [section.split(':', 1)[1].strip() for section in fan_zone_sections()]
+        if self.fan_zones:
+            self.fan_channel_combo.config(state=tk.DISABLED)
+            ttk.Label(fan_control_frame, text=f"Zones: {', '.join(self.fan_zones)}").pack(anchor=tk.W, pady=(2,0))
+
+        # One tab per DAQ970A slot (channel 1xx, 2xx, 3xx) keeps 60 channels compact.
+        self.temp_channels_frame = ttk.Notebook(horizontal_frame)
         self.temp_channels_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        temp_channels_start = config.getint('channels', 'temp_channels_start', fallback=101)
-        temp_channels_end = config.getint('channels', 'temp_channels_end', fallback=120)
-        for i, channel in enumerate(range(temp_channels_start, temp_channels_end + 1)):
+        slot_frames = {}
+        slot_counts = {}
+        for channel in get_temperature_channels():
+            slot = channel // 100
+            if slot not in slot_frames:
+                slot_frames[slot] = ttk.Frame(self.temp_channels_frame, padding="2 2 2 2")
+                self.temp_channels_frame.add(slot_frames[slot], text=f"Slot {slot}")
+                slot_counts[slot] = 0
+            i = slot_counts[slot]
+            slot_counts[slot] += 1
+
             var = tk.BooleanVar(value=channel in self.channels)
-            cb = ttk.Checkbutton(self.temp_channels_frame, text=f"Ch {channel}", variable=var,
+            cb = ttk.Checkbutton(slot_frames[slot], text=f"Ch {channel}", variable=var,
                                  command=lambda ch=channel, v=var: self.update_channels(ch, v.get()))
             cb.grid(row=i // 5, column=i % 5 * 3, padx=2, pady=2, sticky=tk.W)
             
             tc_var = tk.StringVar(value="T")
-            tc_combo = ttk.Combobox(self.temp_channels_frame, textvariable=tc_var, values=["T", "K"], width=3)
+            tc_combo = ttk.Combobox(slot_frames[slot], textvariable=tc_var, values=["T", "K"], width=3)
             tc_combo.grid(row=i // 5, column=i % 5 * 3 + 1, padx=2, pady=2)
             
             self.channel_vars.append((channel, var, cb))
             self.thermocouple_vars[channel] = tc_var
+            self.thermocouple_combos.append(tc_combo)
 
         self.create_video_frame(horizontal_frame)
 
@@ -353,6 +598,8 @@ class TemperatureMonitorApp(tk.Tk):
         self.temp_labels_frame.pack(fill=tk.X, expand=True)
 
         self.temperature_labels = {}
+        self.temperature_cells = {}
+        self.label_texts = {}
         self.update_temperature_labels()
 
         avg_fan_frame = ttk.Frame(top_frame)
@@ -382,14 +629,37 @@ class TemperatureMonitorApp(tk.Tk):
         plot_frame = ttk.LabelFrame(parent_frame, text="Live Temperature Trend", padding="10 5 10 5")
         plot_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
+        if self.plot_mode == 'envelope':
+            window_frame = ttk.Frame(plot_frame)
+            window_frame.pack(fill=tk.X)
+            ttk.Label(window_frame, text="Window:").pack(side=tk.LEFT)
+            ttk.Combobox(window_frame, textvariable=self.plot_window_var, values=list(PLOT_WINDOWS),
+                         state="readonly", width=8).pack(side=tk.LEFT, padx=5)
+
+        self.plot_frame = plot_frame
+        self.plot_placeholder = ttk.Label(plot_frame, text="Loading plot...", anchor=tk.CENTER)
+        self.plot_placeholder.pack(fill=tk.BOTH, expand=True)
+
+    def attach_plot(self):
+        from matplotlib.animation import FuncAnimation
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        self.plot_placeholder.destroy()
         self.fig = Figure(figsize=(5, 4), dpi=100)
         self.ax = self.fig.add_subplot(111)
         
-        self.canvas = FigureCanvasTkAgg(self.fig, master=plot_frame)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.plot_frame)
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.canvas.get_tk_widget().bind('<Visibility>', self.on_plot_visibility)
+
+        self.ani = FuncAnimation(self.fig, self.animate_plot, interval=1000, blit=False, cache_frame_data=False)
+        self.mark_plot_dirty()
 
     def animate_plot(self, i):
+        import matplotlib.dates as mdates
+        self.plot_dirty = False
         is_dark = self.current_theme == 'clam'
         bg_color = '#333333' if is_dark else '#f0f0f0'
         text_color = 'white' if is_dark else 'black'
@@ -399,18 +669,21 @@ class TemperatureMonitorApp(tk.Tk):
         self.ax.set_facecolor(bg_color)
 
         self.ax.clear()
-        time_data = list(self.plot_data['time'])
-        
-        if 'average' in self.plot_data:
-            avg_data = list(self.plot_data['average'])
-            if len(time_data) == len(avg_data) and len(time_data) > 0:
-                self.ax.plot(time_data, avg_data, label='Average Temp', color='cyan' if is_dark else 'black', linewidth=2, marker='o', markersize=3)
+        if self.plot_mode == 'envelope':
+            time_data = self.plot_envelope(is_dark)
+        else:
+            time_data = list(self.plot_data['time'])
 
-        for channel in self.channels:
-            if channel in self.plot_data:
-                ch_data = list(self.plot_data[channel])
-                if len(time_data) == len(ch_data) and len(time_data) > 0:
-                    self.ax.plot(time_data, ch_data, label=f'Ch {channel}', marker='o', markersize=3)
+            if 'average' in self.plot_data:
+                avg_data = list(self.plot_data['average'])
+                if len(time_data) == len(avg_data) and len(time_data) > 0:
+                    self.ax.plot(time_data, avg_data, label='Average Temp', color='cyan' if is_dark else 'black', linewidth=2, marker='o', markersize=3)
+
+            for channel in self.channels:
+                if channel in self.plot_data:
+                    ch_data = list(self.plot_data[channel])
+                    if len(time_data) == len(ch_data) and len(time_data) > 0:
+                        self.ax.plot(time_data, ch_data, label=f'Ch {channel}', marker='o', markersize=3)
 
         handles, labels = self.ax.get_legend_handles_labels()
         if handles:
@@ -438,6 +711,86 @@ class TemperatureMonitorApp(tk.Tk):
         except Exception:
             pass
 
+        self.update_render_state()
+
+    def window_visible(self):
+        return not self.window_iconified and not self.window_obscured
+
+    def renderers_visible(self):
+        return self.window_visible() and self.monitor_tab_selected
+
+    def update_render_state(self, redraw=False):
+        visible = self.renderers_visible()
+        plot_active = visible and self.plot_dirty
+        if self.ani is not None:
+            if plot_active and redraw:
+                # Coming back into view: draw now rather than one interval later.
+                self.animate_plot(0)
+                self.canvas.draw_idle()
+            elif plot_active and self.plot_paused:
+                self.plot_paused = False
+                self.ani.resume()
+            elif not plot_active and not self.plot_paused:
+                self.plot_paused = True
+                self.ani.pause()
+
+        video_active = visible and self.is_monitoring
+        if video_active != self.video_active:
+            self.video_active = video_active
+            if video_active:
+                self.video_resumed.set()
+                if self.current_video:
+                    self.play_video(self.current_video)
+            else:
+                self.video_resumed.clear()
+                self.stop_video_playback()
+
+    def mark_plot_dirty(self):
+        self.plot_dirty = True
+        self.update_render_state()
+
+    def on_window_map(self, event):
+        if event.widget is self:
+            if self.startup.elapsed('window shown') is None:
+                self.startup.mark('window shown')
+            self.window_iconified = False
+            self.update_render_state(redraw=True)
+
+    def on_window_unmap(self, event):
+        if event.widget is self:
+            self.window_iconified = True
+            self.update_render_state()
+
+    def on_plot_visibility(self, event):
+        self.window_obscured = event.state == 'VisibilityFullyObscured'
+        self.update_render_state(redraw=True)
+
+    def on_tab_changed(self, event):
+        self.monitor_tab_selected = event.widget.select() == str(self.monitor_tab)
+        self.update_render_state(redraw=True)
+
+    def plot_envelope(self, is_dark):
+        # History times are matplotlib date numbers (days), so the window is
+        # converted from seconds and the existing DateFormatter still applies.
+        if not len(self.history):
+            return []
+        t1 = self.history.last_time()
+        window = PLOT_WINDOWS.get(self.plot_window_var.get())
+        t0 = t1 - window / 86400 if window else self.history.first_time()
+        columns = max(1, int(self.ax.get_window_extent().width))
+
+        series = [('average', 'Average Temp', {'color': 'cyan' if is_dark else 'black', 'linewidth': 2})]
+        series += [(channel, f'Ch {channel}', {'linewidth': 1}) for channel in self.channels]
+        plotted = []
+        for key, label, style in series:
+            x, y = self.history.envelope(key, t0, t1, columns)
+            if len(x):
+                self.ax.plot(x, y, label=label, **style)
+                plotted = x
+        if len(plotted):
+            self.ax.set_xlim(t0, t1 if t1 > t0 else t0 + 1 / 86400)
+        return plotted
+
     def create_instructions_tab(self, parent_frame):
         text_area = scrolledtext.ScrolledText(parent_frame, wrap=tk.WORD, relief=tk.FLAT, bg='#FFFFFF')
         text_area.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -482,7 +835,7 @@ class TemperatureMonitorApp(tk.Tk):
         text_area.insert(tk.END, " The frequency of measurements (e.g., 500ms, 10s, 2m). 5 minutes is the max settings.\n", "list")
         text_area.insert(tk.END, "  • ", "list")
         text_area.insert(tk.END, "Channel Selection:", "bold")
-        text_area.insert(tk.END, " Select temperature channels (101-120) and the fan control channel (201-215), channel 203 is the default fan control channel. Use the dropdown to select channels from the dropdown.\n\n", "list")
+        text_area.insert(tk.END, " Select temperature channels (one tab per instrument slot, 101-120, 201-220, 301-320 as configured) and the fan control channel (201-215), channel 203 is the default fan control channel. Use the dropdown to select channels from the dropdown.\n\n", "list")
         text_area.insert(tk.END, "Click ", "body")
         text_area.insert(tk.END, "Start Monitoring", "bold")
         text_area.insert(tk.END, " to begin. Live data will be displayed and logged. Click ", "body")
@@ -507,40 +860,80 @@ class TemperatureMonitorApp(tk.Tk):
         self.play_video(self.stopped_video)
 
     def play_video(self, video_path):
+        if not self.video_ready:
+            # attach_video picks this up once cv2 is loaded.
+            self.current_video = video_path
+            return
+        if not self.video_active:
+            # Paused: show the new video's first frame without decoding the rest.
+            if video_path != self.current_video:
+                self.current_video = video_path
+                self.show_video_still(video_path)
+            return
         if self.video_thread and self.video_thread.is_alive():
             if video_path == self.current_video:
                 return
-            self.stop_video_event.set()
-            self.video_thread.join()
+            self.stop_video_playback()
         
-        self.stop_video_event.clear()
+        # Each thread gets its own stop event, so one that is slow to stop
+        # can't be restarted by clearing it.
+        self.stop_video_event = threading.Event()
         self.current_video = video_path
-        self.video_thread = threading.Thread(target=self._video_thread, args=(video_path,))
+        self.video_thread = threading.Thread(target=self._video_thread, args=(video_path, self.stop_video_event), daemon=True)
         self.video_thread.start()
 
-    def stop_video_playback(self):
+    def attach_video(self):
+        self.video_ready = True
+        if self.current_video:
+            if self.video_active:
+                self.play_video(self.current_video)
+            else:
+                self.show_video_still(self.current_video)
+
+    def show_video_still(self, video_path):
+        import cv2
+        from PIL import ImageTk
+        cap = cv2.VideoCapture(video_path)
+        ret, frame = cap.read()
+        cap.release()
+        if ret:
+            imgtk = ImageTk.PhotoImage(image=prepare_video_frame(frame))
+            self.video_label.imgtk = imgtk
+            self.video_label.configure(image=imgtk)
+
+    def stop_video_playback(self, timeout=1.0):
+        # Called on the Tk thread; never wait on the decoder for long.
         self.stop_video_event.set()
         if self.video_thread:
-            self.video_thread.join()
+            self.video_thread.join(timeout)
+            if self.video_thread.is_alive():
+                logging.warning("Fan video thread did not stop in time; leaving it to finish")
         self.video_thread = None
 
-    def _video_thread(self, video_path):
+    def _video_thread(self, video_path, stop_event):
+        import cv2
         cap = cv2.VideoCapture(video_path)
-        while not self.stop_video_event.is_set():
+        while not stop_event.is_set():
             ret, frame = cap.read()
             if not ret:
                 cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
                 continue
-            frame = cv2.resize(frame, (440, 300))
-            cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
-            img = Image.fromarray(cv2image)
-            self.frame_queue.put(img)
+            image = prepare_video_frame(frame)
+            # The consumer stops taking frames while the video is paused, so
+            # a full queue must not hold up a stop.
+            while not stop_event.is_set():
+                try:
+                    self.frame_queue.put(image, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
             time.sleep(0.03)
         cap.release()
 
     def update_video_frame(self):
         try:
             img = self.frame_queue.get_nowait()
+            from PIL import ImageTk
             imgtk = ImageTk.PhotoImage(image=img)
             self.video_label.imgtk = imgtk
             self.video_label.configure(image=imgtk)
@@ -560,31 +953,48 @@ class TemperatureMonitorApp(tk.Tk):
                 self.update_connection_status(message['connection_status'])
             if 'connection_address' in message:
                 self.connection_address_label.config(text=message['connection_address'])
+            if 'channel_health' in message:
+                self.quarantined_channels = set(message['channel_health'])
+                quarantined = ", ".join(str(ch) for ch in sorted(self.quarantined_channels))
+                self.channel_health_var.set(f"Quarantined: {quarantined}" if quarantined else "OK")
             if 'temperatures' in message:
                 for channel, temp in message['temperatures'].items():
-                    if channel in self.temperature_labels:
+                    label = self.temperature_labels.get(channel)
+                    if label is not None:
                         if temp is None:
-                            self.temperature_labels[channel].config(text="N/A")
+                            self.set_label_text(label, "Quarantined" if channel in self.quarantined_channels else "N/A")
                         else:
-                            self.temperature_labels[channel].config(text=f"{temp:.1f}°C")
+                            self.set_label_text(label, f"{temp:.1f}°C")
             if 'average' in message:
                 if message['average'] is None:
-                    self.average_temp_label.config(text="Average Temperature: N/A")
+                    self.set_label_text(self.average_temp_label, "Average Temperature: N/A")
                 else:
-                    self.average_temp_label.config(text=f"Average Temperature: {message['average']:.1f}°C")
+                    self.set_label_text(self.average_temp_label, f"Average Temperature: {message['average']:.1f}°C")
             if 'fan_status' in message:
                 fan_status = message['fan_status']
-                self.fan_status_label.config(text=f"Fan Status: {fan_status}")
-                if fan_status == "Fan Rotating":
-                    self.fan_status_label.config(fg="green")
-                    self.fan_indicator.config(bg="green")
-                    if self.current_video != self.rotating_video:
-                        self.play_video(self.rotating_video)
-                else:
-                    self.fan_status_label.config(fg="red")
-                    self.fan_indicator.config(bg="red")
-                    if self.current_video != self.stopped_video:
-                        self.play_video(self.stopped_video)
+                # Colours and video only need touching when the status flips.
+                if self.set_label_text(self.fan_status_label, f"Fan Status: {fan_status}"):
+                    if fan_status == "Fan Rotating":
+                        self.fan_status_label.config(foreground="green")
+                        self.fan_indicator.config(bg="green")
+                        if self.current_video != self.rotating_video:
+                            self.play_video(self.rotating_video)
+                    else:
+                        self.fan_status_label.config(foreground="red")
+                        self.fan_indicator.config(bg="red")
+                        if self.current_video != self.stopped_video:
+                            self.play_video(self.stopped_video)
+            if 'connected' in message:
+                self.instrument_connected = message['connected']
+            if 'monitoring_stopped' in message and self.is_monitoring:
+                if 'replay_stats' in message:
+                    # A fast replay can finish between two sample reads; pick up the tail first.
+                    samples = self.acquisition.read_samples()
+                    if samples:
+                        self.consume_samples(samples)
+                    overruns = self.acquisition.ring.overruns - self.replay_overruns_start
+                    self.update_status(f"{message['status']}; GUI received {self.samples_consumed} samples, {overruns} lost to ring overruns")
+                self.reset_monitoring_controls()
             if 'error' in message:
                 messagebox.showerror("Error", message['error'])
             if 'enable_connect_button' in message:
@@ -596,6 +1006,13 @@ class TemperatureMonitorApp(tk.Tk):
 
         self.update_idletasks()
 
+    def set_label_text(self, label, text):
+        if self.label_texts.get(label) == text:
+            return False
+        self.label_texts[label] = text
+        label.config(text=text)
+        return True
+
     def update_connection_status(self, status):
         self.connection_status_var.set(status)
         self.update_idletasks()
@@ -604,137 +1021,10 @@ class TemperatureMonitorApp(tk.Tk):
         self.btn_connect.config(state=tk.DISABLED)
         self.update_status("Connecting to Data Logger...")
         self.update_connection_status("Connecting...")
-        self.loop.create_task(self._connect_thread())
-
-    async def _connect_thread(self):
-        try:
-            resource_name = await self.auto_negotiate_instrument()
-            if not resource_name:
-                raise ConnectionError("No compatible instrument found")
-            
-            self.visa_comm = VisaCommunication(resource_name)
-            await self.visa_comm.connect()
-            
-            await self.data_queue.put({
-                'status': "Connected",
-                'connection_status': "Connected",
-                'connection_address': f"Connected to: {resource_name}",
-                'enable_start_button': True
-            })
-            logging.info(f"Connected to instrument at {resource_name}")
-            
-        except Exception as e:
-            error_message = f"Connection failed: {str(e)}"
-            await self.data_queue.put({
-                'status': "Connection Failed",
-                'connection_status': "Disconnected",
-                'connection_address': "Data Logger: Not Connected",
-                'error': error_message,
-                'enable_start_button': False
-            })
-            logging.error(error_message)
-        
-        await self.data_queue.put({'enable_connect_button': True})
-
-    async def auto_negotiate_instrument(self):
-        try:
-            gpib_file = config.get('paths', 'gpib_address_file', fallback='gpib_address.txt')
-            with open(gpib_file, 'r') as f:
-                selected_resource = f.read().strip()
-        except FileNotFoundError:
-            selected_resource = None
-
-        rm = pyvisa.ResourceManager()
-        resources = rm.list_resources()
-
-        if selected_resource and selected_resource in resources:
-            if await self.try_connect(rm, selected_resource):
-                return selected_resource
-
-        for resource in resources:
-            if await self.try_connect(rm, resource):
-                gpib_file = config.get('paths', 'gpib_address_file', fallback='gpib_address.txt')
-                with open(gpib_file, 'w') as f:
-                    f.write(resource)
-                return resource
-
-        return None
-
-    async def try_connect(self, resource_manager, resource):
-        try:
-            inst = await self.loop.run_in_executor(None, resource_manager.open_resource, resource)
-            identification = await self.loop.run_in_executor(None, inst.query, "*IDN?")
-            if "Keysight Technologies,DAQ970A" in identification or "HEWLETT-PACKARD,34970A" in identification:
-                logging.info(f"Connected to instrument: {resource}")
-                await self.loop.run_in_executor(None, inst.close)
-                return True
-            await self.loop.run_in_executor(None, inst.close)
-        except pyvisa.Error as e:
-            logging.error(f"Error connecting to {resource}: {e}")
-        return False
-
-    async def handle_disconnection(self):
-        if self.visa_comm.state == ConnectionState.RECONNECTING:
-            return
-
-        self.visa_comm.state = ConnectionState.RECONNECTING
-        await self.data_queue.put({
-            'status': "Connection lost. Attempting to reconnect...",
-            'connection_status': "Reconnecting"
-        })
-        
-        reconnected = await self._reconnect_coroutine()
-
-        if reconnected:
-            await self.data_queue.put({
-                'status': "Reconnected successfully",
-                'connection_status': "Connected"
-            })
-            self.error_count = 0
-            if self.is_monitoring:
-                self.monitoring_task = self.loop.create_task(self.monitor_temperature())
-        else:
-            await self.data_queue.put({
-                'status': "Failed to reconnect. Please check the connection and restart the application.",
-                'connection_status': "Disconnected"
-            })
-            self.stop_monitoring()
-
-        self.visa_comm.state = ConnectionState.CONNECTED if reconnected else ConnectionState.DISCONNECTED
-
-
-    async def _reconnect_coroutine(self):
-        for attempt in range(self.max_reconnection_attempts):
-            try:
-                await self.visa_comm.disconnect()
-                await self.visa_comm.connect()
-                logging.info("Successfully reconnected to the instrument")
-                await self.data_queue.put({
-                    'status': "Reconnected",
-                    'status_bar': "Reconnected to the instrument",
-                    'gpib_address': f"Connected to: {self.visa_comm.resource_name}"
-                })
-                return True
-            except Exception as e:
-                logging.error(f"Reconnection attempt {attempt + 1} failed: {str(e)}")
-                await self.data_queue.put({
-                    'status': f"Reconnection failed. Retrying... ({attempt + 1}/{self.max_reconnection_attempts})",
-                    'status_bar': f"Reconnection failed. Retrying... ({attempt + 1}/{self.max_reconnection_attempts})"
-                })
-            
-            await asyncio.sleep(5)
-
-        logging.critical("Failed to reconnect after multiple attempts")
-        await self.data_queue.put({
-            'status': "Reconnection failed. Please check the instrument and restart the application.",
-            'status_bar': "Reconnection failed. Please restart the application.",
-            'enable_start_button': False,
-            'enable_stop_button': False
-        })
-        return False
+        self.acquisition.send('connect')
 
     def start_monitoring(self):
-        if not self.visa_comm or self.visa_comm.state != ConnectionState.CONNECTED:
+        if not self.instrument_connected:
             messagebox.showerror("Connection Error", "Please connect to the Data Logger first.")
             return
 
@@ -748,6 +1038,11 @@ class TemperatureMonitorApp(tk.Tk):
                 raise ValueError("Temperature must be between 0-200°C")
             
             self.sleep_interval = self.get_sleep_interval_in_seconds(self.entry_sleep_interval.get())
+            min_interval = None
+            if self.adaptive_var.get():
+                min_interval = self.get_sleep_interval_in_seconds(self.entry_min_interval.get())
+                if min_interval > self.sleep_interval:
+                    raise ValueError("The fastest adaptive interval must not be longer than the sleep interval.")
         except ValueError as e:
             messagebox.showerror("Invalid Input", str(e))
             logging.error(f"Invalid input: {e}")
@@ -758,159 +1053,99 @@ class TemperatureMonitorApp(tk.Tk):
         self.disable_channel_selection()
         self.update_status("Reading Measurements...")
 
+        # A restored session keeps its history if the channels are unchanged;
+        # the acquisition process checks the log's columns before appending.
+        resume_log = None
+        if self.resume_session and self.resume_session['channels'] == self.channels:
+            resume_log = self.resume_session['log_file']
+        else:
+            self.reset_plot_data()
+        self.resume_session = None
+
+        self.is_monitoring = True
+        self.mark_plot_dirty()
+        self.acquisition.send('start', {
+            'channels': list(self.channels),
+            'thermocouple_types': {ch: self.thermocouple_vars[ch].get() for ch in self.channels},
+            'set_temperature': self.set_temperature,
+            'sleep_interval': self.sleep_interval,
+            'adaptive_min_interval': min_interval,
+            'fan_channel': self.fan_channel_var.get(),
+            'resume_log': resume_log
+        })
+        logging.info("Monitoring started")
+        print("Monitoring started")
+
+    def open_replay_log(self):
+        if self.is_monitoring:
+            messagebox.showerror("Replay", "Stop monitoring before starting a replay.")
+            return
+        try:
+            set_temperature = float(self.entry_set_temp.get().strip())
+            if not 0 <= set_temperature <= 200:
+                raise ValueError("Temperature must be between 0-200°C")
+        except ValueError as e:
+            messagebox.showerror("Invalid Input", f"Replay needs a valid set temperature: {e}")
+            return
+
+        path = filedialog.askopenfilename(title="Open Log for Replay", filetypes=[("Temperature logs", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            _, _, thermocouple_types = read_log_header(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Replay", f"Could not read {path}: {e}")
+            return
+
+        self.set_temperature = set_temperature
+        self.channels = sorted(thermocouple_types)
+        for channel, tc_type in thermocouple_types.items():
+            self.thermocouple_vars.setdefault(channel, tk.StringVar()).set(tc_type)
+        for channel, var, _ in self.channel_vars:
+            var.set(channel in self.channels)
+        self.update_temperature_labels()
+
+        self.btn_start_monitoring.config(state=tk.DISABLED)
+        self.btn_stop_monitoring.config(state=tk.NORMAL)
+        self.disable_channel_selection()
+
+        self.reset_plot_data()
+        self.samples_consumed = 0
+        self.replay_overruns_start = self.acquisition.ring.overruns
+
+        self.is_monitoring = True
+        self.mark_plot_dirty()
+        self.acquisition.send('replay', {
+            'path': path,
+            'speed': self.replay_speed_var.get(),
+            'set_temperature': set_temperature
+        })
+        logging.info(f"Replay started: {path}")
+
+    def reset_plot_data(self):
         max_points = config.getint('monitoring', 'max_plot_points', fallback=100)
         self.plot_data = {'time': deque(maxlen=max_points)}
         for ch in self.channels:
             self.plot_data[ch] = deque(maxlen=max_points)
         self.plot_data['average'] = deque(maxlen=max_points)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        csv_filename = f'temperature_log_{timestamp}.csv'
-        self.csv_file = open(csv_filename, 'w', newline='')
-        self.csv_writer = csv.writer(self.csv_file)
-        header = ['Timestamp', 'Average Temperature'] + [f'Temp (Ch {ch} {self.thermocouple_vars[ch].get()})' for ch in self.channels] + ['Fan Status']
-        self.csv_writer.writerow(header)
-
-        self.is_monitoring = True
-        self.monitoring_task = self.loop.create_task(self.monitor_temperature())
-        self.logging_task = self.loop.create_task(self.log_data())
-        logging.info("Monitoring started")
-        print("Monitoring started")
+        self.history.clear()
 
     def stop_monitoring(self):
-        self.is_monitoring = False
-        if self.monitoring_task and not self.monitoring_task.done():
-            self.monitoring_task.cancel()
-        if self.logging_task and not self.logging_task.done():
-            self.logging_task.cancel()
-        
-        self.btn_connect.config(state=tk.NORMAL)
-        self.btn_start_monitoring.config(state=tk.NORMAL)
-        self.btn_stop_monitoring.config(state=tk.DISABLED)
-        self.enable_channel_selection()
+        self.acquisition.send('stop')
+        self.reset_monitoring_controls()
         self.update_status("Monitoring stopped")
 
-        if self.csv_file:
-            self.csv_file.close()
-            self.csv_file = None
-            self.csv_writer = None
-
         logging.info("Monitoring stopped")
         print("Monitoring stopped")
         messagebox.showinfo("Operation Stopped", "Monitoring has been stopped")
 
-    async def monitor_temperature(self):
-        while self.is_monitoring:
-            start_time = time.monotonic()
-            try:
-                temperature_values = {}
-                for channel in self.channels:
-                    temp = await self.read_temperature(channel)
-                    temperature_values[channel] = temp
-
-                average_temperature = self.get_average_temperature(list(temperature_values.values()))
-
-                timestamp = datetime.now()
-                
-                self.plot_data['time'].append(timestamp)
-                if average_temperature is not None:
-                    self.plot_data['average'].append(average_temperature)
-                else:
-                    self.plot_data['average'].append(float('nan'))
-
-                for ch in self.channels:
-                    temp = temperature_values.get(ch)
-                    if temp is not None:
-                        self.plot_data[ch].append(temp)
-                    else:
-                        self.plot_data[ch].append(float('nan'))
-
-                fan_status = "Fan Rotating" if average_temperature is not None and average_temperature > self.set_temperature else "Fan Stopped"
-                
-                await self.data_queue.put({
-                    'temperatures': temperature_values,
-                    'average': average_temperature,
-                    'fan_status': fan_status,
-                    'status_bar': f"Monitoring: Avg Temp {average_temperature:.1f}°C - {fan_status}" if average_temperature is not None else f"Monitoring: Avg Temp N/A - {fan_status}"
-                })
-                
-                video_path = self.rotating_video if fan_status == "Fan Rotating" else self.stopped_video
-                self.play_video(video_path)
-
-                if self.csv_writer:
-                    row = [timestamp.strftime("%Y-%m-%d %H:%M:%S"), f"{average_temperature:.1f}" if average_temperature is not None else "N/A"]
-                    row.extend([f"{temperature_values.get(ch, 'N/A'):.1f}" if temperature_values.get(ch) is not None else 'N/A' for ch in self.channels])
-                    row.append(fan_status)
-                    self.csv_writer.writerow(row)
-                    
-                    current_time = time.time()
-                    if current_time - self.last_save_time >= self.save_interval:
-                        self.csv_file.flush()
-                        os.fsync(self.csv_file.fileno())
-                        self.last_save_time = current_time
-
-                if average_temperature is not None:
-                    fan_command = "CLOSE" if average_temperature > self.set_temperature else "OPEN"
-                    await self.visa_comm.write(f"ROUTE:{fan_command} (@{self.fan_channel_var.get()})")
-
-            except Exception as e:
-                logging.error(f"Error in monitoring loop: {e}")
-                await self.data_queue.put({
-                    'status': f"Error: {e}",
-                    'status_bar': f"Error occurred. Attempting to recover..."
-                })
-                await self.handle_disconnection()
-
-            work_duration = time.monotonic() - start_time
-            sleep_duration = self.sleep_interval - work_duration
-            if sleep_duration > 0:
-                await asyncio.sleep(sleep_duration)
-
-    async def read_temperature(self, channel):
-        try:
-            tc_type = self.thermocouple_vars[channel].get()
-            command = f"MEAS:TEMP? TC,{tc_type},(@{channel})"
-            measurement = await self.visa_comm.query(command)
-            temperature = float(measurement)
-            if not (-200 <= temperature <= 1000):
-                raise ValueError(f"Temperature out of range: {temperature}")
-            return temperature
-        except Exception as e:
-            logging.error(f"Error reading temperature from channel {channel}: {e}")
-            return None
-
-    async def log_data(self):
-        last_log_time = time.time()
-        while self.is_monitoring:
-            current_time = time.time()
-            if current_time - last_log_time >= self.sleep_interval:
-                try:
-                    temperature_values = await asyncio.gather(*[self.read_temperature(channel) for channel in self.channels])
-                    temperatures = dict(zip(self.channels, temperature_values))
-                    average_temperature = self.get_average_temperature(list(temperatures.values()))
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                    if self.csv_writer:
-                        fan_status = "Fan Rotating" if average_temperature is not None and average_temperature > self.set_temperature else "Fan Stopped"
-                        row = [timestamp, f"{average_temperature:.1f}" if average_temperature is not None else "N/A"]
-                        row.extend([f"{temperatures.get(ch, 'N/A'):.1f}" if temperatures.get(ch) is not None else 'N/A' for ch in self.channels])
-                        row.append(fan_status)
-                        self.csv_writer.writerow(row)
-                        
-                        if current_time - self.last_save_time >= self.save_interval:
-                            self.csv_file.flush()
-                            os.fsync(self.csv_file.fileno())
-                            self.last_save_time = current_time
-
-                    last_log_time = current_time
-                except Exception as e:
-                    logging.error(f"Error in logging loop: {e}")
-
-            await asyncio.sleep(0.1)
-
-    def get_average_temperature(self, temperatures):
-        valid_temperatures = [temp for temp in temperatures if temp is not None and isinstance(temp, (int, float)) and not math.isnan(temp)]
-        return sum(valid_temperatures) / len(valid_temperatures) if valid_temperatures else None
+    def reset_monitoring_controls(self):
+        self.is_monitoring = False
+        self.update_render_state()
+        self.btn_connect.config(state=tk.NORMAL)
+        self.btn_start_monitoring.config(state=tk.NORMAL if self.instrument_connected else tk.DISABLED)
+        self.btn_stop_monitoring.config(state=tk.DISABLED)
+        self.enable_channel_selection()
 
     def get_sleep_interval_in_seconds(self, sleep_interval_str):
         sleep_interval_str = sleep_interval_str.lower().strip()
@@ -954,15 +1189,19 @@ class TemperatureMonitorApp(tk.Tk):
                 del self.plot_data[channel]
         self.channels.sort()
         self.update_temperature_labels()
+        self.mark_plot_dirty()
         tc_types = {ch: self.thermocouple_vars[ch].get() for ch in self.channels}
         self.update_status(f"Temperature channels updated: {', '.join([f'{ch}({tc_types[ch]})' for ch in self.channels])}")
 
     def update_fan_channel(self, channel):
         self.fan_channel_var.set(channel)
+        self.acquisition.send('set_fan_channel', channel)
         self.update_status(f"Fan control channel updated to: {channel}")
 
     def on_fan_channel_selected(self, event):
         selected_channel = self.fan_channel_var.get()
+        # A running session switches relays on its next scan.
+        self.acquisition.send('set_fan_channel', selected_channel)
         self.update_status(f"Fan control channel updated to: {selected_channel}")
 
     def reset_to_default_channels(self):
@@ -984,38 +1223,46 @@ class TemperatureMonitorApp(tk.Tk):
         for ch in self.channels:
             self.plot_data[ch] = deque(maxlen=max_points)
         self.plot_data['average'] = deque(maxlen=max_points)
+        self.history.clear()
+        self.mark_plot_dirty()
 
     def update_temperature_labels(self):
-        for widget in self.temp_labels_frame.winfo_children():
-            widget.destroy()
-        self.temperature_labels.clear()
+        # Cells are kept per channel and only re-gridded, so toggling one
+        # channel doesn't rebuild the whole readout.
+        for channel in list(self.temperature_cells):
+            if channel not in self.channels:
+                self.temperature_cells.pop(channel).destroy()
+                self.label_texts.pop(self.temperature_labels.pop(channel), None)
 
         for i, channel in enumerate(self.channels):
-            label_frame = ttk.Frame(self.temp_labels_frame)
-            label_frame.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=5, pady=5)
-
-            tc_type = self.thermocouple_vars[channel].get()
-            label_text = f"Temp{i+1} Ch ({channel:03}) {tc_type}"
-            ttk.Label(label_frame, text=label_text).pack()
-            value_label = ttk.Label(label_frame, text="N/A", font=("Helvetica", 14, "bold"))
-            value_label.pack()
-            self.temperature_labels[channel] = value_label
+            if channel not in self.temperature_cells:
+                cell = ttk.Frame(self.temp_labels_frame)
+                ttk.Label(cell, font=("Helvetica", 9)).pack()
+                value_label = ttk.Label(cell, text="N/A", font=("Helvetica", 12, "bold"))
+                value_label.pack()
+                self.temperature_cells[channel] = cell
+                self.temperature_labels[channel] = value_label
+            cell = self.temperature_cells[channel]
+            cell.winfo_children()[0].config(text=f"Ch {channel} {self.thermocouple_vars[channel].get()}")
+            cell.grid(row=i // READOUT_COLUMNS, column=i % READOUT_COLUMNS, padx=4, pady=2, sticky=tk.EW)
+
+        for column in range(READOUT_COLUMNS):
+            self.temp_labels_frame.columnconfigure(column, weight=1, uniform='readout')
 
     def disable_channel_selection(self):
         for _, _, cb in self.channel_vars:
             cb.config(state=tk.DISABLED)
-        for widget in self.temp_channels_frame.winfo_children():
-            if isinstance(widget, ttk.Combobox):
-                widget.config(state='disabled')
+        for tc_combo in self.thermocouple_combos:
+            tc_combo.config(state='disabled')
         self.fan_channel_combo.config(state=tk.DISABLED)
 
     def enable_channel_selection(self):
         for _, _, cb in self.channel_vars:
             cb.config(state=tk.NORMAL)
-        for widget in self.temp_channels_frame.winfo_children():
-            if isinstance(widget, ttk.Combobox):
-                widget.config(state='readonly')
-        self.fan_channel_combo.config(state='readonly')
+        for tc_combo in self.thermocouple_combos:
+            tc_combo.config(state='readonly')
+        if not self.fan_zones:
+            self.fan_channel_combo.config(state='readonly')
 
     def set_theme(self, theme_name, initial_load=False):
         self.style.set_theme(theme_name)
@@ -1029,6 +1276,7 @@ class TemperatureMonitorApp(tk.Tk):
         self.status_bar.configure(background=bg_color, foreground=fg_color)
         self.average_temp_label.configure(background=bg_color, foreground=fg_color)
         self.connection_address_label.configure(background=bg_color, foreground=fg_color)
+        self.mark_plot_dirty()
 
         if not initial_load:
             # Update config file
@@ -1039,10 +1287,11 @@ class TemperatureMonitorApp(tk.Tk):
                 config.write(configfile)
 
     def handle_exception(self, exc_type, exc_value, exc_traceback):
+        # Acquisition runs independently of the GUI, so a GUI error no longer
+        # stops the test; it is reported and the session keeps logging.
         error_msg = ''.join(traceback.format_exception(exc_type, exc_value, exc_traceback))
         logging.error("Uncaught exception: %s", error_msg)
-        messagebox.showerror("Error", f"An unexpected error occurred:\n{str(exc_value)}\n\nPlease check the log file for details.")
-        self.stop_monitoring()
+        messagebox.showerror("Error", f"An unexpected error occurred:\n{str(exc_value)}\n\nData acquisition continues. Please check the log file for details.")
 
     def on_exit(self):
         if messagebox.askyesno("Confirm Exit", "Are you sure you want to exit the application?"):
@@ -1051,23 +1300,12 @@ class TemperatureMonitorApp(tk.Tk):
 
     async def shutdown(self):
         logging.info("Application closing...")
+        self.profiler.shutdown()
         
         self.is_monitoring = False
-        if self.monitoring_task and not self.monitoring_task.done():
-            self.monitoring_task.cancel()
-            try:
-                await self.monitoring_task
-            except asyncio.CancelledError:
-                pass
-
+        await self.acquisition.stop()
 
         self.stop_video_playback()
-        
-        if self.visa_comm:
-            try:
-                await self.visa_comm.disconnect()
-            except Exception as e:
-                logging.error(f"Error closing instrument connection: {e}")
 
         tasks = [t for t in asyncio.all_tasks(self.loop) if t is not asyncio.current_task()]
         for task in tasks:
@@ -1077,14 +1315,22 @@ class TemperatureMonitorApp(tk.Tk):
         self.destroy()
         self.loop.stop()
 
-def run_app():
+def run_app(argv=None):
+    parser = argparse.ArgumentParser(description="Base Plate Temperature Monitoring System")
+    parser.add_argument("--startup-timing", action="store_true", help="report import and startup phase timings")
+    args = parser.parse_args(argv)
+
+    startup = StartupTimer(STARTUP_STARTED)
+    startup.mark('modules imported')
+    configure_logging()
     loop = asyncio.get_event_loop_policy().get_event_loop()
-    app = TemperatureMonitorApp(loop)
+    app = TemperatureMonitorApp(loop, startup, args.startup_timing)
     
-    async def run_tk(app, interval=1/120):
+    async def run_tk(app, interval=1/120, hidden_interval=0.1):
+        # Tk events are pumped less often while the window can't be seen.
         while app.running:
             app.update()
-            await asyncio.sleep(interval)
+            await asyncio.sleep(interval if app.window_visible() else hidden_interval)
 
     loop.create_task(run_tk(app))
     
@@ -0,0 +1,1222 @@
+"""Acquisition, data logging and fan control, decoupled from the GUI.
+
+The AcquisitionEngine owns the instrument connection, the monitoring loop, the
+CSV log and the fan relay. By default it runs in its own process (see
+acquisition_main) so that anything that blocks the Tk thread - a modal dialog,
+a slow redraw, even a GUI crash - cannot pause readings, logging or fan
+control. Samples are published into a shared-memory ring (SampleRing) that the
+GUI reads at its own pace; status messages use the same dictionaries that
+update_gui already understands and travel over a queue.
+"""
+import asyncio
+import csv
+import json
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import struct
+import time
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+from multiprocessing import shared_memory
+
+from instrument import ConnectionState, auto_negotiate_instrument, create_communication
+from replay import ReplaySource, read_log_header
+from settings import (config, configure_logging, fan_zone_sections, get_fan_channels, get_temperature_channels,
+                      log_directory, parse_channel_list, stop_logging)
+from storage import SQLiteSink
+
+MAX_CHANNELS = 64
+
+# Header: write_count, capacity, session, channel_count, channels[MAX_CHANNELS]
+HEADER = struct.Struct(f'<qqqq{MAX_CHANNELS}q')
+WRITE_COUNT = struct.Struct('<q')
+# Record: session, timestamp (epoch seconds), average, fan_on, values[MAX_CHANNELS]
+RECORD = struct.Struct(f'<dddd{MAX_CHANNELS}d')
+
+Sample = namedtuple('Sample', 'session timestamp average fan_on temperatures')
+# value in °C or None; timestamp in epoch seconds (instrument or host clock);
+# read_at on the host monotonic clock, for latency accounting.
+Reading = namedtuple('Reading', 'value timestamp read_at')
+# One fan relay driven by the average of a group of channels.
+FanZone = namedtuple('FanZone', 'name channels set_temperature relay')
+
+
+def format_csv_row(timestamp, average_temperature, temperature_values, channels, fan_status):
+    row = [timestamp.strftime("%Y-%m-%d %H:%M:%S"), f"{average_temperature:.1f}" if average_temperature is not None else "N/A"]
+    row.extend([f"{temperature_values[ch]:.1f}" if temperature_values.get(ch) is not None else 'N/A' for ch in channels])
+    row.append(fan_status)
+    return row
+
+
+def parse_reading(measurement):
+    """Split a MEAS:TEMP? response into (temperature, epoch seconds or None).
+
+    With FORM:READ:TIME ON and TYPE ABS the reading is followed by the
+    instrument's year, month, day, hour, minute and seconds.
+    """
+    fields = measurement.split(',')
+    temperature = float(fields[0])
+    if len(fields) < 7:
+        return temperature, None
+    year, month, day, hour, minute = (int(float(field)) for field in fields[1:6])
+    seconds = float(fields[6])
+    stamp = datetime(year, month, day, hour, minute) + timedelta(seconds=seconds)
+    return temperature, stamp.timestamp()
+
+
+def format_channel_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] if timestamp is not None else 'N/A'
+
+
+def checkpoint_path():
+    return config.get('restart', 'checkpoint', fallback=os.path.join(log_directory, 'session_checkpoint.json'))
+
+
+def write_checkpoint(state):
+    # Written next to the target and renamed, so a crash never leaves half a file.
+    path = checkpoint_path()
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_checkpoint():
+    """Return the checkpoint of a session that did not stop cleanly, or None."""
+    try:
+        with open(checkpoint_path()) as f:
+            state = json.load(f)
+        state['thermocouple_types'] = {int(ch): tc for ch, tc in state['thermocouple_types'].items()}
+        return state
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, AttributeError) as e:
+        logging.warning(f"Ignoring unreadable session checkpoint {checkpoint_path()}: {e}")
+        return None
+
+
+def clear_checkpoint():
+    try:
+        os.remove(checkpoint_path())
+    except FileNotFoundError:
+        pass
+
+
+def trim_partial_row(path, block_size=65536):
+    # A row cut short by a crash would otherwise be joined to the next one.
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            newline = f.read(size).rfind(b'\n')
+            if newline >= 0:
+                if position + newline + 1 < end:
+                    f.truncate(position + newline + 1)
+                    logging.warning(f"Removed a partial last row from {path}")
+                return
+
+
+def process_alive(pid):
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        try:
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        finally:
+            kernel32.CloseHandle(handle)
+        return exit_code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def engine_lock_path():
+    return config.get('acquisition', 'lock_file', fallback=os.path.join(log_directory, 'acquisition.lock'))
+
+
+class EngineLock:
+    """Keeps a second acquisition engine off the instrument and the relays.
+
+    The lock file holds the owner's pid. It is locked by the OS, so the lock
+    goes away with the process however it ends and a stale file never blocks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    @staticmethod
+    def _lock(f):
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                # Windows locks are mandatory; lock a byte past the pid so it stays readable.
+                f.seek(64)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    def acquire(self):
+        f = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT), 'r+')
+        if not self._lock(f):
+            f.seek(0)
+            owner = f.read(32).strip()
+            f.close()
+            raise RuntimeError(f"another acquisition engine (pid {owner or 'unknown'}) is already running")
+        f.seek(0)
+        f.write(f"{os.getpid():<32}")
+        f.flush()
+        self.file = f
+
+    def release(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def holder(self):
+        """Pid of the engine holding the lock, or None when it is free."""
+        with os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT), 'r+') as f:
+            if self._lock(f):
+                return None
+            f.seek(0)
+            owner = f.read(32).strip()
+        return int(owner) if owner.isdigit() else 0
+
+
+def engine_running(pid):
+    # A pid alone is not enough: after a reboot it may belong to any other
+    # process. The engine that wrote the checkpoint is still running only if
+    # it still holds the engine lock.
+    try:
+        return EngineLock(engine_lock_path()).holder() == pid
+    except OSError:
+        return process_alive(pid)
+
+
+def get_average_temperature(temperatures):
+    valid_temperatures = [temp for temp in temperatures if temp is not None and isinstance(temp, (int, float)) and not math.isnan(temp)]
+    return sum(valid_temperatures) / len(valid_temperatures) if valid_temperatures else None
+
+
+class SampleRing:
+    """Single-writer ring of samples in shared memory.
+
+    The writer fills a record and only then advances write_count, so a reader
+    never sees a half-written slot unless it falls a whole ring behind; those
+    records are dropped and counted in ``overruns``.
+    """
+
+    def __init__(self, name=None, capacity=4096):
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER.size + capacity * RECORD.size)
+            HEADER.pack_into(self.shm.buf, 0, 0, capacity, 0, 0, *([0] * MAX_CHANNELS))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.capacity = HEADER.unpack_from(self.shm.buf, 0)[1]
+        self.writer_session = 0
+        self.read_count = 0
+        self.session = 0
+        self.channels = []
+        self.overruns = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _offset(self, index):
+        return HEADER.size + (index % self.capacity) * RECORD.size
+
+    def write_count(self):
+        return WRITE_COUNT.unpack_from(self.shm.buf, 0)[0]
+
+    def begin_session(self, channels):
+        if len(channels) > MAX_CHANNELS:
+            raise ValueError(f"At most {MAX_CHANNELS} channels can be monitored at once")
+        header = HEADER.unpack_from(self.shm.buf, 0)
+        self.writer_session = header[2] + 1
+        padded = list(channels) + [0] * (MAX_CHANNELS - len(channels))
+        HEADER.pack_into(self.shm.buf, 0, header[0], header[1], self.writer_session, len(channels), *padded)
+        self.writer_channels = list(channels)
+
+    def publish(self, timestamp, average, fan_on, temperatures):
+        index = self.write_count()
+        values = [temperatures.get(ch) for ch in self.writer_channels]
+        values = [math.nan if v is None else v for v in values] + [math.nan] * (MAX_CHANNELS - len(values))
+        RECORD.pack_into(self.shm.buf, self._offset(index), self.writer_session, timestamp,
+                         math.nan if average is None else average, 1.0 if fan_on else 0.0, *values)
+        WRITE_COUNT.pack_into(self.shm.buf, 0, index + 1)
+
+    def read_new(self):
+        write_count = self.write_count()
+        start = max(self.read_count, write_count - self.capacity)
+        self.overruns += start - self.read_count
+        records = [RECORD.unpack_from(self.shm.buf, self._offset(index)) for index in range(start, write_count)]
+
+        # Anything the writer lapped while we were copying may be torn, and so
+        # may the slot it is filling now: index write_count - capacity is being
+        # overwritten before write_count moves past it.
+        lapped = min(self.write_count() - self.capacity + 1 - start, len(records))
+        if lapped > 0:
+            records = records[lapped:]
+            self.overruns += lapped
+        self.read_count = write_count
+
+        samples = []
+        for record in records:
+            session = int(record[0])
+            if session != self.session:
+                header = HEADER.unpack_from(self.shm.buf, 0)
+                if session != header[2]:
+                    continue  # left over from a session that has since been replaced
+                self.session = session
+                self.channels = list(header[4:4 + header[3]])
+            values = record[4:4 + len(self.channels)]
+            temperatures = {ch: (None if math.isnan(v) else v) for ch, v in zip(self.channels, values)}
+            average = None if math.isnan(record[2]) else record[2]
+            samples.append(Sample(session, record[1], average, record[3] > 0, temperatures))
+        return samples
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class ChannelHealth:
+    """Per-channel circuit breaker for the scan.
+
+    A channel that fails failure_threshold reads in a row is quarantined: it
+    is left out of the scan (logged as N/A) and probed once every
+    probe_interval seconds. The first good probe returns it to the scan.
+    """
+
+    def __init__(self, failure_threshold=3, probe_interval=60.0):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.failures = {}
+        # Quarantined channel -> monotonic time of its next probe.
+        self.next_probe = {}
+
+    @classmethod
+    def from_config(cls):
+        return cls(failure_threshold=config.getint('monitoring', 'channel_failure_threshold', fallback=3),
+                   probe_interval=config.getfloat('monitoring', 'channel_probe_interval', fallback=60.0))
+
+    def reset(self):
+        self.failures = {}
+        self.next_probe = {}
+
+    def should_read(self, channel, now):
+        next_probe = self.next_probe.get(channel)
+        return next_probe is None or now >= next_probe
+
+    def record(self, channel, ok, now):
+        """Record a read; returns 'quarantined' or 'recovered' when the channel changes state."""
+        if ok:
+            self.failures.pop(channel, None)
+            return 'recovered' if self.next_probe.pop(channel, None) is not None else None
+        self.failures[channel] = self.failures.get(channel, 0) + 1
+        if channel in self.next_probe:
+            self.next_probe[channel] = now + self.probe_interval
+            return None
+        if self.failures[channel] >= self.failure_threshold:
+            self.next_probe[channel] = now + self.probe_interval
+            return 'quarantined'
+        return None
+
+    def quarantined(self):
+        return sorted(self.next_probe)
+
+
+class AdaptiveInterval:
+    """Picks the next sampling interval from how fast the temperatures move.
+
+    Any channel changing faster than rate_threshold (°C/min, measured over
+    rate_window seconds) or within approach_band of the set temperature drops
+    the interval straight to min_interval. Each calm sample after that
+    stretches it by slowdown_factor, up to max_interval.
+    """
+
+    def __init__(self, min_interval, max_interval, rate_threshold=0.5, approach_band=2.0, rate_window=60.0, slowdown_factor=1.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.rate_threshold = rate_threshold
+        self.approach_band = approach_band
+        self.rate_window = rate_window
+        self.slowdown_factor = slowdown_factor
+        self.interval = min_interval
+        self.reason = "start"
+        self.history = deque()
+
+    @classmethod
+    def from_config(cls, min_interval, max_interval):
+        return cls(min_interval, max_interval,
+                   rate_threshold=config.getfloat('adaptive', 'rate_threshold', fallback=0.5),
+                   approach_band=config.getfloat('adaptive', 'approach_band', fallback=2.0),
+                   rate_window=config.getfloat('adaptive', 'rate_window', fallback=60.0),
+                   slowdown_factor=config.getfloat('adaptive', 'slowdown_factor', fallback=1.5))
+
+    def update(self, timestamp, temperatures, set_temperature):
+        # history[0] is the newest sample at least rate_window old.
+        self.history.append((timestamp, temperatures))
+        while len(self.history) > 2 and timestamp - self.history[1][0] >= self.rate_window:
+            self.history.popleft()
+        reference_time, reference = self.history[0]
+        elapsed = timestamp - reference_time
+
+        reason = None
+        for channel, value in temperatures.items():
+            if value is None or math.isnan(value):
+                continue
+            if abs(value - set_temperature) <= self.approach_band:
+                reason = f"Ch {channel} within {self.approach_band:g} °C of set temperature"
+                break
+            previous = reference.get(channel)
+            # Short spans are mostly sensor noise; wait for half a window.
+            if previous is not None and elapsed >= self.rate_window / 2:
+                rate = (value - previous) / elapsed * 60
+                if abs(rate) >= self.rate_threshold:
+                    reason = f"Ch {channel} changing {rate:+.2f} °C/min"
+                    break
+
+        if reason:
+            interval = self.min_interval
+        else:
+            interval = min(self.interval * self.slowdown_factor, self.max_interval)
+            reason = "steady"
+        self.reason = reason
+        self.interval = interval
+        return interval
+
+
+class ZoneController:
+    """Drives one fan relay per zone from a single acquisition tick.
+
+    Each zone closes its relay while the average of its channels is above
+    its set temperature. Only relays that change state are switched, with at
+    most one ROUTE:CLOSE and one ROUTE:OPEN per tick for all zones together.
+    Relay cycles and actuation latency are counted per zone.
+    """
+
+    def __init__(self, zones, configured=False):
+        self.zones = list(zones)
+        self.configured = configured
+        # Relay -> True when closed; relays missing here are in an unknown state.
+        self.relay_states = {}
+        # Relays no zone drives any more, opened on the next tick.
+        self.released = set()
+        self.stats = {zone.name: {'cycles': 0, 'switches': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+                      for zone in self.zones}
+
+    @classmethod
+    def from_config(cls, channels, set_temperature, fan_channel):
+        """Zones from the [zone:<name>] sections, or one zone over all channels on fan_channel."""
+        # Closing a relay on a channel that is also scanned would switch it
+        # out from under the thermocouple, or the fan with every scan.
+        relays = get_fan_channels()
+        scanned = set(get_temperature_channels())
+        overlap = sorted(scanned.intersection(relays))
+        if overlap:
+            raise ValueError(f"channels {', '.join(map(str, overlap))} are both fan relays "
+                             f"(fan_channels_start/fan_channels_end) and temperature channels (temp_channels)")
+        sections = fan_zone_sections()
+        if not sections:
+            if fan_channel in scanned:
+                raise ValueError(f"fan channel {fan_channel} is also a temperature channel")
+            return cls([FanZone("Fan", list(channels), set_temperature, fan_channel)])
+
+        zones = []
+        for section in sections:
+            name = section.split(':', 1)[1].strip()
+            relay = config.getint(section, 'relay')
+            if relay not in relays:
+                raise ValueError(f"Zone {name}: relay {relay} is outside {relays[0]}-{relays[-1]}")
+            if any(zone.relay == relay for zone in zones):
+                raise ValueError(f"Zone {name}: relay {relay} is already used by another zone")
+            zone_channels = parse_channel_list(config.get(section, 'channels', fallback=''))
+            monitored = [ch for ch in zone_channels if ch in channels]
+            if len(monitored) < len(zone_channels):
+                logging.warning(f"Zone {name}: channels {sorted(set(zone_channels) - set(monitored))} are not being monitored")
+            zones.append(FanZone(name, monitored, config.getfloat(section, 'set_temperature', fallback=set_temperature), relay))
+        return cls(zones, configured=True)
+
+    def set_default_relay(self, relay):
+        if self.configured:
+            return
+        zone = self.zones[0]
+        if relay == zone.relay:
+            return
+        # The old relay may have been left closed; it is opened with the next
+        # tick's switching, and the new one is switched from scratch.
+        if self.relay_states.pop(zone.relay, None) is not False:
+            self.released.add(zone.relay)
+        self.released.discard(relay)
+        self.zones[0] = zone._replace(relay=relay)
+
+    def forget_relays(self):
+        # After a failed write or a reconnect every relay is switched again.
+        self.relay_states = {}
+
+    def evaluate(self, temperature_values):
+        """Return (relays to close, relays to open, zones switched) for this tick."""
+        close, open_, switched = [], sorted(self.released), []
+        self.released.clear()
+        for zone in self.zones:
+            average = get_average_temperature([temperature_values.get(ch) for ch in zone.channels])
+            if average is None:
+                continue  # no readings: leave the relay as it is
+            closed = average > zone.set_temperature
+            if self.relay_states.get(zone.relay) != closed:
+                (close if closed else open_).append(zone.relay)
+                self.relay_states[zone.relay] = closed
+                switched.append(zone)
+        return close, open_, switched
+
+    @staticmethod
+    def commands(close, open_):
+        commands = []
+        if close:
+            commands.append(f"ROUTE:CLOSE (@{','.join(str(relay) for relay in sorted(close))})")
+        if open_:
+            commands.append(f"ROUTE:OPEN (@{','.join(str(relay) for relay in sorted(open_))})")
+        return commands
+
+    def record_actuation(self, switched, readings, done_at):
+        # Latency runs from the oldest reading of the zone's channels.
+        for zone in switched:
+            stats = self.stats[zone.name]
+            stats['switches'] += 1
+            if self.relay_states.get(zone.relay):
+                stats['cycles'] += 1
+            read_at = min((readings[ch].read_at for ch in zone.channels
+                           if ch in readings and readings[ch].timestamp is not None), default=None)
+            if read_at is not None:
+                latency = done_at - read_at
+                stats['latency_total'] += latency
+                stats['latency_max'] = max(stats['latency_max'], latency)
+
+    def zone_on(self, zone):
+        return bool(self.relay_states.get(zone.relay))
+
+    def fan_on(self):
+        return any(self.relay_states.values())
+
+    def summary(self):
+        parts = []
+        for zone in self.zones:
+            stats = self.stats[zone.name]
+            mean = stats['latency_total'] / stats['switches'] * 1000 if stats['switches'] else 0.0
+            parts.append(f"{zone.name} (relay {zone.relay}): {stats['cycles']} cycles, "
+                         f"actuation latency mean {mean:.0f} ms, max {stats['latency_max'] * 1000:.0f} ms")
+        return "; ".join(parts)
+
+
+class AcquisitionEngine:
+    def __init__(self, emit, ring):
+        self.emit = emit
+        self.ring = ring
+
+        self.visa_comm = None
+        self.monitoring_task = None
+        self.is_monitoring = False
+
+        self.channels = []
+        self.thermocouple_types = {}
+        self.fan_channel = config.getint('channels', 'default_fan_channel', fallback=203)
+        self.set_temperature = None
+        self.sleep_interval = None
+
+        self.csv_file = None
+        self.csv_writer = None
+        self.last_save_time = time.time()
+        self.save_interval = config.getint('monitoring', 'save_interval', fallback=30)
+        self.instrument_timestamps = config.getboolean('monitoring', 'instrument_timestamps', fallback=True)
+        self.max_clock_skew = config.getfloat('monitoring', 'max_clock_skew', fallback=2.0)
+        self.log_latency = config.getboolean('monitoring', 'log_latency', fallback=True)
+        self.channel_time_columns = config.getboolean('monitoring', 'channel_time_columns', fallback=False)
+        # Host readings are stamped from the monotonic clock mapped to wall
+        # clock time, so a clock step mid-session can't reorder them.
+        self.clock_anchor = (time.time(), time.monotonic())
+        self.clock_skew_warned = False
+        self.history_sink = SQLiteSink.from_config() if config.getboolean('storage', 'sqlite_enabled', fallback=False) else None
+        self.sink = None
+
+        self.max_reconnection_attempts = config.getint('connection', 'max_reconnection_attempts', fallback=5)
+        self.error_count = 0
+        self.replay_stats = None
+        self.adaptive = None
+        self.adaptive_stats = None
+        self.channel_health = ChannelHealth.from_config()
+        self.zones = None
+        self.checkpointed = False
+
+    async def handle_command(self, command, payload=None):
+        if command == 'connect':
+            await self.connect()
+        elif command == 'start':
+            await self.start_monitoring(payload)
+        elif command == 'replay':
+            await self.start_replay(payload)
+        elif command == 'stop':
+            await self.stop_monitoring("Monitoring stopped")
+        elif command == 'set_fan_channel':
+            self.fan_channel = payload
+            if self.zones:
+                self.zones.set_default_relay(payload)
+        else:
+            logging.warning(f"Unknown acquisition command: {command}")
+
+    async def connect(self):
+        try:
+            resource_name = await auto_negotiate_instrument()
+            if not resource_name:
+                raise ConnectionError("No compatible instrument found")
+
+            if self.visa_comm:
+                await self.visa_comm.disconnect()
+            self.visa_comm = create_communication(resource_name)
+            await self.visa_comm.connect()
+            await self.configure_instrument()
+
+            self.emit({
+                'status': "Connected",
+                'connection_status': "Connected",
+                'connection_address': f"Connected to: {resource_name}",
+                'connected': True,
+                'enable_start_button': True
+            })
+            logging.info(f"Connected to instrument at {resource_name}")
+
+        except Exception as e:
+            error_message = f"Connection failed: {str(e)}"
+            self.emit({
+                'status': "Connection Failed",
+                'connection_status': "Disconnected",
+                'connection_address': "Data Logger: Not Connected",
+                'connected': False,
+                'error': error_message,
+                'enable_start_button': False
+            })
+            logging.error(error_message)
+
+        self.emit({'enable_connect_button': True})
+
+    async def configure_instrument(self):
+        # Instruments that don't know the command leave an error in the queue
+        # and answer without time fields; readings then get host timestamps.
+        if self.instrument_timestamps:
+            await self.visa_comm.write("FORM:READ:TIME ON")
+            await self.visa_comm.write("FORM:READ:TIME:TYPE ABS")
+
+    def host_time(self, monotonic_time):
+        return self.clock_anchor[0] + monotonic_time - self.clock_anchor[1]
+
+    async def start_monitoring(self, params):
+        if not self.visa_comm or self.visa_comm.state != ConnectionState.CONNECTED:
+            self.emit({'error': "Please connect to the Data Logger first.", 'monitoring_stopped': True})
+            return
+        if self.is_monitoring:
+            return
+
+        self.channels = list(params['channels'])
+        self.thermocouple_types = dict(params['thermocouple_types'])
+        self.set_temperature = params['set_temperature']
+        self.sleep_interval = params['sleep_interval']
+        self.fan_channel = params['fan_channel']
+        if not self.load_zones():
+            return
+        self.channel_health.reset()
+        self.emit({'channel_health': []})
+        # In adaptive mode sleep_interval is the slowest interval.
+        self.adaptive = None
+        if params.get('adaptive_min_interval'):
+            self.adaptive = AdaptiveInterval.from_config(params['adaptive_min_interval'], params['sleep_interval'])
+            self.sleep_interval = self.adaptive.interval
+            self.adaptive_stats = {'samples': 0, 'bus_time': 0.0, 'started': time.monotonic()}
+
+        csv_filename = self.begin_session('temperature_log', params.get('resume_log'))
+        if csv_filename is None:
+            return
+        self.sink = self.history_sink
+        if self.sink:
+            self.sink.begin_session(self.channels, self.thermocouple_types, csv_filename)
+        try:
+            write_checkpoint({
+                # The engine that writes the log, so a live session is never resumed twice.
+                'pid': os.getpid(),
+                'log_file': os.path.abspath(csv_filename),
+                'started': datetime.now().isoformat(timespec='seconds'),
+                'channels': self.channels,
+                'thermocouple_types': self.thermocouple_types,
+                'set_temperature': self.set_temperature,
+                'sleep_interval': params['sleep_interval'],
+                'adaptive_min_interval': params.get('adaptive_min_interval'),
+                'fan_channel': self.fan_channel,
+            })
+            self.checkpointed = True
+        except OSError as e:
+            logging.warning(f"Could not write session checkpoint: {e}")
+
+        self.is_monitoring = True
+        self.monitoring_task = asyncio.get_running_loop().create_task(self.monitor_temperature())
+        if self.adaptive:
+            logging.info(f"Adaptive sampling between {self.adaptive.min_interval:g} s and {self.adaptive.max_interval:g} s")
+        logging.info(f"Monitoring started, logging to {csv_filename}")
+        self.emit({'status': "Reading Measurements..."})
+
+    async def start_replay(self, params):
+        if self.is_monitoring:
+            self.emit({'error': "Stop monitoring before starting a replay.", 'monitoring_stopped': True})
+            return
+
+        try:
+            source = ReplaySource(params['path'])
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not open replay log: {e}")
+            self.emit({'error': f"Could not open replay log: {e}", 'monitoring_stopped': True})
+            return
+
+        self.channels = source.channels
+        self.thermocouple_types = source.thermocouple_types
+        self.set_temperature = params['set_temperature']
+        self.adaptive = None
+        if not self.load_zones():
+            return
+
+        csv_filename = self.begin_session('replay_log')
+        if csv_filename is None:
+            return
+        # Replays stay out of the live history database unless a separate one is given.
+        self.sink = SQLiteSink(params['sqlite']) if params.get('sqlite') else None
+        if self.sink:
+            self.sink.begin_session(self.channels, self.thermocouple_types, csv_filename)
+
+        self.replay_stats = {'rows': 0, 'rows_per_s': 0.0, 'skipped_rows': 0, 'log_file': csv_filename}
+        self.is_monitoring = True
+        self.monitoring_task = asyncio.get_running_loop().create_task(self.replay_log(source, params.get('speed', 1.0)))
+        logging.info(f"Replaying {params['path']} at speed {params.get('speed', 1.0)}, logging to {csv_filename}")
+        self.emit({'status': f"Replaying {os.path.basename(params['path'])}..."})
+
+    def load_zones(self):
+        try:
+            self.zones = ZoneController.from_config(self.channels, self.set_temperature, self.fan_channel)
+        except ValueError as e:
+            logging.error(f"Invalid fan zone configuration: {e}")
+            self.emit({'error': f"Invalid fan zone configuration: {e}", 'monitoring_stopped': True})
+            return False
+        if self.zones.configured:
+            logging.info(f"Fan control by zone: " + "; ".join(
+                f"{zone.name} ch {','.join(map(str, zone.channels))} > {zone.set_temperature:g} °C -> relay {zone.relay}"
+                for zone in self.zones.zones))
+        return True
+
+    def log_header(self):
+        header = ['Timestamp', 'Average Temperature'] + [f'Temp (Ch {ch} {self.thermocouple_types[ch]})' for ch in self.channels] + ['Fan Status']
+        if self.zones.configured:
+            header += [f'Fan ({zone.name})' for zone in self.zones.zones]
+        if self.log_latency:
+            header += ['Read-to-Log Latency (ms)', 'Read-to-Relay Latency (ms)']
+        if self.adaptive:
+            header += ['Sample Interval (s)']
+        if self.channel_time_columns:
+            header += [f'Time (Ch {ch})' for ch in self.channels]
+        return header
+
+    def begin_session(self, prefix, resume_log=None):
+        self.clock_anchor = (time.time(), time.monotonic())
+        self.clock_skew_warned = False
+        header = self.log_header()
+        if resume_log:
+            # Only a log with exactly these columns can be continued.
+            try:
+                resumable = read_log_header(resume_log)[0] == header
+            except (OSError, ValueError):
+                resumable = False
+            if not resumable:
+                logging.warning(f"Cannot append to {resume_log}: missing or different columns; starting a new log")
+                resume_log = None
+        try:
+            self.ring.begin_session(self.channels)
+            if resume_log:
+                trim_partial_row(resume_log)
+                csv_filename = resume_log
+                self.csv_file = open(csv_filename, 'a', newline='')
+            else:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                csv_filename = f'{prefix}_{timestamp}.csv'
+                self.csv_file = open(csv_filename, 'w', newline='')
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not start monitoring: {e}")
+            self.emit({'error': f"Could not start monitoring: {e}", 'monitoring_stopped': True})
+            return None
+
+        self.csv_writer = csv.writer(self.csv_file)
+        if resume_log:
+            logging.info(f"Resuming the session log {resume_log}")
+        else:
+            self.csv_writer.writerow(header)
+        return csv_filename
+
+    async def stop_monitoring(self, status, **details):
+        was_monitoring = self.is_monitoring
+        self.is_monitoring = False
+        if self.monitoring_task and not self.monitoring_task.done() and self.monitoring_task is not asyncio.current_task():
+            self.monitoring_task.cancel()
+            try:
+                await self.monitoring_task
+            except asyncio.CancelledError:
+                pass
+
+        if self.adaptive and was_monitoring:
+            status = f"{status}; {self.adaptive_summary()}"
+        if self.zones and was_monitoring and any(stats['switches'] for stats in self.zones.stats.values()):
+            logging.info(f"Fan zones: {self.zones.summary()}")
+
+        if self.csv_file:
+            self.csv_file.close()
+            self.csv_file = None
+            self.csv_writer = None
+        if self.checkpointed:
+            # A clean stop leaves nothing to resume.
+            clear_checkpoint()
+            self.checkpointed = False
+
+        if self.sink:
+            self.sink.end_session()
+            if self.sink is not self.history_sink:
+                await asyncio.to_thread(self.sink.close)
+            self.sink = None
+
+        if was_monitoring:
+            logging.info("Monitoring stopped")
+            self.emit({'monitoring_stopped': True, 'status': status, **details})
+
+    def adaptive_summary(self):
+        # Savings are counted against sampling at min_interval throughout.
+        stats = self.adaptive_stats
+        samples = stats['samples']
+        duration = time.monotonic() - stats['started']
+        fixed_samples = int(duration / self.adaptive.min_interval) + 1
+        saved = max(fixed_samples - samples, 0)
+        bytes_per_row = 0
+        if self.csv_file and samples:
+            self.csv_file.flush()
+            bytes_per_row = os.fstat(self.csv_file.fileno()).st_size / samples
+        bus_per_sample = stats['bus_time'] / samples if samples else 0.0
+        summary = (f"Adaptive sampling took {samples} samples instead of {fixed_samples}, "
+                   f"saving {saved * bus_per_sample:.1f} s of bus time and {saved * bytes_per_row / 1024:.0f} KB of CSV")
+        logging.info(summary)
+        return summary
+
+    async def monitor_temperature(self):
+        while self.is_monitoring:
+            start_time = time.monotonic()
+            try:
+                readings = await self.read_temperatures(self.channels)
+                temperature_values = {channel: reading.value for channel, reading in readings.items()}
+                channel_times = {channel: reading.timestamp for channel, reading in readings.items()}
+                # The row is stamped with the mean reading time rather than
+                # the time the last channel came back. Quarantined channels
+                # that weren't read have no time.
+                read_times = [t for t in channel_times.values() if t is not None]
+                timestamp = datetime.fromtimestamp(sum(read_times) / len(read_times)) if read_times else datetime.now()
+                read_at = min((reading.read_at for reading in readings.values() if reading.timestamp is not None), default=start_time)
+
+                # Relays are switched before the row is logged so fan
+                # control doesn't wait on the disk.
+                relay_latency = None
+                close, open_, switched = self.zones.evaluate(temperature_values)
+                if close or open_:
+                    for command in self.zones.commands(close, open_):
+                        await self.visa_comm.write(command)
+                    done_at = time.monotonic()
+                    relay_latency = done_at - read_at
+                    self.zones.record_actuation(switched, readings, done_at)
+
+                bus_time = time.monotonic() - start_time
+                self.process_reading(timestamp, temperature_values, channel_times, read_at, relay_latency)
+                if self.adaptive:
+                    self.adapt_interval(timestamp.timestamp(), temperature_values, bus_time)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error in monitoring loop: {e}")
+                self.emit({'status': f"Error: {e}"})
+                self.zones.forget_relays()
+                await self.handle_disconnection()
+
+            work_duration = time.monotonic() - start_time
+            sleep_duration = self.sleep_interval - work_duration
+            if sleep_duration > 0:
+                await asyncio.sleep(sleep_duration)
+
+    def adapt_interval(self, timestamp, temperature_values, bus_time):
+        self.adaptive_stats['samples'] += 1
+        self.adaptive_stats['bus_time'] += bus_time
+        interval = self.adaptive.update(timestamp, temperature_values, self.set_temperature)
+        if interval != self.sleep_interval:
+            # Logged on every change; the CSV also has a Sample Interval column.
+            logging.info(f"Sampling interval {self.sleep_interval:g} s -> {interval:g} s ({self.adaptive.reason})")
+            self.sleep_interval = interval
+            self.emit({'status': f"Reading Measurements... (every {interval:g} s)"})
+
+    def process_reading(self, timestamp, temperature_values, channel_times=None, read_at=None, relay_latency=None):
+        average_temperature = get_average_temperature(list(temperature_values.values()))
+        fan_on = self.zones.fan_on()
+        fan_status = "Fan Rotating" if fan_on else "Fan Stopped"
+        self.ring.publish(timestamp.timestamp(), average_temperature, fan_on, temperature_values)
+        if self.sink:
+            self.sink.add(timestamp.timestamp(), temperature_values, channel_times)
+
+        if self.csv_writer:
+            row = format_csv_row(timestamp, average_temperature, temperature_values, self.channels, fan_status)
+            if self.zones.configured:
+                row.extend("On" if self.zones.zone_on(zone) else "Off" for zone in self.zones.zones)
+            if self.log_latency:
+                # Latencies are measured from the oldest reading in the row.
+                row.append(f"{(time.monotonic() - read_at) * 1000:.1f}" if read_at is not None else 'N/A')
+                row.append(f"{relay_latency * 1000:.1f}" if relay_latency is not None else 'N/A')
+            if self.adaptive:
+                row.append(f"{self.sleep_interval:g}")
+            if self.channel_time_columns:
+                row.extend(format_channel_time(channel_times.get(ch)) if channel_times else 'N/A' for ch in self.channels)
+            self.csv_writer.writerow(row)
+
+            current_time = time.time()
+            if current_time - self.last_save_time >= self.save_interval:
+                self.csv_file.flush()
+                os.fsync(self.csv_file.fileno())
+                self.last_save_time = current_time
+        return average_temperature
+
+    async def replay_log(self, source, speed):
+        # Replayed rows go through process_reading like live ones, but the fan
+        # relays are never driven. speed <= 0 replays as fast as possible.
+        rows = 0
+        started = time.perf_counter()
+        first_timestamp = None
+        try:
+            for timestamp, temperature_values in source:
+                if not self.is_monitoring:
+                    break
+                if speed > 0:
+                    if first_timestamp is None:
+                        first_timestamp = timestamp
+                    delay = (timestamp - first_timestamp).total_seconds() / speed - (time.perf_counter() - started)
+                    await asyncio.sleep(max(delay, 0))
+                elif rows % 100 == 0:
+                    await asyncio.sleep(0)
+                self.zones.evaluate(temperature_values)
+                self.process_reading(timestamp, temperature_values)
+                rows += 1
+        except OSError as e:
+            logging.error(f"Error reading replay log: {e}")
+            self.emit({'error': f"Error reading replay log: {e}"})
+
+        if self.sink:
+            await asyncio.to_thread(self.sink.flush)
+            self.replay_stats['sqlite_rows'] = self.sink.rows_written
+        elapsed = time.perf_counter() - started
+        self.replay_stats.update(rows=rows, rows_per_s=rows / elapsed if elapsed > 0 else 0.0, skipped_rows=source.skipped_rows)
+        status = f"Replay finished: {rows} rows in {elapsed:.1f} s ({self.replay_stats['rows_per_s']:.0f} rows/s)"
+        logging.info(status)
+        await self.stop_monitoring(status, replay_stats=dict(self.replay_stats))
+
+    async def read_temperatures(self, channels):
+        now = time.monotonic()
+        # Quarantined channels are skipped until their next probe is due.
+        due = [channel for channel in channels if self.channel_health.should_read(channel, now)]
+        if self.visa_comm.pipelined and len(due) > 1:
+            readings = await self.read_pipelined(due)
+        else:
+            readings = {channel: await self.read_temperature(channel) for channel in due}
+        return {channel: readings[channel] if channel in readings else Reading(None, None, now) for channel in channels}
+
+    async def read_pipelined(self, channels):
+        # Queries go out back to back and answers are matched to them by
+        # position, so once one query goes unanswered the ones after it have
+        # taken their neighbours' answers. Such a batch is thrown away and
+        # read again one channel at a time.
+        async def query(channel):
+            sent = time.monotonic()
+            measurement = await self.query_temperature(channel)
+            return measurement, sent, time.monotonic()
+
+        results = await asyncio.gather(*(query(channel) for channel in channels), return_exceptions=True)
+        failed = [channel for channel, result in zip(channels, results) if isinstance(result, Exception)]
+        if not failed:
+            return {channel: self.make_reading(channel, *result) for channel, result in zip(channels, results)}
+        if self.visa_comm.state != ConnectionState.CONNECTED:
+            raise ConnectionError("Connection lost during the scan")
+        logging.warning(f"{len(failed)} pipelined reads failed, answers may be out of step; "
+                        f"reading the scan again one channel at a time")
+        return {channel: await self.read_temperature(channel) for channel in channels}
+
+    async def query_temperature(self, channel):
+        tc_type = self.thermocouple_types[channel]
+        # No retries: a failing channel is handled by the circuit breaker
+        # instead of stalling the scan.
+        return await self.visa_comm.query(f"MEAS:TEMP? TC,{tc_type},(@{channel})", max_retries=1)
+
+    async def read_temperature(self, channel):
+        sent = time.monotonic()
+        try:
+            measurement = await self.query_temperature(channel)
+        except ConnectionError as e:
+            # A lost connection is not the channel's fault: it goes up to
+            # monitor_temperature, which reconnects.
+            if self.visa_comm.state != ConnectionState.CONNECTED:
+                raise
+            logging.error(f"Error reading temperature from channel {channel}: {e}")
+            measurement = None
+        except Exception as e:
+            logging.error(f"Error reading temperature from channel {channel}: {e}")
+            measurement = None
+            self.record_channel(channel, False)
+        return self.make_reading(channel, measurement, sent, time.monotonic())
+
+    def make_reading(self, channel, measurement, sent, received):
+        temperature = instrument_time = None
+        if measurement is not None:
+            try:
+                temperature, instrument_time = parse_reading(measurement)
+                if not (-200 <= temperature <= 1000):
+                    raise ValueError(f"Temperature out of range: {temperature}")
+                self.record_channel(channel, True)
+            except Exception as e:
+                logging.error(f"Error reading temperature from channel {channel}: {e}")
+                temperature = instrument_time = None
+                self.record_channel(channel, False)
+
+        # Without an instrument timestamp the reading is assumed to be taken
+        # halfway through the query.
+        read_at = (sent + received) / 2
+        timestamp = self.host_time(read_at)
+        if instrument_time is not None:
+            if abs(instrument_time - timestamp) <= self.max_clock_skew:
+                timestamp = instrument_time
+            elif not self.clock_skew_warned:
+                self.clock_skew_warned = True
+                logging.warning(f"Instrument clock is {instrument_time - timestamp:+.1f} s off the host clock; "
+                                f"using host timestamps")
+        return Reading(temperature, timestamp, read_at)
+
+    def record_channel(self, channel, ok):
+        change = self.channel_health.record(channel, ok, time.monotonic())
+        if change == 'quarantined':
+            logging.warning(f"Channel {channel} quarantined after {self.channel_health.failure_threshold} failed reads; "
+                            f"probing every {self.channel_health.probe_interval:g} s")
+        elif change == 'recovered':
+            logging.info(f"Channel {channel} recovered")
+        if change:
+            self.emit({'channel_health': self.channel_health.quarantined()})
+
+    async def handle_disconnection(self):
+        if self.visa_comm.state == ConnectionState.RECONNECTING:
+            return
+
+        self.visa_comm.state = ConnectionState.RECONNECTING
+        self.emit({
+            'status': "Connection lost. Attempting to reconnect...",
+            'connection_status': "Reconnecting"
+        })
+
+        reconnected = await self._reconnect_coroutine()
+
+        if reconnected:
+            self.emit({
+                'status': "Reconnected successfully",
+                'connection_status': "Connected",
+                'connected': True
+            })
+            self.error_count = 0
+        else:
+            self.emit({
+                'status': "Failed to reconnect. Please check the connection and restart the application.",
+                'connection_status': "Disconnected",
+                'connected': False
+            })
+            await self.stop_monitoring("Monitoring stopped: connection lost")
+
+        self.visa_comm.state = ConnectionState.CONNECTED if reconnected else ConnectionState.DISCONNECTED
+
+    async def _reconnect_coroutine(self):
+        for attempt in range(self.max_reconnection_attempts):
+            try:
+                await self.visa_comm.disconnect()
+                await self.visa_comm.connect()
+                await self.configure_instrument()
+                logging.info("Successfully reconnected to the instrument")
+                self.emit({
+                    'status': "Reconnected",
+                    'connection_address': f"Connected to: {self.visa_comm.resource_name}"
+                })
+                return True
+            except Exception as e:
+                logging.error(f"Reconnection attempt {attempt + 1} failed: {str(e)}")
+                self.emit({
+                    'status': f"Reconnection failed. Retrying... ({attempt + 1}/{self.max_reconnection_attempts})"
+                })
+
+            await asyncio.sleep(5)
+
+        logging.critical("Failed to reconnect after multiple attempts")
+        self.emit({
+            'status': "Reconnection failed. Please check the instrument and restart the application.",
+            'enable_start_button': False,
+            'enable_stop_button': False
+        })
+        return False
+
+    async def shutdown(self, keep_checkpoint=False):
+        if keep_checkpoint:
+            # stop_monitoring then leaves the checkpoint for a warm restart.
+            self.checkpointed = False
+        await self.stop_monitoring("Monitoring stopped")
+        if self.history_sink:
+            await asyncio.to_thread(self.history_sink.close)
+        if self.visa_comm:
+            try:
+                await self.visa_comm.disconnect()
+            except Exception as e:
+                logging.error(f"Error closing instrument connection: {e}")
+
+
+async def run_acquisition(command_queue, emit, ring, parent_alive=None):
+    lock = EngineLock(engine_lock_path())
+    try:
+        lock.acquire()
+    except RuntimeError as e:
+        logging.error(f"Acquisition engine not started: {e}")
+        emit({'error': f"Acquisition engine not started: {e}. Close the other instance first."})
+        return
+    except OSError as e:
+        logging.warning(f"Could not lock {engine_lock_path()}; a second engine would not be detected: {e}")
+
+    engine = AcquisitionEngine(emit, ring)
+    orphaned = False
+    try:
+        while True:
+            try:
+                command, payload = await asyncio.to_thread(command_queue.get, True, 0.5)
+            except queue.Empty:
+                if parent_alive is not None and not parent_alive():
+                    # Nobody can see or stop the session any more. It is
+                    # stopped with its checkpoint kept, so the next GUI can
+                    # resume the same log.
+                    logging.warning("GUI process exited; stopping acquisition")
+                    orphaned = True
+                    break
+                continue
+
+            if command == 'shutdown':
+                break
+            try:
+                await engine.handle_command(command, payload)
+            except Exception as e:
+                logging.error(f"Error handling acquisition command {command}: {e}")
+                emit({'status': f"Error: {e}"})
+
+        await engine.shutdown(keep_checkpoint=orphaned)
+    finally:
+        lock.release()
+
+
+def acquisition_main(command_queue, event_queue, ring_name):
+    configure_logging('temperature_monitor_acquisition')
+    ring = SampleRing(name=ring_name)
+    parent = multiprocessing.parent_process()
+
+    def emit(message):
+        # Nobody drains the queue once the GUI is gone; don't let it grow.
+        if parent is None or parent.is_alive():
+            event_queue.put(message)
+
+    try:
+        asyncio.run(run_acquisition(command_queue, emit, ring, parent.is_alive if parent else None))
+    finally:
+        ring.close()
+        # atexit handlers don't run in a multiprocessing child; flush the log here.
+        stop_logging()
+
+
+class AcquisitionClient:
+    """GUI-side handle: sends commands, drains status events and owns the ring."""
+
+    def __init__(self, isolated=True, capacity=4096):
+        self.isolated = isolated
+        self.ring = SampleRing(capacity=capacity)
+        self.process = None
+        self.task = None
+        if isolated:
+            self.context = multiprocessing.get_context('spawn')
+            self.command_queue = self.context.Queue()
+            self.event_queue = self.context.Queue()
+        else:
+            self.command_queue = queue.Queue()
+            self.event_queue = queue.Queue()
+
+    def start(self, loop):
+        if self.isolated:
+            self.process = self.context.Process(target=acquisition_main, name="acquisition",
+                                                args=(self.command_queue, self.event_queue, self.ring.name))
+            self.process.start()
+            logging.info(f"Acquisition process started (pid {self.process.pid})")
+        else:
+            self.task = loop.create_task(run_acquisition(self.command_queue, self.event_queue.put, self.ring))
+
+    def is_alive(self):
+        if self.isolated:
+            return self.process is not None and self.process.is_alive()
+        return self.task is not None and not self.task.done()
+
+    def exit_code(self):
+        return self.process.exitcode if self.process is not None else None
+
+    def send(self, command, payload=None):
+        self.command_queue.put((command, payload))
+
+    def poll_events(self):
+        events = []
+        while True:
+            try:
+                events.append(self.event_queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def read_samples(self):
+        return self.ring.read_new()
+
+    async def stop(self, timeout=10):
+        self.send('shutdown')
+        try:
+            if self.process is not None:
+                await asyncio.to_thread(self.process.join, timeout)
+                if self.process.is_alive():
+                    logging.error("Acquisition process did not stop; terminating it")
+                    self.process.terminate()
+            elif self.task is not None:
+                await asyncio.wait_for(self.task, timeout)
+        except Exception as e:
+            logging.error(f"Error stopping acquisition: {e}")
+        finally:
+            self.ring.close()
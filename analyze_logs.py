@@ -0,0 +1,284 @@
+"""Offline analysis of temperature_log_*.csv files.
+
+Every log is parsed as a stream, one row at a time, in a pool of worker
+processes (one file per task), so memory stays bounded however large the files
+are. The summary table has one row per file and channel: reading statistics,
+time above the set point, the longest run of identical readings (a stuck
+sensor), and the file's fan duty cycle and gaps in logging.
+
+    python analyze_logs.py logs/ --set-temperature 40 --output summary.csv
+    python analyze_logs.py "data/temperature_log_202405*.csv" --workers 8
+"""
+import argparse
+import csv
+import glob
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from replay import read_log_header
+
+LOG_PATTERN = 'temperature_log_*.csv'
+EPOCH = datetime(1970, 1, 1)
+
+SUMMARY_COLUMNS = [
+    'file', 'start', 'end', 'duration_s', 'rows', 'fan_duty_pct', 'gaps', 'longest_gap_s', 'gap_time_s',
+    'channel', 'thermocouple', 'samples', 'missing', 'min', 'max', 'mean', 'std',
+    'time_above_s', 'above_pct', 'longest_flat_s', 'stuck',
+]
+
+
+class ChannelStats:
+    __slots__ = ('samples', 'missing', 'minimum', 'maximum', 'shift', 'total', 'total_sq',
+                 'time_above', 'above', 'flat_value', 'flat_start', 'longest_flat')
+
+    def __init__(self):
+        self.samples = 0
+        self.missing = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        # Sums are taken relative to the first reading to keep the variance accurate.
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.time_above = 0.0
+        # Whether the previous row's reading was above the set point.
+        self.above = False
+        self.flat_value = None
+        self.flat_start = None
+        self.longest_flat = 0.0
+
+
+def format_log_time(seconds):
+    # Log times are naive local times counted from EPOCH; fromtimestamp would
+    # apply the UTC offset a second time.
+    return (EPOCH + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def parse_log_time(row):
+    return (datetime.fromisoformat(row[0]) - EPOCH).total_seconds()
+
+
+def estimate_gap_seconds(path, intervals=100):
+    """Three times the median of the first ``intervals`` logging intervals (at least 3 s).
+
+    Read in a separate pass over the head of the file, so the threshold is
+    known before the first gap can turn up, however short the log.
+    """
+    samples = []
+    last = None
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            try:
+                now = parse_log_time(row)
+            except (ValueError, IndexError):
+                continue
+            if last is not None:
+                samples.append(now - last)
+                if len(samples) >= intervals:
+                    break
+            last = now
+    if not samples:
+        return None
+    return 3 * max(sorted(samples)[len(samples) // 2], 1.0)
+
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, LOG_PATTERN))))
+        else:
+            matches = sorted(glob.glob(pattern))
+            paths.extend(matches if matches else [pattern])
+    return list(dict.fromkeys(paths))
+
+
+def analyze_log(path, set_temperature=None, gap_seconds=None, stuck_seconds=600.0, observer=None):
+    """Stream one log and return its summary rows (one per channel).
+
+    ``observer``, if given, is called as observer(time, values, fan_on) for
+    every row, with the channel values (NaN when missing) in sorted channel
+    order, so callers can build their own views in the same pass.
+    """
+    header, columns, thermocouple_types = read_log_header(path)
+    channels = sorted(columns)
+    indexes = [columns[ch] for ch in channels]
+    stats = [ChannelStats() for _ in channels]
+    fan_index = header.index('Fan Status') if 'Fan Status' in header else None
+    if gap_seconds is None:
+        gap_seconds = estimate_gap_seconds(path)
+
+    rows = 0
+    first = last = None
+    fan_time = 0.0
+    fan_on = False
+    gaps = 0
+    longest_gap = 0.0
+    gap_time = 0.0
+
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            try:
+                now = parse_log_time(row)
+            except (ValueError, IndexError):
+                continue
+            rows += 1
+
+            # Each interval is credited to the state of the row that starts
+            # it; gaps are not credited at all and break runs of identical
+            # readings.
+            fan_was_on = fan_on
+            if fan_index is not None and fan_index < len(row):
+                fan_on = row[fan_index] == "Fan Rotating"
+
+            interval = 0.0
+            if last is not None:
+                interval = now - last
+                if gap_seconds is not None and interval > gap_seconds:
+                    gaps += 1
+                    gap_time += interval
+                    longest_gap = max(longest_gap, interval)
+                    interval = 0.0
+                    for channel in stats:
+                        channel.flat_value = None
+                elif fan_was_on:
+                    fan_time += interval
+            else:
+                first = now
+            last = now
+
+            values = [] if observer else None
+            for index, channel in zip(indexes, stats):
+                try:
+                    value = float(row[index])
+                except (ValueError, IndexError):
+                    value = math.nan
+                if values is not None:
+                    values.append(value)
+                if channel.above:
+                    channel.time_above += interval
+                if value != value:
+                    channel.missing += 1
+                    channel.above = False
+                    channel.flat_value = None
+                    continue
+                channel.samples += 1
+                if value < channel.minimum:
+                    channel.minimum = value
+                if value > channel.maximum:
+                    channel.maximum = value
+                if channel.shift is None:
+                    channel.shift = value
+                delta = value - channel.shift
+                channel.total += delta
+                channel.total_sq += delta * delta
+                channel.above = set_temperature is not None and value > set_temperature
+                if value == channel.flat_value:
+                    if now - channel.flat_start > channel.longest_flat:
+                        channel.longest_flat = now - channel.flat_start
+                else:
+                    channel.flat_value = value
+                    channel.flat_start = now
+            if observer:
+                observer(now, values, fan_on)
+
+    duration = (last - first) if rows else 0.0
+    logged_time = duration - gap_time
+    file_fields = {
+        'file': path,
+        'start': format_log_time(first) if rows else '',
+        'end': format_log_time(last) if rows else '',
+        'duration_s': round(duration, 1),
+        'rows': rows,
+        'fan_duty_pct': round(100 * fan_time / logged_time, 1) if fan_index is not None and logged_time > 0 else '',
+        'gaps': gaps,
+        'longest_gap_s': round(longest_gap, 1),
+        'gap_time_s': round(gap_time, 1),
+    }
+
+    summary = []
+    for channel, channel_stats in zip(channels, stats):
+        n = channel_stats.samples
+        mean = channel_stats.shift + channel_stats.total / n if n else None
+        variance = (channel_stats.total_sq - channel_stats.total ** 2 / n) / (n - 1) if n > 1 else None
+        summary.append({
+            **file_fields,
+            'channel': channel,
+            'thermocouple': thermocouple_types[channel],
+            'samples': n,
+            'missing': channel_stats.missing,
+            'min': round(channel_stats.minimum, 2) if n else '',
+            'max': round(channel_stats.maximum, 2) if n else '',
+            'mean': round(mean, 2) if mean is not None else '',
+            'std': round(math.sqrt(max(variance, 0.0)), 3) if variance is not None else '',
+            'time_above_s': round(channel_stats.time_above, 1) if set_temperature is not None else '',
+            'above_pct': round(100 * channel_stats.time_above / logged_time, 1) if set_temperature is not None and logged_time > 0 else '',
+            'longest_flat_s': round(channel_stats.longest_flat, 1),
+            'stuck': 'yes' if channel_stats.longest_flat >= stuck_seconds else '',
+        })
+    return summary
+
+
+def _analyze_task(args):
+    path = args[0]
+    try:
+        return path, analyze_log(*args), None
+    except (OSError, ValueError, csv.Error) as e:
+        return path, [], str(e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise temperature_log_*.csv files in parallel.")
+    parser.add_argument("paths", nargs='+', help="log files, directories or glob patterns")
+    parser.add_argument("--set-temperature", type=float, help="set point for the time-above columns")
+    parser.add_argument("--gap-seconds", type=float, help="interval counted as a logging gap (default: 3x the typical interval)")
+    parser.add_argument("--stuck-minutes", type=float, default=10.0, help="identical readings for this long flag a stuck sensor")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--output", default='log_summary.csv', help="summary CSV to write, or - for stdout")
+    args = parser.parse_args(argv)
+
+    paths = expand_paths(args.paths)
+    if not paths:
+        parser.error("no log files found")
+
+    tasks = [(path, args.set_temperature, args.gap_seconds, args.stuck_minutes * 60) for path in paths]
+    started = time.perf_counter()
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    failures = 0
+    rows = 0
+    try:
+        writer = csv.DictWriter(output, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        pool = ProcessPoolExecutor(max_workers=min(args.workers, len(tasks))) if args.workers > 1 and len(tasks) > 1 else None
+        try:
+            # Results come back in file order and are written as they arrive.
+            for path, summary, error in (pool.map(_analyze_task, tasks) if pool else map(_analyze_task, tasks)):
+                if error:
+                    failures += 1
+                    print(f"Skipped {path}: {error}", file=sys.stderr)
+                    continue
+                writer.writerows(summary)
+                rows += summary[0]['rows'] if summary else 0
+        finally:
+            if pool:
+                pool.shutdown()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Analysed {len(paths) - failures} of {len(paths)} files ({rows} rows) in {elapsed:.1f} s"
+          + (f"; summary written to {args.output}" if args.output != '-' else ''), file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,975 @@
+"""Offline benchmark suite for the acquisition, logging and rendering hot paths.
+
+Run from anywhere:
+
+    python benchmarks/run_benchmarks.py                 # run, write results, compare to baseline
+    python benchmarks/run_benchmarks.py --update-baseline
+
+Results are written as JSON to benchmarks/results/latest.json and compared
+against benchmarks/baseline.json. The exit code is 1 when any metric regressed
+by more than --tolerance. Tk based benchmarks are skipped when no display is
+available.
+"""
+import argparse
+import asyncio
+import csv
+import importlib.util
+import io
+import json
+import logging
+import math
+import os
+import platform
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_PATH = ROOT / "Base Plate Monitoring System.py"
+DEFAULT_OUTPUT = ROOT / "benchmarks" / "results" / "latest.json"
+DEFAULT_BASELINE = ROOT / "benchmarks" / "baseline.json"
+
+sys.path.insert(0, str(ROOT))
+
+
+def load_app_module():
+    import matplotlib
+    matplotlib.use("Agg")
+    os.chdir(ROOT)
+    spec = importlib.util.spec_from_file_location("base_plate_monitoring_system", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class _Value:
+    def __init__(self, value):
+        self._value = value
+
+    def get(self):
+        return self._value
+
+
+_scratch_directory = tempfile.TemporaryDirectory(prefix="benchmarks_")
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class BenchmarkRun:
+    def __init__(self):
+        self.results = {}
+        self.skipped = {}
+
+    def record(self, name, value, unit, higher_is_better):
+        # Repeated runs keep the best observation, which is far less sensitive
+        # to scheduler noise than the mean of all runs.
+        previous = self.results.get(name)
+        if previous is not None:
+            better = value > previous["value"] if higher_is_better else value < previous["value"]
+            if not better:
+                return
+        self.results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+    def skip(self, name, reason):
+        self.skipped[name] = reason
+
+    def print_summary(self):
+        for name, result in self.results.items():
+            print(f"  {name:<45} {result['value']:>14.3f} {result['unit']}")
+        for name, reason in self.skipped.items():
+            print(f"  {name:<45} skipped ({reason})")
+
+
+def bench_read_loop(run, channel_counts, latency, cycles):
+    from acquisition import AcquisitionEngine
+    from instrument import ConnectionState, VisaCommunication
+    from sim_instrument import SimulatedInstrument
+
+    async def measure(channels):
+        comm = VisaCommunication("SIM::INSTR")
+        comm.inst = SimulatedInstrument(latency=latency, seed=1)
+        comm.state = ConnectionState.CONNECTED
+        comm.last_heartbeat = asyncio.get_running_loop().time()
+        engine = AcquisitionEngine(emit=lambda message: None, ring=None)
+        engine.visa_comm = comm
+        engine.thermocouple_types = {ch: "T" for ch in channels}
+
+        cycle_times = []
+        start = time.perf_counter()
+        for _ in range(cycles):
+            cycle_start = time.perf_counter()
+            for channel in channels:
+                await engine.read_temperature(channel)
+            cycle_times.append(time.perf_counter() - cycle_start)
+        total = time.perf_counter() - start
+        return len(channels) * cycles / total, cycle_times
+
+    for count in channel_counts:
+        channels = [101 + (i % 20) + 100 * (i // 20) for i in range(count)]
+        samples_per_s, cycle_times = asyncio.run(measure(channels))
+        run.record(f"read_loop.{count}ch.samples_per_s", samples_per_s, "samples/s", True)
+        run.record(f"read_loop.{count}ch.cycle_ms_mean", statistics.mean(cycle_times) * 1000, "ms", False)
+        run.record(f"read_loop.{count}ch.cycle_ms_p95", _percentile(cycle_times, 95) * 1000, "ms", False)
+
+
+def bench_bad_channel(run, latency, cycles, channels=20):
+    from acquisition import AcquisitionEngine
+    from instrument import ConnectionState, ScpiSocketCommunication, VisaCommunication
+    from sim_instrument import SimulatedInstrument
+
+    # One channel fails every read, like an open thermocouple or missing card.
+    async def measure():
+        comm = VisaCommunication("SIM::INSTR")
+        comm.inst = SimulatedInstrument(latency=latency, seed=1)
+        comm.inst.failing_channels.add(105)
+        comm.state = ConnectionState.CONNECTED
+        comm.last_heartbeat = asyncio.get_running_loop().time()
+        engine = AcquisitionEngine(emit=lambda message: None, ring=None)
+        engine.visa_comm = comm
+        engine.thermocouple_types = {101 + i: "T" for i in range(channels)}
+
+        cycle_times = []
+        for _ in range(cycles):
+            cycle_start = time.perf_counter()
+            await engine.read_temperatures(list(engine.thermocouple_types))
+            cycle_times.append(time.perf_counter() - cycle_start)
+        return cycle_times, comm.state, engine.channel_health.quarantined()
+
+    # The same over the raw SCPI socket, where the channel answers with the
+    # overload reading.
+    async def measure_socket(port):
+        comm = ScpiSocketCommunication(f"TCPIP::127.0.0.1::{port}::SOCKET")
+        await comm.connect()
+        try:
+            engine = AcquisitionEngine(emit=lambda message: None, ring=None)
+            engine.visa_comm = comm
+            engine.thermocouple_types = {101 + i: "T" for i in range(channels)}
+            cycle_times = []
+            for _ in range(cycles):
+                cycle_start = time.perf_counter()
+                await engine.read_temperatures(list(engine.thermocouple_types))
+                cycle_times.append(time.perf_counter() - cycle_start)
+            return cycle_times, comm.state, engine.channel_health.quarantined()
+        finally:
+            await comm.disconnect()
+
+    # A channel on a missing card gets no answer at all. Pipelined answers
+    # are matched by position, so the scan must not shift its neighbours'
+    # readings onto it. Each channel reads its own number / 10.
+    async def measure_silent(port):
+        comm = ScpiSocketCommunication(f"TCPIP::127.0.0.1::{port}::SOCKET")
+        comm.timeout = 0.2
+        await comm.connect()
+        try:
+            engine = AcquisitionEngine(emit=lambda message: None, ring=None)
+            engine.visa_comm = comm
+            engine.thermocouple_types = {101 + i: "T" for i in range(8)}
+            cycle_times = []
+            for _ in range(3):
+                cycle_start = time.perf_counter()
+                readings = await engine.read_temperatures(list(engine.thermocouple_types))
+                cycle_times.append(time.perf_counter() - cycle_start)
+                wrong = {channel: reading.value for channel, reading in readings.items()
+                         if reading.value != (None if channel == 105 else channel / 10)}
+                if wrong:
+                    raise RuntimeError(f"an unanswered query shifted pipelined readings: {wrong}")
+            return cycle_times, comm.state, engine.channel_health.quarantined()
+        finally:
+            await comm.disconnect()
+
+    silent = SimulatedInstrument(latency=latency)
+    silent.temperature = lambda channel: channel / 10
+    silent.silent_channels.add(105)
+
+    logger = logging.getLogger()
+    level = logger.level
+    logger.setLevel(logging.CRITICAL)
+    loop, server, port = _start_scpi_server(latency, failing_channels={105})
+    silent_loop, silent_server, silent_port = _start_scpi_server(latency, instrument=silent)
+    try:
+        results = {f"{channels}ch": asyncio.run(measure()), f"socket.{channels}ch": asyncio.run(measure_socket(port)),
+                   "socket_silent.8ch": asyncio.run(measure_silent(silent_port))}
+    finally:
+        logger.setLevel(level)
+        for server_loop, scpi_server in ((loop, server), (silent_loop, silent_server)):
+            scpi_server.close()
+            server_loop.call_soon_threadsafe(server_loop.stop)
+    for label, (cycle_times, state, quarantined) in results.items():
+        if state != ConnectionState.CONNECTED:
+            raise RuntimeError(f"a failing channel dropped the connection ({label})")
+        if quarantined != [105]:
+            raise RuntimeError(f"the failing channel was not quarantined ({label}: {quarantined})")
+        # The first cycles pay for the failures until the channel is quarantined.
+        run.record(f"bad_channel.{label}.first_cycle_ms", cycle_times[0] * 1000, "ms", False)
+        run.record(f"bad_channel.{label}.cycle_ms_mean", statistics.mean(cycle_times) * 1000, "ms", False)
+
+
+def bench_fan_zones(run, latency, ticks, zones=5):
+    from acquisition import FanZone, ZoneController
+    from instrument import ConnectionState, VisaCommunication
+    from sim_instrument import SimulatedInstrument
+
+    # Worst case: every zone's relay changes state on every tick.
+    async def measure(batched):
+        comm = VisaCommunication("SIM::INSTR")
+        comm.inst = SimulatedInstrument(latency=latency, seed=1)
+        comm.state = ConnectionState.CONNECTED
+        comm.last_heartbeat = asyncio.get_running_loop().time()
+        controller = ZoneController([FanZone(f"Zone {i + 1}", [101 + 4 * i + j for j in range(4)], 40.0, 201 + i)
+                                     for i in range(zones)], configured=True)
+        tick_times = []
+        writes = 0
+        for tick in range(ticks):
+            value = 45.0 if tick % 2 == 0 else 35.0
+            temperatures = {ch: value for zone in controller.zones for ch in zone.channels}
+            start = time.perf_counter()
+            close, open_, switched = controller.evaluate(temperatures)
+            if batched:
+                commands = controller.commands(close, open_)
+            else:
+                commands = [f"ROUTE:{'CLOSE' if relay in close else 'OPEN'} (@{relay})" for relay in close + open_]
+            for command in commands:
+                await comm.write(command)
+            tick_times.append(time.perf_counter() - start)
+            writes += len(commands)
+            expected = {zone.relay for zone in controller.zones} if value > 40.0 else set()
+            if comm.inst.closed_relays != expected:
+                raise RuntimeError(f"relays {sorted(comm.inst.closed_relays)} after tick {tick}, expected {sorted(expected)}")
+        return statistics.mean(tick_times), writes / ticks
+
+    for mode, batched in (("batched", True), ("per_relay", False)):
+        tick_time, writes = asyncio.run(measure(batched))
+        run.record(f"fan_zones.{zones}z.{mode}_tick_ms", tick_time * 1000, "ms", False)
+        run.record(f"fan_zones.{zones}z.{mode}_writes_per_tick", writes, "writes", False)
+
+
+def bench_logging(run, records):
+    import logging.handlers
+    import queue
+    from log_handlers import LogWriter, QueueingHandler, RateLimitFilter
+
+    # An error storm from one call site, as from a channel that fails every read.
+    def storm(logger):
+        start = time.perf_counter()
+        for i in range(records):
+            logger.error(f"Error reading temperature from channel {101 + i % 20}: VI_ERROR_TMO")
+        return (time.perf_counter() - start) / records * 1e6
+
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = logging.getLogger("benchmarks.logging.sync")
+        logger.propagate = False
+        handler = logging.FileHandler(os.path.join(tmp, "sync.log"))
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+        run.record("logging.storm.sync_us_per_call", storm(logger), "us", False)
+        logger.removeHandler(handler)
+        handler.close()
+
+        logger = logging.getLogger("benchmarks.logging.queued")
+        logger.propagate = False
+        path = os.path.join(tmp, "queued.log")
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=10 * 1024 * 1024, backupCount=1)
+        handler.setFormatter(formatter)
+        log_queue = queue.Queue(maxsize=10000)
+        queue_handler = QueueingHandler(log_queue)
+        rate_limit = RateLimitFilter()
+        queue_handler.addFilter(rate_limit)
+        writer = LogWriter(log_queue, handler, queue_handler, rate_limit)
+        writer.start()
+        logger.addHandler(queue_handler)
+        run.record("logging.storm.queued_us_per_call", storm(logger), "us", False)
+        logger.removeHandler(queue_handler)
+        writer.stop()
+        with open(path) as f:
+            run.record("logging.storm.queued_lines", sum(1 for _ in f), "lines", False)
+
+
+class _BlockingSocketResource:
+    """Blocking raw SCPI socket with the query/write/close shape of a pyvisa-py SOCKET session."""
+
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile('rb')
+
+    def write(self, command):
+        self.sock.sendall(command.encode() + b"\n")
+        return len(command)
+
+    def query(self, command):
+        self.write(command)
+        return self.file.readline().decode().strip()
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def _start_scpi_server(latency, failing_channels=(), instrument=None):
+    from sim_instrument import SimulatedInstrument, serve_scpi
+
+    # The server gets its own loop and thread so it doesn't compete with the client loop.
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    if instrument is None:
+        instrument = SimulatedInstrument(latency=latency, seed=1)
+    instrument.failing_channels.update(failing_channels)
+    server = asyncio.run_coroutine_threadsafe(serve_scpi(instrument, port=0), loop).result()
+    return loop, server, server.sockets[0].getsockname()[1]
+
+
+def bench_scpi_transport(run, queries, latency, channels=20):
+    from acquisition import AcquisitionEngine
+    from instrument import ConnectionState, ScpiSocketCommunication, VisaCommunication
+
+    def open_visa_resource(port):
+        try:
+            import pyvisa
+            return pyvisa.ResourceManager('@py').open_resource(f"TCPIP::127.0.0.1::{port}::SOCKET", read_termination='\n', write_termination='\n'), "pyvisa"
+        except (ImportError, ValueError, OSError):
+            return _BlockingSocketResource('127.0.0.1', port), "visa_thread"
+
+    async def measure(transport, port, server_latency):
+        if transport == "asyncio":
+            comm = ScpiSocketCommunication(f"TCPIP::127.0.0.1::{port}::SOCKET")
+            await comm.connect()
+            label = transport
+        else:
+            comm = VisaCommunication(f"TCPIP::127.0.0.1::{port}::SOCKET")
+            comm.inst, label = open_visa_resource(port)
+            comm.state = ConnectionState.CONNECTED
+            comm.last_heartbeat = asyncio.get_running_loop().time()
+        try:
+            engine = AcquisitionEngine(emit=lambda message: None, ring=None)
+            engine.visa_comm = comm
+            engine.thermocouple_types = {101 + i: "T" for i in range(channels)}
+            if server_latency == 0:
+                times = []
+                for _ in range(queries):
+                    start = time.perf_counter()
+                    await comm.query("MEAS:TEMP? TC,T,(@101)")
+                    times.append(time.perf_counter() - start)
+                run.record(f"scpi.{label}.query_us_mean", statistics.mean(times) * 1e6, "us", False)
+                run.record(f"scpi.{label}.query_us_p95", _percentile(times, 95) * 1e6, "us", False)
+            else:
+                start = time.perf_counter()
+                for _ in range(max(2, queries // 100)):
+                    await engine.read_temperatures(list(engine.thermocouple_types))
+                run.record(f"scpi.{label}.{channels}ch_cycle_ms", (time.perf_counter() - start) / max(2, queries // 100) * 1000, "ms", False)
+        finally:
+            await comm.disconnect()
+
+    for server_latency in (0.0, latency):
+        loop, server, port = _start_scpi_server(server_latency)
+        try:
+            for transport in ("visa", "asyncio"):
+                asyncio.run(measure(transport, port, server_latency))
+        finally:
+            server.close()
+            loop.call_soon_threadsafe(loop.stop)
+
+
+def bench_adaptive_interval(run, hours=8, channels=20):
+    from acquisition import AdaptiveInterval
+
+    # Ramp to 80 °C over 1 h, soak, then cool down over the last hour.
+    def profile(t):
+        ramp = 3600.0
+        if t < ramp:
+            return 25.0 + 55.0 * t / ramp
+        if t < hours * 3600 - ramp:
+            return 80.0
+        return 80.0 - 55.0 * (t - (hours * 3600 - ramp)) / ramp
+
+    adaptive = AdaptiveInterval(1.0, 60.0)
+    t = 0.0
+    samples = 0
+    start = time.perf_counter()
+    while t < hours * 3600:
+        base = profile(t)
+        temperatures = {101 + i: base + ((int(t) * 7919 + i) % 11 - 5) / 100 for i in range(channels)}
+        t += adaptive.update(t, temperatures, 100.0)
+        samples += 1
+    elapsed = time.perf_counter() - start
+    run.record(f"adaptive.{hours}h_soak.sample_fraction", samples / (hours * 3600), "of fixed", False)
+    run.record("adaptive.update_us", elapsed / samples * 1e6, "us", False)
+
+
+def bench_csv(run, rows):
+    from acquisition import format_csv_row
+
+    channels = list(range(101, 121))
+    timestamp = datetime.now()
+    temperatures = {ch: 25.0 + ch / 100 for ch in channels}
+
+    start = time.perf_counter()
+    for _ in range(rows):
+        format_csv_row(timestamp, 26.04, temperatures, channels, "Fan Stopped")
+    run.record("csv.format_rows_per_s", rows / (time.perf_counter() - start), "rows/s", True)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    start = time.perf_counter()
+    for _ in range(rows):
+        writer.writerow(format_csv_row(timestamp, 26.04, temperatures, channels, "Fan Stopped"))
+    run.record("csv.format_and_write_rows_per_s", rows / (time.perf_counter() - start), "rows/s", True)
+
+
+def bench_analyze_log(run, rows):
+    from acquisition import format_csv_row
+    from analyze_logs import analyze_log
+
+    channels = list(range(101, 161))
+    path = os.path.join(_scratch_directory.name, "temperature_log_bench.csv")
+    start_time = datetime(2024, 1, 1)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(['Timestamp', 'Average Temperature'] + [f'Temp (Ch {ch} T)' for ch in channels] + ['Fan Status'])
+        for i in range(rows):
+            temperatures = {ch: 25.0 + ((i * 7919 + ch) % 50) / 10 for ch in channels}
+            writer.writerow(format_csv_row(start_time + timedelta(seconds=i), 27.5, temperatures, channels, "Fan Rotating" if i % 3 else "Fan Stopped"))
+
+    start = time.perf_counter()
+    analyze_log(path, set_temperature=27.0)
+    run.record("analyze_log.60ch.rows_per_s", rows / (time.perf_counter() - start), "rows/s", True)
+    os.remove(path)
+
+
+def bench_warm_restart(run, rows):
+    from acquisition import format_csv_row
+    from replay import ReplaySource, read_tail_samples
+
+    channels = list(range(101, 161))
+    path = os.path.join(_scratch_directory.name, "temperature_log_restart.csv")
+    start_time = datetime(2024, 1, 1)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(['Timestamp', 'Average Temperature'] + [f'Temp (Ch {ch} T)' for ch in channels] + ['Fan Status'])
+        for i in range(rows):
+            temperatures = {ch: 25.0 + ((i * 7919 + ch) % 50) / 10 for ch in channels}
+            writer.writerow(format_csv_row(start_time + timedelta(seconds=i), 27.5, temperatures, channels, "Fan Stopped"))
+
+    # Reading the tail backwards against parsing the whole log to reach it.
+    for tail in (100, 3600):
+        start = time.perf_counter()
+        samples = read_tail_samples(path, tail)
+        run.record(f"warm_restart.60ch.tail_{tail}_ms", (time.perf_counter() - start) * 1000, "ms", False)
+        if len(samples) != min(tail, rows):
+            raise RuntimeError(f"read {len(samples)} tail rows, expected {min(tail, rows)}")
+    start = time.perf_counter()
+    deque(ReplaySource(path), maxlen=100)
+    run.record("warm_restart.60ch.full_parse_ms", (time.perf_counter() - start) * 1000, "ms", False)
+    os.remove(path)
+
+
+def bench_report(run, rows):
+    from acquisition import format_csv_row
+    from report import render_report
+
+    channels = list(range(101, 161))
+    path = os.path.join(_scratch_directory.name, "temperature_log_report.csv")
+    start_time = datetime(2024, 1, 1)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(['Timestamp', 'Average Temperature'] + [f'Temp (Ch {ch} T)' for ch in channels] + ['Fan Status'])
+        for i in range(rows):
+            temperatures = {ch: 25.0 + ((i * 7919 + ch) % 50) / 10 for ch in channels}
+            writer.writerow(format_csv_row(start_time + timedelta(seconds=i), 27.5, temperatures, channels, "Fan Rotating" if i % 3 else "Fan Stopped"))
+
+    # Parsing, statistics, decimation and the Agg render of one session.
+    output = os.path.join(_scratch_directory.name, "temperature_log_report.png")
+    start = time.perf_counter()
+    render_report(path, output, set_temperature=27.0)
+    elapsed = time.perf_counter() - start
+    run.record("report.60ch.render_s", elapsed, "s", False)
+    run.record("report.60ch.rows_per_s", rows / elapsed, "rows/s", True)
+    os.remove(path)
+    os.remove(output)
+
+
+def bench_sample_ring(run, samples):
+    from acquisition import SampleRing
+
+    channels = [101 + (i % 20) + 100 * (i // 20) for i in range(60)]
+    temperatures = {ch: 25.0 + ch / 100 for ch in channels}
+    # One spare slot: a reader a whole ring behind drops the slot being rewritten.
+    ring = SampleRing(capacity=samples + 1)
+    try:
+        ring.begin_session(channels)
+        start = time.perf_counter()
+        for i in range(samples):
+            ring.publish(float(i), 26.0, False, temperatures)
+        run.record("sample_ring.60ch.publish_per_s", samples / (time.perf_counter() - start), "samples/s", True)
+
+        start = time.perf_counter()
+        read = ring.read_new()
+        run.record("sample_ring.60ch.read_per_s", len(read) / (time.perf_counter() - start), "samples/s", True)
+    finally:
+        ring.close()
+
+
+def bench_animate_plot(app, run, history_sizes, frames):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    channels = [101, 102, 103]
+    for size in history_sizes:
+        harness = type("PlotHarness", (), {})()
+        harness.fig = Figure(figsize=(5, 4), dpi=100)
+        FigureCanvasAgg(harness.fig)
+        harness.ax = harness.fig.add_subplot(111)
+        harness.current_theme = "radiance"
+        harness.channels = channels
+        harness.plot_mode = "points"
+        harness.update_render_state = lambda redraw=False: None
+        start_time = datetime.now()
+        harness.plot_data = {'time': deque((start_time + timedelta(seconds=i) for i in range(size)), maxlen=size)}
+        for ch in channels:
+            harness.plot_data[ch] = deque((25.0 + (i % 50) / 10 for i in range(size)), maxlen=size)
+        harness.plot_data['average'] = deque((25.0 + (i % 50) / 10 for i in range(size)), maxlen=size)
+
+        frame_times = []
+        for i in range(frames):
+            frame_start = time.perf_counter()
+            app.TemperatureMonitorApp.animate_plot(harness, i)
+            harness.fig.canvas.draw()
+            frame_times.append(time.perf_counter() - frame_start)
+        run.record(f"animate_plot.{size}pts.frame_ms_mean", statistics.mean(frame_times) * 1000, "ms", False)
+
+
+_envelope_histories = {}
+
+
+def bench_animate_plot_envelope(app, run, history_sizes, frames):
+    import matplotlib.dates as mdates
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from plot_history import EnvelopeHistory
+
+    channels = [101, 102, 103]
+    start = mdates.date2num(datetime.now())
+    for size in history_sizes:
+        history = _envelope_histories.get(size)
+        if history is None:
+            history = EnvelopeHistory(capacity=size)
+            for i in range(size):
+                # Slow thermal drift (8 h period) with a little sensor noise.
+                value = 25.0 + 5.0 * math.sin(i * 2 * math.pi / 28800) + ((i * 7919) % 13) / 100
+                history.append(start + i / 86400, {'average': value, 101: value, 102: value + 1, 103: value - 1})
+            _envelope_histories[size] = history
+
+        harness = type("PlotHarness", (), {})()
+        harness.fig = Figure(figsize=(5, 4), dpi=100)
+        FigureCanvasAgg(harness.fig)
+        harness.ax = harness.fig.add_subplot(111)
+        harness.current_theme = "radiance"
+        harness.channels = channels
+        harness.plot_mode = "envelope"
+        harness.history = history
+        harness.plot_window_var = _Value("All")
+        harness.plot_envelope = types.MethodType(app.TemperatureMonitorApp.plot_envelope, harness)
+        harness.update_render_state = lambda redraw=False: None
+
+        frame_times = []
+        for i in range(frames):
+            frame_start = time.perf_counter()
+            app.TemperatureMonitorApp.animate_plot(harness, i)
+            harness.fig.canvas.draw()
+            frame_times.append(time.perf_counter() - frame_start)
+        run.record(f"animate_plot_envelope.{size}pts.frame_ms_mean", statistics.mean(frame_times) * 1000, "ms", False)
+
+
+def bench_history_memory(run, hours, channels=8):
+    from plot_history import EnvelopeHistory
+
+    samples = int(hours * 3600)
+    for name, kwargs in (("uncompressed", {}), ("compressed", {"first_level_bits": 4, "block_size": 256})):
+        history = EnvelopeHistory(capacity=604800, **kwargs)
+        start = time.perf_counter()
+        for i in range(samples):
+            drift = 25.0 + 5.0 * math.sin(i * 2 * math.pi / 28800)
+            history.append(19000 + i / 86400, {ch: round(drift + ch / 10 + ((i * 7919 + ch) % 5 - 2) / 10, 1) for ch in range(channels)})
+        run.record(f"history.{name}.append_us", (time.perf_counter() - start) / samples * 1e6, "us", False)
+        run.record(f"history.{name}.bytes_per_channel_day", history.memory_per_channel_day(), "bytes", False)
+
+        t0 = history.first_time()
+        start = time.perf_counter()
+        for ch in range(channels):
+            history.values(ch, t0, t0 + 1 / 24)
+        run.record(f"history.{name}.decode_1h_ms", (time.perf_counter() - start) / channels * 1000, "ms", False)
+
+
+_history_store = None
+
+
+def bench_sqlite(run, readings, channels=60, rollup_days=90, rollup_channels=4):
+    global _history_store
+    from storage import HistoryStore, ROLLUP_UPSERT
+
+    path = os.path.join(_scratch_directory.name, "insert.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    store = HistoryStore(path)
+    try:
+        start_ts = 1.7e9
+        batch = [(start_ts + i, {ch: 25.0 + ((i * 7919 + ch) % 50) / 10 for ch in range(channels)}) for i in range(readings)]
+        start = time.perf_counter()
+        for i in range(0, readings, 10):
+            store.insert(batch[i:i + 10])
+        run.record("sqlite.60ch.insert_rows_per_s", readings * channels / (time.perf_counter() - start), "rows/s", True)
+
+        # Importing the same readings again (replay.py --sqlite run twice) adds nothing.
+        counted = store.connection.execute("SELECT sum(count) FROM rollup_1m").fetchone()[0]
+        start = time.perf_counter()
+        added = sum(store.insert(batch[i:i + 10]) for i in range(0, readings, 10))
+        run.record("sqlite.60ch.reimport_rows_per_s", readings * channels / (time.perf_counter() - start), "rows/s", True)
+        if added or store.connection.execute("SELECT sum(count) FROM rollup_1m").fetchone()[0] != counted:
+            raise RuntimeError("re-imported readings were counted in the rollups again")
+    finally:
+        store.close()
+
+    # Months of rollups are generated directly rather than through insert().
+    if _history_store is None:
+        _history_store = HistoryStore(os.path.join(_scratch_directory.name, "rollups.db"))
+        for table, width in (("rollup_1m", 60), ("rollup_1h", 3600)):
+            rows = [(ch, int(start_ts) // width * width + i * width, 24.0, 26.0, 25.0 * width, width)
+                    for ch in range(rollup_channels) for i in range(rollup_days * 86400 // width)]
+            with _history_store.connection:
+                _history_store.connection.executemany(ROLLUP_UPSERT.format(table=table), rows)
+    end_ts = start_ts + rollup_days * 86400
+    for name, query in (("1m.1day", (1, end_ts - 86400, end_ts, '1m')),
+                        ("1h.30days", (1, end_ts - 30 * 86400, end_ts, '1h')),
+                        ("1h.30days_all_channels", (None, end_ts - 30 * 86400, end_ts, '1h'))):
+        start = time.perf_counter()
+        for _ in range(10):
+            _history_store.query(*query)
+        run.record(f"sqlite.query.{name}_ms", (time.perf_counter() - start) / 10 * 1000, "ms", False)
+
+
+def _create_tk_root():
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return None, str(e).splitlines()[0]
+    root.withdraw()
+    return root, None
+
+
+class _CountingLabel:
+    def __init__(self):
+        self.reconfigurations = 0
+
+    def config(self, **options):
+        self.reconfigurations += 1
+
+
+def _readout_messages(channels, count):
+    # Slow drift at the 0.1 °C display resolution, as on a soaking plate.
+    for i in range(count):
+        yield {
+            'temperatures': {ch: 25.0 + ((i // (5 + ch % 7)) % 20) / 10 for ch in channels},
+            'average': 26.0 + (i // 30) / 10,
+        }
+
+
+def _readout_harness(app, labels, average_label, update_idletasks):
+    harness = type("GuiHarness", (), {})()
+    harness.temperature_labels = labels
+    harness.average_temp_label = average_label
+    harness.label_texts = {}
+    harness.quarantined_channels = set()
+    harness.set_label_text = types.MethodType(app.TemperatureMonitorApp.set_label_text, harness)
+    harness.update_idletasks = update_idletasks
+    return harness
+
+
+_STARTUP_SCRIPT = """
+import importlib.util, json, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("app", sys.argv[1])
+app = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app)
+imported = time.perf_counter()
+for name in app.PLOT_MODULES + app.VIDEO_MODULES:
+    importlib.import_module(name)
+print(json.dumps({"module": imported - start, "deferred": time.perf_counter() - imported}))
+"""
+
+
+def bench_startup(run):
+    import subprocess
+
+    # A fresh interpreter each time; what blocks the window is the module
+    # import, the deferred imports run after it is up.
+    output = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT, str(APP_PATH)], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    run.record("startup.module_import_ms", timings["module"] * 1000, "ms", False)
+    run.record("startup.deferred_import_ms", timings["deferred"] * 1000, "ms", False)
+
+
+def bench_readout(app, run, messages):
+    channels = [101 + (i % 20) + 100 * (i // 20) for i in range(60)]
+    labels = {ch: _CountingLabel() for ch in channels}
+    harness = _readout_harness(app, labels, _CountingLabel(), lambda: None)
+
+    start = time.perf_counter()
+    for message in _readout_messages(channels, messages):
+        app.TemperatureMonitorApp.update_gui(harness, message)
+    elapsed = time.perf_counter() - start
+    reconfigurations = sum(label.reconfigurations for label in labels.values())
+    run.record("readout.60ch.update_us", elapsed / messages * 1e6, "us", False)
+    run.record("readout.60ch.reconfigs_per_message", reconfigurations / messages, "labels", False)
+
+
+def bench_update_gui(app, run, messages, root):
+    from tkinter import ttk
+
+    if root is None:
+        run.skip("update_gui.60ch.message_us_mean", "no display")
+        return
+
+    channels = [101 + (i % 20) + 100 * (i // 20) for i in range(60)]
+    labels = {ch: ttk.Label(root, text="N/A") for ch in channels}
+    harness = _readout_harness(app, labels, ttk.Label(root, text="Average Temperature: N/A"), root.update_idletasks)
+
+    durations = []
+    for message in _readout_messages(channels, messages):
+        start = time.perf_counter()
+        app.TemperatureMonitorApp.update_gui(harness, message)
+        durations.append(time.perf_counter() - start)
+    run.record("update_gui.60ch.message_us_mean", statistics.mean(durations) * 1e6, "us", False)
+
+
+def bench_video_frame(app, run, frames, root):
+    import cv2
+    import numpy as np
+
+    cap = cv2.VideoCapture(app.config.get('paths', 'rotating_video', fallback='videos/rotating_fan.mp4'))
+    ok, frame = cap.read()
+    cap.release()
+    if not ok:
+        frame = np.random.default_rng(0).integers(0, 255, size=(720, 1280, 3), dtype=np.uint8)
+
+    start = time.perf_counter()
+    images = [app.prepare_video_frame(frame) for _ in range(frames)]
+    run.record("video.prepare_frame_ms", (time.perf_counter() - start) / frames * 1000, "ms", False)
+
+    if root is None:
+        run.skip("video.photoimage_ms", "no display")
+        return
+    from PIL import ImageTk
+    start = time.perf_counter()
+    for img in images:
+        ImageTk.PhotoImage(image=img)
+    run.record("video.photoimage_ms", (time.perf_counter() - start) / frames * 1000, "ms", False)
+
+
+class _PausableAnimation:
+    def __init__(self):
+        self.running = True
+
+    def pause(self):
+        self.running = False
+
+    def resume(self):
+        self.running = True
+
+
+def bench_idle_render(app, run, seconds, frame_rate=30):
+    # Simulated wall-clock seconds of the plot timer (1 Hz) and fan video
+    # (frame_rate) under each window state, measured as CPU time.
+    import cv2
+    import numpy as np
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    cap = cv2.VideoCapture(app.config.get('paths', 'rotating_video', fallback='videos/rotating_fan.mp4'))
+    ok, frame = cap.read()
+    cap.release()
+    if not ok:
+        frame = np.random.default_rng(0).integers(0, 255, size=(720, 1280, 3), dtype=np.uint8)
+
+    cls = app.TemperatureMonitorApp
+    scenarios = {
+        # name: (gated, monitoring, iconified, monitor tab selected)
+        "always_render": (False, True, False, True),
+        "monitoring_visible": (True, True, False, True),
+        "stopped": (True, False, False, True),
+        "other_tab": (True, True, False, False),
+        "iconified": (True, True, True, True),
+    }
+    channels = [101, 102, 103]
+    for name, (gated, monitoring, iconified, tab_selected) in scenarios.items():
+        harness = type("RenderHarness", (), {})()
+        harness.fig = Figure(figsize=(5, 4), dpi=100)
+        FigureCanvasAgg(harness.fig)
+        harness.canvas = harness.fig.canvas
+        harness.ax = harness.fig.add_subplot(111)
+        harness.current_theme = "radiance"
+        harness.channels = channels
+        harness.plot_mode = "points"
+        start_time = datetime.now()
+        harness.plot_data = {'time': deque((start_time + timedelta(seconds=i) for i in range(100)), maxlen=100)}
+        for key in channels + ['average']:
+            harness.plot_data[key] = deque((25.0 + (i % 50) / 10 for i in range(100)), maxlen=100)
+        harness.ani = _PausableAnimation()
+        harness.plot_paused = False
+        harness.plot_dirty = True
+        harness.video_active = False
+        harness.video_resumed = asyncio.Event()
+        harness.current_video = None
+        harness.is_monitoring = monitoring
+        harness.window_iconified = iconified
+        harness.window_obscured = False
+        harness.monitor_tab_selected = tab_selected
+        harness.video_playing = False
+
+        def play_video(video_path, harness=harness):
+            harness.video_playing = harness.video_active
+
+        def stop_video_playback(harness=harness):
+            harness.video_playing = False
+
+        harness.play_video = play_video
+        harness.stop_video_playback = stop_video_playback
+        for method in ("window_visible", "renderers_visible", "mark_plot_dirty"):
+            setattr(harness, method, types.MethodType(getattr(cls, method), harness))
+        if gated:
+            harness.update_render_state = types.MethodType(cls.update_render_state, harness)
+            harness.update_render_state()
+        else:
+            harness.update_render_state = lambda redraw=False: None
+            harness.video_playing = True
+
+        start = time.process_time()
+        for second in range(seconds):
+            if monitoring:
+                harness.plot_data['time'].append(start_time + timedelta(seconds=100 + second))
+                harness.mark_plot_dirty()
+            if harness.ani.running:
+                cls.animate_plot(harness, second)
+                harness.fig.canvas.draw()
+            if harness.video_playing:
+                for _ in range(frame_rate):
+                    app.prepare_video_frame(frame)
+        cpu_ms = (time.process_time() - start) / seconds * 1000
+        run.record(f"idle_render.{name}.cpu_ms_per_s", cpu_ms, "ms", False)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        current = results.get(name)
+        if current is None or not base["value"]:
+            continue
+        change = (current["value"] - base["value"]) / base["value"]
+        if not base["higher_is_better"]:
+            change = -change
+        status = "REGRESSION" if change < -tolerance else "ok"
+        print(f"  {name:<45} {base['value']:>12.3f} -> {current['value']:>12.3f} ({change:+.1%}) {status}")
+        if status != "ok":
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="simulated per-command instrument latency")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for smoke runs")
+    parser.add_argument("--repeat", type=int, default=3, help="repeat the suite and keep the best result per metric")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional slowdown before failing")
+    args = parser.parse_args(argv)
+
+    app = load_app_module()
+    run = BenchmarkRun()
+    root, root_error = _create_tk_root()
+    if root_error:
+        print(f"Tk unavailable: {root_error}")
+
+    scale = 0.2 if args.quick else 1.0
+    for repeat in range(args.repeat):
+        print(f"Run {repeat + 1}/{args.repeat}")
+        bench_read_loop(run, (3, 20, 60), args.latency_ms / 1000, cycles=max(2, int(10 * scale)))
+        bench_bad_channel(run, args.latency_ms / 1000, cycles=max(5, int(20 * scale)))
+        bench_scpi_transport(run, queries=int(2000 * scale), latency=args.latency_ms / 1000)
+        bench_fan_zones(run, args.latency_ms / 1000, ticks=max(4, int(20 * scale)))
+        bench_logging(run, records=int(20000 * scale))
+        bench_adaptive_interval(run)
+        bench_csv(run, rows=int(20000 * scale))
+        bench_sample_ring(run, samples=int(4096 * scale))
+        bench_analyze_log(run, rows=int(20000 * scale))
+        bench_warm_restart(run, rows=int(20000 * scale))
+        bench_report(run, rows=int(20000 * scale))
+        bench_animate_plot(app, run, (100, 1000, 10000), frames=max(2, int(10 * scale)))
+        bench_animate_plot_envelope(app, run, (10000, 100000, 300000), frames=max(2, int(10 * scale)))
+        bench_history_memory(run, hours=24 * scale)
+        bench_sqlite(run, readings=int(600 * scale))
+        bench_startup(run)
+        bench_readout(app, run, messages=int(500 * scale))
+        bench_update_gui(app, run, messages=int(500 * scale), root=root)
+        bench_video_frame(app, run, frames=max(5, int(100 * scale)), root=root)
+        bench_idle_render(app, run, seconds=max(2, int(5 * scale)))
+    run.print_summary()
+
+    if _history_store is not None:
+        _history_store.close()
+    if root is not None:
+        root.destroy()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency_ms": args.latency_ms,
+            "quick": args.quick,
+            "repeat": args.repeat,
+        },
+        "results": run.results,
+        "skipped": run.skipped,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print("No baseline found; run with --update-baseline to create one.")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline["meta"].get("latency_ms") != args.latency_ms:
+        print(f"Warning: baseline was recorded with latency {baseline['meta'].get('latency_ms')} ms")
+    print(f"Comparison against {args.baseline}")
+    regressions = compare(run.results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+import asyncio
+import logging
+import re
+from collections import deque
+from enum import Enum
+
+from settings import config
+from sim_instrument import SimulatedInstrument
+
+SUPPORTED_INSTRUMENTS = ("Keysight Technologies,DAQ970A", "HEWLETT-PACKARD,34970A")
+SOCKET_RESOURCE_RE = re.compile(r'^TCPIP\d*::([^:]+)::(\d+)::SOCKET$', re.IGNORECASE)
+
+
+class CommandError(Exception):
+    """A command failed, but the instrument still answers, so the connection is fine."""
+
+
+class ConnectionState(Enum):
+    DISCONNECTED = 0
+    CONNECTING = 1
+    CONNECTED = 2
+    RECONNECTING = 3
+
+
+def is_simulated_resource(resource_name):
+    return resource_name.upper().startswith('SIM')
+
+
+def parse_socket_resource(resource_name):
+    match = SOCKET_RESOURCE_RE.match(resource_name.strip())
+    return (match.group(1), int(match.group(2))) if match else None
+
+
+def create_communication(resource_name):
+    if parse_socket_resource(resource_name):
+        return ScpiSocketCommunication(resource_name)
+    return VisaCommunication(resource_name)
+
+
+def open_resource(resource_name):
+    if is_simulated_resource(resource_name):
+        return SimulatedInstrument(latency=config.getfloat('simulation', 'latency', fallback=0.0))
+    import pyvisa
+    rm = pyvisa.ResourceManager()
+    return rm.open_resource(resource_name)
+
+
+class VisaCommunication:
+    pipelined = False
+
+    def __init__(self, resource_name):
+        self.resource_name = resource_name
+        self.inst = None
+        self.state = ConnectionState.DISCONNECTED
+        self.lock = asyncio.Lock()
+        self.last_heartbeat = 0
+        self.heartbeat_interval = config.getint('connection', 'heartbeat_interval', fallback=5)
+
+    async def connect(self):
+        async with self.lock:
+            if self.state != ConnectionState.DISCONNECTED:
+                return
+
+            self.state = ConnectionState.CONNECTING
+            try:
+                self.inst = await asyncio.to_thread(open_resource, self.resource_name)
+                await asyncio.to_thread(self.inst.write, "*CLS")
+                self.state = ConnectionState.CONNECTED
+                self.last_heartbeat = asyncio.get_event_loop().time()
+            except Exception as e:
+                self.state = ConnectionState.DISCONNECTED
+                raise ConnectionError(f"Failed to connect: {str(e)}")
+
+    async def disconnect(self):
+        async with self.lock:
+            if self.state == ConnectionState.DISCONNECTED:
+                return
+
+            try:
+                if self.inst:
+                    await asyncio.to_thread(self.inst.close)
+            finally:
+                self.inst = None
+                self.state = ConnectionState.DISCONNECTED
+
+    async def _perform_operation(self, operation, command, max_retries=3):
+        async with self.lock:
+            if self.state != ConnectionState.CONNECTED:
+                raise ConnectionError("Not connected to the instrument")
+
+            current_time = asyncio.get_event_loop().time()
+            if current_time - self.last_heartbeat >= self.heartbeat_interval:
+                try:
+                    await asyncio.to_thread(self.inst.query, "*OPC?")
+                    self.last_heartbeat = current_time
+                except Exception as e:
+                    self.state = ConnectionState.DISCONNECTED
+                    raise ConnectionError(f"Heartbeat failed: {str(e)}")
+
+            for attempt in range(max_retries):
+                try:
+                    result = await asyncio.to_thread(operation, command)
+                    self.last_heartbeat = asyncio.get_event_loop().time()
+                    return result
+                except Exception as e:
+                    if attempt == max_retries - 1:
+                        # One bad command (an open thermocouple, a missing
+                        # card) must not take the whole connection down.
+                        if await self._instrument_responds():
+                            raise CommandError(f"{command} failed: {str(e)}")
+                        self.state = ConnectionState.DISCONNECTED
+                        raise ConnectionError(f"Operation failed after {max_retries} attempts: {str(e)}")
+                    await asyncio.sleep(1)
+
+    async def _instrument_responds(self):
+        try:
+            # Device clear drops any late answer so it can't be read as the
+            # response to a later query.
+            if hasattr(self.inst, 'clear'):
+                await asyncio.to_thread(self.inst.clear)
+            response = await asyncio.to_thread(self.inst.query, "*OPC?")
+        except Exception:
+            return False
+        self.last_heartbeat = asyncio.get_event_loop().time()
+        return response.strip() == "1"
+
+    async def query(self, command, max_retries=3):
+        return await self._perform_operation(self.inst.query, command, max_retries)
+
+    async def write(self, command, max_retries=3):
+        return await self._perform_operation(self.inst.write, command, max_retries)
+
+
+class ScpiSocketCommunication:
+    """Raw SCPI over TCP (TCPIP::host::5025::SOCKET) on asyncio streams.
+
+    Same query/write/heartbeat contract as VisaCommunication, without the
+    thread-pool hop. Commands go straight to the socket and a reader task hands
+    each response line to the oldest waiting query, so several queries can be
+    in flight at once. A cancelled query keeps its place in the queue and its
+    answer is discarded, so later responses stay in step. A query that gets no
+    answer within command_timeout is followed by *OPC?: since answers come in
+    order, the "1" shows that the instrument skipped the query (a CommandError,
+    as with VisaCommunication) and lines up the stream again. If *OPC? is not
+    answered either, the connection is dropped. Among pipelined queries a
+    skipped answer is only noticed at that point, after later answers have
+    moved up one place, so callers that pipeline must treat any failure as
+    spoiling the whole batch (AcquisitionEngine.read_pipelined re-reads it).
+    """
+    pipelined = True
+
+    def __init__(self, resource_name):
+        self.resource_name = resource_name
+        self.host, self.port = parse_socket_resource(resource_name)
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.pending = deque()
+        self.state = ConnectionState.DISCONNECTED
+        self.lock = asyncio.Lock()
+        self.last_heartbeat = 0
+        self.heartbeat_interval = config.getint('connection', 'heartbeat_interval', fallback=5)
+        self.timeout = config.getfloat('connection', 'command_timeout', fallback=5.0)
+
+    async def connect(self):
+        async with self.lock:
+            if self.state != ConnectionState.DISCONNECTED:
+                return
+
+            self.state = ConnectionState.CONNECTING
+            try:
+                self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+                self.reader_task = asyncio.get_running_loop().create_task(self._read_responses())
+                await self._send("*CLS", False)
+                self.state = ConnectionState.CONNECTED
+                self.last_heartbeat = asyncio.get_running_loop().time()
+            except Exception as e:
+                self._abort(ConnectionError("Connection closed"))
+                raise ConnectionError(f"Failed to connect: {str(e)}")
+
+    async def disconnect(self):
+        async with self.lock:
+            if self.state == ConnectionState.DISCONNECTED:
+                return
+
+            writer = self.writer
+            self._abort(ConnectionError("Connection closed"))
+            if writer:
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+    def _abort(self, error):
+        if self.reader_task and self.reader_task is not asyncio.current_task():
+            self.reader_task.cancel()
+        self.reader_task = None
+        while self.pending:
+            future, _ = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+        if self.writer:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+        self.state = ConnectionState.DISCONNECTED
+
+    async def _read_responses(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    raise ConnectionError("Connection closed by instrument")
+                response = line.decode(errors='replace').strip()
+                if response == "1":
+                    # Queries still waiting ahead of an *OPC? were skipped by
+                    # the instrument; no measurement answers a bare "1".
+                    while self.pending and not self.pending[0][1]:
+                        future, _ = self.pending.popleft()
+                        if not future.done():
+                            future.set_exception(CommandError("No response from the instrument"))
+                if not self.pending:
+                    logging.warning(f"Unexpected response from {self.resource_name}: {line!r}")
+                    continue
+                future, opc = self.pending[0]
+                if opc and response != "1" and not future.done():
+                    logging.warning(f"Late response from {self.resource_name} discarded: {line!r}")
+                    continue
+                self.pending.popleft()
+                if not future.done():
+                    future.set_result(response)
+        except (OSError, ConnectionError) as e:
+            logging.error(f"Connection to {self.resource_name} lost: {e}")
+            self._abort(ConnectionError(f"Connection lost: {e}"))
+
+    async def _send(self, command, expect_response):
+        if self.writer is None:
+            raise ConnectionError("Not connected to the instrument")
+        future = None
+        if expect_response:
+            future = asyncio.get_running_loop().create_future()
+            self.pending.append((future, command == "*OPC?"))
+        self.writer.write(command.encode() + b"\n")
+        await asyncio.wait_for(self.writer.drain(), self.timeout)
+        if future is None:
+            return len(command)
+        return await asyncio.wait_for(future, self.timeout)
+
+    async def _perform_operation(self, command, expect_response):
+        if self.state != ConnectionState.CONNECTED:
+            raise ConnectionError("Not connected to the instrument")
+
+        loop = asyncio.get_running_loop()
+        current_time = loop.time()
+        if current_time - self.last_heartbeat >= self.heartbeat_interval:
+            # Claimed before awaiting so concurrent queries send one heartbeat.
+            self.last_heartbeat = current_time
+            try:
+                await self._send("*OPC?", True)
+            except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+                self._abort(ConnectionError("Heartbeat failed"))
+                raise ConnectionError(f"Heartbeat failed: {str(e) or type(e).__name__}")
+
+        try:
+            result = await self._send(command, expect_response)
+        except CommandError:
+            raise
+        except asyncio.TimeoutError as e:
+            # One unanswered query (a missing card, an unsupported command)
+            # must not take the whole connection down.
+            if expect_response and await self._instrument_responds():
+                raise CommandError(f"{command} got no response within {self.timeout:g} s")
+            self._abort(ConnectionError("Operation failed"))
+            raise ConnectionError(f"Operation failed: {str(e) or type(e).__name__}")
+        except (OSError, ConnectionError) as e:
+            self._abort(ConnectionError("Operation failed"))
+            raise ConnectionError(f"Operation failed: {str(e) or type(e).__name__}")
+        self.last_heartbeat = loop.time()
+        return result
+
+    async def _instrument_responds(self):
+        try:
+            response = await self._send("*OPC?", True)
+        except (OSError, ConnectionError, CommandError, asyncio.TimeoutError):
+            return False
+        self.last_heartbeat = asyncio.get_running_loop().time()
+        return response == "1"
+
+    # max_retries is accepted for VisaCommunication compatibility; a failed
+    # command drops the connection instead of being retried on it.
+    async def query(self, command, max_retries=3):
+        return await self._perform_operation(command, True)
+
+    async def write(self, command, max_retries=3):
+        return await self._perform_operation(command, False)
+
+
+async def auto_negotiate_instrument():
+    gpib_file = config.get('paths', 'gpib_address_file', fallback='gpib_address.txt')
+    try:
+        with open(gpib_file, 'r') as f:
+            selected_resource = f.read().strip()
+    except FileNotFoundError:
+        selected_resource = None
+
+    if selected_resource and (is_simulated_resource(selected_resource) or parse_socket_resource(selected_resource)):
+        return selected_resource
+
+    # pyvisa is imported on first use so simulated and socket instruments, and
+    # the GUI process, never pay for it.
+    import pyvisa
+    rm = pyvisa.ResourceManager()
+    resources = rm.list_resources()
+
+    if selected_resource and selected_resource in resources:
+        if await try_connect(rm, selected_resource):
+            return selected_resource
+
+    for resource in resources:
+        if await try_connect(rm, resource):
+            with open(gpib_file, 'w') as f:
+                f.write(resource)
+            return resource
+
+    return None
+
+
+async def try_connect(resource_manager, resource):
+    import pyvisa
+    loop = asyncio.get_running_loop()
+    try:
+        inst = await loop.run_in_executor(None, resource_manager.open_resource, resource)
+        identification = await loop.run_in_executor(None, inst.query, "*IDN?")
+        if any(name in identification for name in SUPPORTED_INSTRUMENTS):
+            logging.info(f"Connected to instrument: {resource}")
+            await loop.run_in_executor(None, inst.close)
+            return True
+        await loop.run_in_executor(None, inst.close)
+    except pyvisa.Error as e:
+        logging.error(f"Error connecting to {resource}: {e}")
+    return False
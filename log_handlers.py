@@ -0,0 +1,137 @@
+"""Non-blocking application logging.
+
+Callers only put records on a bounded queue (QueueingHandler); a LogWriter
+thread does all the file I/O, rotating the log by size. A record that finds
+the queue full is dropped and counted rather than waiting. RateLimitFilter
+runs on the caller's side, before anything is queued: a call site that keeps
+logging warnings or errors gets ``burst`` records per ``interval`` seconds,
+and the rest are counted and reported as a single "suppressed" summary line
+when the interval ends. The writer also reports dropped records, so nothing
+disappears silently.
+"""
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through ``burst`` records per call site per ``interval`` seconds at ``level`` and above."""
+
+    def __init__(self, burst=5, interval=60.0, level=logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.level = level
+        self.lock = threading.Lock()
+        # (pathname, lineno) -> [window start, records passed, records suppressed, last record]
+        self.windows = {}
+        self.suppressed_total = 0
+
+    def filter(self, record):
+        if record.levelno < self.level or self.burst <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                if window is not None and window[2]:
+                    # The first record of a new window carries the count of the last one.
+                    record.msg = f"{record.getMessage()} [{window[2]} similar messages suppressed in the previous {self.interval:g} s]"
+                    record.args = None
+                self.windows[key] = [now, 1, 0, None]
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            window[3] = record
+            self.suppressed_total += 1
+            return False
+
+    def expired_summaries(self, flush=False):
+        """Summary records for call sites that went quiet with records still suppressed.
+
+        With ``flush`` every window is closed, as at shutdown.
+        """
+        now = time.monotonic()
+        summaries = []
+        with self.lock:
+            for key, window in list(self.windows.items()):
+                if now - window[0] < self.interval and not flush:
+                    continue
+                if window[2]:
+                    last = window[3]
+                    summaries.append(logging.makeLogRecord({
+                        'name': last.name, 'levelno': last.levelno, 'levelname': last.levelname,
+                        'pathname': last.pathname, 'lineno': last.lineno,
+                        'msg': f"{window[2]} similar messages suppressed; last: {last.getMessage()}",
+                    }))
+                del self.windows[key]
+        return summaries
+
+
+class QueueingHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops and counts records when the queue is full instead of blocking."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter(threading.Thread):
+    """Background thread that writes queued records to ``handler``."""
+
+    def __init__(self, log_queue, handler, queue_handler, rate_limit, summary_interval=5.0):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = log_queue
+        self.handler = handler
+        self.queue_handler = queue_handler
+        self.rate_limit = rate_limit
+        self.summary_interval = summary_interval
+        self.reported_drops = 0
+        self.stopping = threading.Event()
+
+    def run(self):
+        next_summary = time.monotonic() + self.summary_interval
+        while True:
+            try:
+                record = self.queue.get(timeout=self.summary_interval)
+            except queue.Empty:
+                record = None
+            if record is not None:
+                self.handler.handle(record)
+            if time.monotonic() >= next_summary or record is None:
+                self.write_summaries()
+                next_summary = time.monotonic() + self.summary_interval
+            if self.stopping.is_set() and self.queue.empty():
+                break
+        self.write_summaries(flush=True)
+        self.handler.close()
+
+    def write_summaries(self, flush=False):
+        for summary in self.rate_limit.expired_summaries(flush):
+            self.handler.handle(summary)
+        dropped = self.queue_handler.dropped
+        if dropped > self.reported_drops:
+            self.handler.handle(logging.makeLogRecord({
+                'name': 'logging', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"{dropped - self.reported_drops} log records dropped because the log queue was full",
+            }))
+            self.reported_drops = dropped
+
+    def stop(self, timeout=5.0):
+        self.stopping.set()
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.join(timeout)
@@ -0,0 +1,348 @@
+"""Full-resolution plot history with a min/max pyramid for screen-resolution rendering.
+
+Every sample is kept per series. Alongside them each series has a pyramid of
+min/max buckets (4, 16, 64, ... samples per bucket) that is updated
+incrementally on append, so the zoom-level aggregates are always cached.
+Rendering a window picks the coarsest level that still has at least one
+bucket per pixel column and folds those buckets into per-column min/max
+pairs, which keeps the cost proportional to the plot width rather than to the
+length of the history.
+
+With ``block_size`` set, each series keeps only its most recent samples as
+floats. Older samples are packed into blocks of fixed-point deltas (at
+``resolution``, 0.1 °C like the CSV log) and compressed with zlib; ranges are
+decoded on demand. The shared timestamps are packed the same way, at
+``TIME_RESOLUTION``, with the first time of every block kept as a float so
+lookups only decode the block they land in; the pyramid keeps its own bucket
+start times so rendering a long window doesn't decode the timestamps at all.
+"""
+import math
+import struct
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+INF = math.inf
+NAN = math.nan
+LEVEL_BITS = 2
+# Timestamps are matplotlib date numbers (days); this is about 86 µs.
+TIME_RESOLUTION = 1e-9
+
+# Block header: flags, first fixed-point value.
+BLOCK_HEADER = struct.Struct('<Bq')
+BLOCK_RAW = 0x80
+BLOCK_MISSING = 0x40
+DELTA_TYPES = (np.int8, np.int16, np.int32)
+
+
+def encode_block(values, scale):
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    with np.errstate(invalid='ignore', over='ignore'):
+        fixed = np.rint(values * scale)
+    if not np.all(np.isfinite(fixed[~missing])) or np.any(np.abs(fixed[~missing]) > 2**52):
+        # Overload readings (9.9E+37) and the like don't fit fixed point.
+        return bytes([BLOCK_RAW]) + bytes(8) + zlib.compress(values.tobytes())
+
+    flags = 0
+    if missing.any():
+        flags |= BLOCK_MISSING
+        if missing.all():
+            fixed[:] = 0
+        else:
+            # Hold the last good value across gaps so they cost no deltas.
+            index = np.where(missing, 0, np.arange(len(fixed)))
+            np.maximum.accumulate(index, out=index)
+            fixed = fixed[index]
+            fixed[np.isnan(fixed)] = fixed[~missing][0]
+    fixed = fixed.astype(np.int64)
+    deltas = np.diff(fixed, prepend=fixed[0])
+    low, high = int(deltas.min()), int(deltas.max())
+    for code, dtype in enumerate(DELTA_TYPES):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            break
+    else:
+        return bytes([BLOCK_RAW]) + bytes(8) + zlib.compress(values.tobytes())
+
+    payload = deltas.astype(dtype).tobytes()
+    if flags & BLOCK_MISSING:
+        payload += np.packbits(missing).tobytes()
+    return BLOCK_HEADER.pack(flags | code, int(fixed[0])) + zlib.compress(payload)
+
+
+def decode_block(block, size, scale):
+    flags, base = BLOCK_HEADER.unpack_from(block)
+    payload = zlib.decompress(memoryview(block)[BLOCK_HEADER.size:])
+    if flags & BLOCK_RAW:
+        return np.frombuffer(payload, dtype=np.float64).copy()
+    dtype = DELTA_TYPES[flags & 0x3]
+    deltas = np.frombuffer(payload, dtype=dtype, count=size)
+    values = (np.cumsum(deltas, dtype=np.int64) + base) / scale
+    if flags & BLOCK_MISSING:
+        mask = np.unpackbits(np.frombuffer(payload, dtype=np.uint8, offset=size * deltas.itemsize), count=size)
+        values[mask.astype(bool)] = NAN
+    return values
+
+
+class CompressedSeries:
+    """Samples of one series: compressed fixed-point blocks followed by a float tail."""
+
+    def __init__(self, block_size=0, recent=3600, resolution=0.1):
+        self.block_size = block_size
+        self.recent = recent
+        self.scale = 1 / resolution
+        self.blocks = []
+        self.tail = array('d')
+
+    def __len__(self):
+        return len(self.blocks) * self.block_size + len(self.tail)
+
+    def append(self, value):
+        self.tail.append(value)
+        if self.block_size and len(self.tail) >= self.recent + self.block_size:
+            self._compress()
+
+    def extend_missing(self, count):
+        self.tail.extend(array('d', [NAN]) * count)
+        if self.block_size:
+            self._compress()
+
+    def _compress(self):
+        size = self.block_size
+        while len(self.tail) >= self.recent + size:
+            self.blocks.append(encode_block(np.frombuffer(self.tail, count=size), self.scale))
+            del self.tail[:size]
+
+    def drop_front(self, count):
+        compressed = len(self.blocks) * self.block_size
+        if count <= compressed:
+            del self.blocks[:count // self.block_size]
+        else:
+            self.blocks = []
+            del self.tail[:count - compressed]
+
+    def values(self, start, stop):
+        if stop <= start:
+            return np.empty(0)
+        compressed = len(self.blocks) * self.block_size
+        if start >= compressed:
+            return np.frombuffer(self.tail[start - compressed:stop - compressed])
+
+        size = self.block_size
+        first, last = start // size, (min(stop, compressed) - 1) // size
+        parts = [decode_block(block, size, self.scale) for block in self.blocks[first:last + 1]]
+        if stop > compressed:
+            parts.append(np.frombuffer(self.tail[:stop - compressed]))
+        offset = start - first * size
+        return np.concatenate(parts)[offset:offset + stop - start]
+
+    def memory_bytes(self):
+        return sum(len(block) for block in self.blocks) + len(self.tail) * self.tail.itemsize
+
+
+class CompressedTimes(CompressedSeries):
+    """Ascending timestamps, stored like a series plus the first time of each block."""
+
+    def __init__(self, block_size=0, recent=3600, resolution=TIME_RESOLUTION):
+        super().__init__(block_size, recent, resolution)
+        self.firsts = array('d')
+
+    def _compress(self):
+        size = self.block_size
+        while len(self.tail) >= self.recent + size:
+            block = encode_block(np.frombuffer(self.tail, count=size), self.scale)
+            # Keep the decoded first time so it compares equal to the block's own.
+            self.firsts.append(decode_block(block, size, self.scale)[0])
+            self.blocks.append(block)
+            del self.tail[:size]
+
+    def drop_front(self, count):
+        del self.firsts[:count // self.block_size if self.block_size else 0]
+        super().drop_front(count)
+
+    def search(self, t, side='left'):
+        """Index where ``t`` would be inserted, like bisect_left/bisect_right."""
+        find = bisect_left if side == 'left' else bisect_right
+        if not self.blocks:
+            return find(self.tail, t)
+        block = max(find(self.firsts, t) - 1, 0)
+        size = self.block_size
+        index = int(np.searchsorted(decode_block(self.blocks[block], size, self.scale), t, side=side))
+        if index < size:
+            return block * size + index
+        if block + 1 < len(self.blocks):
+            return (block + 1) * size
+        return len(self.blocks) * size + find(self.tail, t)
+
+    def memory_bytes(self):
+        return super().memory_bytes() + len(self.firsts) * self.firsts.itemsize
+
+
+class EnvelopeHistory:
+    def __init__(self, capacity=604800, first_level_bits=LEVEL_BITS, block_size=0, recent_samples=3600, resolution=0.1):
+        self.capacity = max(capacity, 16)
+        self.series = {}
+        self.levels = {}
+        # Start time of every bucket of the finest pyramid level.
+        self.bucket_times = array('d')
+        # Samples already dropped from the front. Trimming always removes a
+        # whole top-level bucket so bucket boundaries stay aligned.
+        self.trimmed = 0
+        self.shifts = [first_level_bits]
+        while (1 << (self.shifts[-1] + LEVEL_BITS)) <= self.capacity // 16:
+            self.shifts.append(self.shifts[-1] + LEVEL_BITS)
+        self.trim_chunk = 1 << self.shifts[-1]
+        # Blocks must divide the trim chunk so trimming drops whole blocks.
+        self.block_size = min(1 << (block_size.bit_length() - 1), self.trim_chunk) if block_size > 0 else 0
+        self.recent_samples = recent_samples
+        self.resolution = resolution
+        self.times = CompressedTimes(self.block_size, recent_samples)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __contains__(self, key):
+        return key in self.series
+
+    def first_time(self):
+        return float(self.times.values(0, 1)[0]) if len(self.times) else None
+
+    def last_time(self):
+        count = len(self.times)
+        return float(self.times.values(count - 1, count)[0]) if count else None
+
+    def clear(self):
+        self.times = CompressedTimes(self.block_size, self.recent_samples)
+        self.series = {}
+        self.levels = {}
+        self.bucket_times = array('d')
+        self.trimmed = 0
+
+    def add_series(self, key):
+        if key in self.series:
+            return
+        count = len(self.times)
+        self.series[key] = CompressedSeries(self.block_size, self.recent_samples, self.resolution)
+        self.series[key].extend_missing(count)
+        levels = []
+        for shift in self.shifts:
+            buckets = ((count - 1) >> shift) + 1 if count else 0
+            levels.append((array('f', [INF]) * buckets, array('f', [-INF]) * buckets))
+        self.levels[key] = levels
+
+    def append(self, timestamp, values):
+        for key in values:
+            if key not in self.series:
+                self.add_series(key)
+
+        index = self.trimmed + len(self.times)
+        self.times.append(timestamp)
+        if index & ((1 << self.shifts[0]) - 1) == 0:
+            self.bucket_times.append(timestamp)
+        for key, data in self.series.items():
+            value = values.get(key)
+            if value is None:
+                value = NAN
+            data.append(value)
+            for shift, (mins, maxs) in zip(self.shifts, self.levels[key]):
+                if index & ((1 << shift) - 1) == 0:
+                    mins.append(INF)
+                    maxs.append(-INF)
+                if value == value:
+                    if value < mins[-1]:
+                        mins[-1] = value
+                    if value > maxs[-1]:
+                        maxs[-1] = value
+
+        if len(self.times) >= self.capacity + self.trim_chunk:
+            self._trim()
+
+    def _trim(self):
+        chunk = self.trim_chunk
+        self.times.drop_front(chunk)
+        del self.bucket_times[:chunk >> self.shifts[0]]
+        for key, data in self.series.items():
+            data.drop_front(chunk)
+            for shift, (mins, maxs) in zip(self.shifts, self.levels[key]):
+                del mins[:chunk >> shift]
+                del maxs[:chunk >> shift]
+        self.trimmed += chunk
+
+    def values(self, key, t0, t1):
+        """Return (x, y) for every stored sample of ``key`` between t0 and t1."""
+        data = self.series.get(key)
+        if data is None:
+            return np.empty(0), np.empty(0)
+        i0 = self.times.search(t0, 'left')
+        i1 = self.times.search(t1, 'right')
+        return self.times.values(i0, i1), data.values(i0, i1)
+
+    def memory_bytes(self):
+        total = self.times.memory_bytes() + self.bucket_times.buffer_info()[1] * self.bucket_times.itemsize
+        for key, data in self.series.items():
+            total += data.memory_bytes()
+            for mins, maxs in self.levels[key]:
+                total += (len(mins) + len(maxs)) * mins.itemsize
+        return total
+
+    def memory_per_channel_day(self):
+        """Bytes held per series per day of history, or None for very short histories."""
+        if len(self.times) < 2 or not self.series:
+            return None
+        days = self.last_time() - self.first_time()
+        if days < 1 / 24:
+            return None
+        return self.memory_bytes() / len(self.series) / days
+
+    def envelope(self, key, t0, t1, columns):
+        """Return (x, y) for drawing ``key`` between t0 and t1 at ``columns`` pixels.
+
+        Short windows are returned at full resolution; longer ones as a min/max
+        zig-zag with two points per pixel column.
+        """
+        data = self.series.get(key)
+        empty = np.empty(0)
+        if data is None or columns < 1:
+            return empty, empty
+        i0 = self.times.search(t0, 'left')
+        i1 = self.times.search(t1, 'right')
+        count = i1 - i0
+        if count <= 0:
+            return empty, empty
+        if count <= 2 * columns:
+            return self.times.values(i0, i1), data.values(i0, i1)
+
+        shift = 0
+        levels = None
+        for level_shift, level in zip(self.shifts, self.levels[key]):
+            if (count >> level_shift) < columns:
+                break
+            shift, levels = level_shift, level
+
+        b0 = i0 >> shift
+        b1 = ((i1 - 1) >> shift) + 1
+        if levels is None:
+            bucket_mins = bucket_maxs = data.values(i0, i1)
+            bucket_times = self.times.values(i0, i1)
+        else:
+            bucket_mins = np.frombuffer(levels[0][b0:b1], dtype=np.float32)
+            bucket_maxs = np.frombuffer(levels[1][b0:b1], dtype=np.float32)
+            ratio = shift - self.shifts[0]
+            bucket_times = np.array(self.bucket_times[b0 << ratio:((b1 - 1) << ratio) + 1:1 << ratio])
+            # The first bucket may start before the window.
+            bucket_times[0] = self.times.values(i0, i0 + 1)[0]
+
+        span = (t1 - t0) or 1.0
+        column = np.clip(((bucket_times - t0) / span * columns).astype(np.int64), 0, columns - 1)
+        starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+        column_mins = np.fmin.reduceat(bucket_mins, starts).astype(np.float64)
+        column_maxs = np.fmax.reduceat(bucket_maxs, starts).astype(np.float64)
+        column_mins[np.isinf(column_mins)] = np.nan
+        column_maxs[np.isinf(column_maxs)] = np.nan
+
+        x = np.repeat(bucket_times[starts], 2)
+        y = np.column_stack((column_mins, column_maxs)).ravel()
+        return x, y
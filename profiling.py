@@ -0,0 +1,207 @@
+"""Runtime diagnostics: cProfile, tracemalloc snapshots, resource sampling and startup timing.
+
+All reports are written into the application's log directory so they can be
+collected from the production PC together with the text logs.
+"""
+import asyncio
+import cProfile
+import csv
+import importlib
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+
+
+class StartupTimer:
+    """Startup phases and deferred imports, timed from when the app module started loading."""
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.phases = []
+        self.imports = []
+
+    def mark(self, phase):
+        self.phases.append((phase, time.perf_counter() - self.started))
+
+    def elapsed(self, phase):
+        return next((seconds for name, seconds in self.phases if name == phase), None)
+
+    def timed_import(self, name):
+        # Safe to call from a worker thread; the import lock serialises imports.
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        self.imports.append((name, time.perf_counter() - start))
+        return module
+
+    def report(self):
+        lines = ["Startup timing (seconds since the app module started loading):"]
+        lines.extend(f"  {name:<32} {seconds:7.3f}" for name, seconds in self.phases)
+        lines.append("Deferred imports (seconds each, off the Tk thread):")
+        lines.extend(f"  {name:<32} {seconds:7.3f}" for name, seconds in self.imports)
+        return "\n".join(lines)
+
+
+class DiagnosticsProfiler:
+    def __init__(self, output_directory, top_stats=25, trace_frames=10):
+        self.output_directory = output_directory
+        self.top_stats = top_stats
+        self.trace_frames = trace_frames
+        self.cpu_profile = None
+        self.first_snapshot = None
+        self.last_snapshot = None
+        self.snapshot_count = 0
+        self.sampling_task = None
+        self.snapshot_task = None
+
+    def _report_path(self, prefix, extension):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return os.path.join(self.output_directory, f'{prefix}_{timestamp}.{extension}')
+
+    @property
+    def cpu_profiling(self):
+        return self.cpu_profile is not None
+
+    @property
+    def memory_tracing(self):
+        return tracemalloc.is_tracing()
+
+    @property
+    def sampling(self):
+        return self.sampling_task is not None and not self.sampling_task.done()
+
+    # cProfile only sees the thread that enabled it. The menu callbacks and the
+    # startup hook both run on the asyncio/Tk thread, which is the one we want.
+    def start_cpu_profile(self):
+        if self.cpu_profile is not None:
+            return
+        self.cpu_profile = cProfile.Profile()
+        self.cpu_profile.enable()
+        logging.info("CPU profiling started")
+
+    def stop_cpu_profile(self):
+        if self.cpu_profile is None:
+            return None
+        profile = self.cpu_profile
+        self.cpu_profile = None
+        profile.disable()
+
+        stats_path = self._report_path('cpu_profile', 'prof')
+        profile.dump_stats(stats_path)
+        text = io.StringIO()
+        stats = pstats.Stats(profile, stream=text)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_stats * 2)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top_stats)
+        report_path = stats_path[:-len('.prof')] + '.txt'
+        with open(report_path, 'w') as f:
+            f.write(text.getvalue())
+        logging.info(f"CPU profile written to {report_path}")
+        return report_path
+
+    def start_memory_tracing(self):
+        if tracemalloc.is_tracing():
+            return
+        tracemalloc.start(self.trace_frames)
+        self.first_snapshot = None
+        self.last_snapshot = None
+        self.snapshot_count = 0
+        logging.info("Memory tracing started")
+
+    def stop_memory_tracing(self):
+        if not tracemalloc.is_tracing():
+            return
+        tracemalloc.stop()
+        self.first_snapshot = None
+        self.last_snapshot = None
+        logging.info("Memory tracing stopped")
+
+    def take_memory_snapshot(self):
+        if not tracemalloc.is_tracing():
+            self.start_memory_tracing()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        self.snapshot_count += 1
+        current, peak = tracemalloc.get_traced_memory()
+
+        lines = [
+            f"Memory snapshot #{self.snapshot_count} at {datetime.now().isoformat(timespec='seconds')}",
+            f"Traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB",
+            "",
+            f"Top {self.top_stats} allocation sites:",
+        ]
+        lines.extend(str(stat) for stat in snapshot.statistics('lineno')[:self.top_stats])
+        if self.last_snapshot is not None:
+            lines += ["", f"Growth since previous snapshot (#{self.snapshot_count - 1}):"]
+            lines.extend(str(stat) for stat in snapshot.compare_to(self.last_snapshot, 'lineno')[:self.top_stats])
+        if self.first_snapshot is not None and self.snapshot_count > 2:
+            lines += ["", "Growth since first snapshot:"]
+            lines.extend(str(stat) for stat in snapshot.compare_to(self.first_snapshot, 'lineno')[:self.top_stats])
+
+        if self.first_snapshot is None:
+            self.first_snapshot = snapshot
+        self.last_snapshot = snapshot
+
+        report_path = self._report_path('memory_snapshot', 'txt')
+        with open(report_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        logging.info(f"Memory snapshot written to {report_path}")
+        return report_path
+
+    def start_sampling(self, loop, sample_fn, interval):
+        if self.sampling:
+            return
+        self.sampling_task = loop.create_task(self._sample_loop(sample_fn, interval))
+        logging.info(f"Resource sampling started (every {interval}s)")
+
+    def stop_sampling(self):
+        if self.sampling:
+            self.sampling_task.cancel()
+        self.sampling_task = None
+
+    async def _sample_loop(self, sample_fn, interval):
+        path = self._report_path('resource_samples', 'csv')
+        writer = None
+        with open(path, 'w', newline='') as f:
+            while True:
+                try:
+                    sample = {'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+                    sample.update(sample_fn())
+                    if tracemalloc.is_tracing():
+                        sample['traced_kib'] = round(tracemalloc.get_traced_memory()[0] / 1024, 1)
+                    if writer is None:
+                        writer = csv.DictWriter(f, fieldnames=list(sample), extrasaction='ignore', restval='')
+                        writer.writeheader()
+                    writer.writerow(sample)
+                    f.flush()
+                except Exception as e:
+                    logging.error(f"Error sampling resources: {e}")
+                await asyncio.sleep(interval)
+
+    def start_periodic_snapshots(self, loop, interval):
+        if interval <= 0 or (self.snapshot_task is not None and not self.snapshot_task.done()):
+            return
+        self.snapshot_task = loop.create_task(self._snapshot_loop(interval))
+
+    async def _snapshot_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Snapshotting is CPU heavy; keep it off the Tk/asyncio thread.
+                await asyncio.to_thread(self.take_memory_snapshot)
+            except Exception as e:
+                logging.error(f"Error taking memory snapshot: {e}")
+
+    def shutdown(self):
+        if self.snapshot_task is not None:
+            self.snapshot_task.cancel()
+        self.stop_sampling()
+        self.stop_cpu_profile()
+        if tracemalloc.is_tracing():
+            self.take_memory_snapshot()
+            self.stop_memory_tracing()
@@ -0,0 +1,157 @@
+"""Replay recorded temperature_log_*.csv files through the acquisition pipeline.
+
+ReplaySource streams rows from a log written by the monitoring loop. The
+acquisition engine feeds them through the same fan-decision, ring, plotting
+and CSV logging path as live readings (without touching any relay), at 1x,
+Nx or as fast as possible.
+
+read_log_tail and read_tail_samples read only the end of a log, seeking
+backwards from the end of the file, for a warm restart after a crash.
+
+Run headless as a load generator:
+
+    python replay.py temperature_log_20240101_080000.csv --speed 0
+"""
+import argparse
+import asyncio
+import csv
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+CHANNEL_COLUMN_RE = re.compile(r'^Temp \(Ch (\d+) (\w+)\)$')
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def read_log_header(path):
+    with open(path, newline='') as f:
+        header = next(csv.reader(f), [])
+    columns = {}
+    thermocouple_types = {}
+    for index, name in enumerate(header):
+        match = CHANNEL_COLUMN_RE.match(name.strip())
+        if match:
+            channel = int(match.group(1))
+            columns[channel] = index
+            thermocouple_types[channel] = match.group(2)
+    if not columns:
+        raise ValueError(f"{path} has no 'Temp (Ch N T)' columns")
+    return header, columns, thermocouple_types
+
+
+def parse_temperature(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def read_log_tail(path, rows, block_size=65536):
+    """Return the last ``rows`` complete rows of a CSV log, parsed.
+
+    Blocks are read backwards from the end of the file until they hold enough
+    lines, so the cost doesn't grow with the length of the log. A last line
+    cut short by a crash (no trailing newline) and the header are left out.
+    """
+    blocks = []
+    newlines = 0
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        # One newline more than rows: the one ending the line before the first row.
+        while position > 0 and newlines <= rows:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            block = f.read(size)
+            blocks.append(block)
+            newlines += block.count(b'\n')
+    lines = b''.join(reversed(blocks)).split(b'\n')
+    lines.pop()
+    # At the start of the file the first line is the header; otherwise it may be partial.
+    lines = lines[1:][-rows:] if rows > 0 else []
+    return list(csv.reader(line.decode('utf-8', errors='replace').rstrip('\r') for line in lines))
+
+
+def read_tail_samples(path, rows):
+    """Return (timestamp, average, fan_on, temperatures) for the last ``rows`` rows of a log."""
+    header, columns, _ = read_log_header(path)
+    fan_index = header.index('Fan Status') if 'Fan Status' in header else None
+    samples = []
+    for row in read_log_tail(path, rows):
+        try:
+            timestamp = datetime.strptime(row[0], TIMESTAMP_FORMAT)
+            average = parse_temperature(row[1])
+            temperatures = {ch: parse_temperature(row[index]) for ch, index in columns.items()}
+        except (ValueError, IndexError):
+            continue
+        fan_on = fan_index is not None and fan_index < len(row) and row[fan_index] == "Fan Rotating"
+        samples.append((timestamp, average, fan_on, temperatures))
+    return samples
+
+
+class ReplaySource:
+    def __init__(self, path):
+        self.path = path
+        self.header, self.columns, self.thermocouple_types = read_log_header(path)
+        self.channels = sorted(self.columns)
+        self.skipped_rows = 0
+
+    def __iter__(self):
+        with open(self.path, newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                try:
+                    timestamp = datetime.strptime(row[0], TIMESTAMP_FORMAT)
+                    temperatures = {ch: parse_temperature(row[index]) for ch, index in self.columns.items()}
+                except (ValueError, IndexError):
+                    self.skipped_rows += 1
+                    continue
+                yield timestamp, temperatures
+
+
+async def run_replay(path, speed, set_temperature, sqlite=None, reader_interval=0.05):
+    from acquisition import AcquisitionEngine, SampleRing
+
+    messages = []
+    ring = SampleRing(capacity=4096)
+    engine = AcquisitionEngine(messages.append, ring)
+    received = 0
+    try:
+        started = time.perf_counter()
+        await engine.start_replay({'path': path, 'speed': speed, 'set_temperature': set_temperature, 'sqlite': sqlite})
+        while engine.is_monitoring:
+            await asyncio.sleep(reader_interval)
+            received += len(ring.read_new())
+        received += len(ring.read_new())
+        elapsed = time.perf_counter() - started
+    finally:
+        await engine.shutdown()
+        ring.close()
+    for message in messages:
+        if 'error' in message:
+            print(f"Error: {message['error']}")
+    return engine.replay_stats, received, ring.overruns, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a temperature log through the acquisition pipeline.")
+    parser.add_argument("path", help="temperature_log_*.csv file to replay")
+    parser.add_argument("--speed", type=float, default=0, help="replay speed factor; 0 = as fast as possible (default)")
+    parser.add_argument("--set-temperature", type=float, default=40.0, help="fan set point used for fan decisions")
+    parser.add_argument("--sqlite", metavar="DATABASE", help="also write the replay to this SQLite history database")
+    args = parser.parse_args(argv)
+
+    stats, received, overruns, elapsed = asyncio.run(run_replay(args.path, args.speed, args.set_temperature, args.sqlite))
+    print(f"Replayed {stats['rows']} rows in {elapsed:.2f} s ({stats['rows'] / elapsed if elapsed else 0:.0f} rows/s)")
+    print(f"Engine: {stats['rows_per_s']:.0f} rows/s, {stats['skipped_rows']} unparseable rows skipped, log written to {stats['log_file']}")
+    print(f"Reader: {received} samples received, {overruns} lost to ring overruns")
+    if 'sqlite_rows' in stats:
+        print(f"SQLite: {stats['sqlite_rows']} rows written to {args.sqlite}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""Offline PNG/PDF reports for finished test sessions.
+
+Each temperature_log_*.csv is rendered in its own worker process with
+matplotlib's Agg backend; no Tk is involved, so reports can be made on a
+headless machine. A report has the full-length trend of every channel, a fan
+duty timeline and a table of per-channel statistics (from analyze_logs).
+
+The log is read once. Its first and last timestamps come from the head and
+the tail of the file, so every row can be folded straight into one min/max
+bucket per pixel column as it streams past; memory and drawing time depend on
+the plot width, not on the length of the session.
+
+    python report.py logs/ --set-temperature 40
+    python report.py "data/temperature_log_202405*.csv" --format pdf --workers 8
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from analyze_logs import EPOCH, analyze_log, expand_paths
+from replay import read_log_header, read_log_tail
+
+CHUNK_ROWS = 4096
+# Statistics table: heading, analyze_logs summary column, width in characters.
+TABLE_COLUMNS = [('Channel', 'channel', 8), ('Type', 'thermocouple', 6), ('Min', 'min', 9), ('Max', 'max', 9),
+                 ('Mean', 'mean', 9), ('Std', 'std', 9), ('Missing', 'missing', 9), ('Above %', 'above_pct', 9),
+                 ('Longest flat (s)', 'longest_flat_s', 18), ('Stuck', 'stuck', 7)]
+
+
+def log_time_range(path):
+    """First and last row times of a log (epoch seconds), from its head and tail."""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        first = next(reader, None)
+    last = read_log_tail(path, 1)
+    if not first or not last:
+        raise ValueError(f"{path} has no readings")
+    return tuple((datetime.fromisoformat(row[0]) - EPOCH).total_seconds() for row in (first, last[0]))
+
+
+class TrendDecimator:
+    """Folds rows into per-column min/max/mean and fan duty as they stream past.
+
+    Rows are buffered and reduced a chunk at a time with numpy; times must be
+    non-decreasing, as they are in a log.
+    """
+
+    def __init__(self, start, end, columns, channels):
+        self.start = start
+        self.span = max(end - start, 1e-9)
+        self.columns = columns
+        self.minimum = np.full((columns, channels), np.inf)
+        self.maximum = np.full((columns, channels), -np.inf)
+        self.total = np.zeros((columns, channels))
+        self.count = np.zeros((columns, channels))
+        self.rows = np.zeros(columns)
+        self.fan_rows = np.zeros(columns)
+        self.times = []
+        self.values = []
+        self.fan = []
+
+    def __call__(self, now, values, fan_on):
+        self.times.append(now)
+        self.values.append(values)
+        self.fan.append(fan_on)
+        if len(self.times) >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.times:
+            return
+        columns = ((np.asarray(self.times) - self.start) / self.span * self.columns).astype(np.int64)
+        np.clip(columns, 0, self.columns - 1, out=columns)
+        values = np.asarray(self.values, dtype=np.float64)
+        fan = np.asarray(self.fan, dtype=np.float64)
+        self.times, self.values, self.fan = [], [], []
+
+        # One reduceat per run of rows that land in the same column.
+        starts = np.flatnonzero(np.diff(columns, prepend=-1))
+        targets = columns[starts]
+        present = ~np.isnan(values)
+        with np.errstate(invalid='ignore'):
+            self.minimum[targets] = np.fmin(self.minimum[targets], np.fmin.reduceat(values, starts, axis=0))
+            self.maximum[targets] = np.fmax(self.maximum[targets], np.fmax.reduceat(values, starts, axis=0))
+        self.total[targets] += np.add.reduceat(np.where(present, values, 0.0), starts, axis=0)
+        self.count[targets] += np.add.reduceat(present, starts, axis=0)
+        self.rows[targets] += np.diff(np.append(starts, len(columns)))
+        self.fan_rows[targets] += np.add.reduceat(fan, starts)
+
+    def result(self):
+        """Column times and, with NaN for empty columns, min, max, mean and fan duty."""
+        self.flush()
+        times = self.start + (np.arange(self.columns) + 0.5) / self.columns * self.span
+        empty = self.count == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(empty, np.nan, self.total / np.maximum(self.count, 1))
+            duty = np.where(self.rows > 0, self.fan_rows / np.maximum(self.rows, 1), np.nan)
+        return (times, np.where(empty, np.nan, self.minimum), np.where(empty, np.nan, self.maximum),
+                mean, duty)
+
+
+def render_report(path, output, set_temperature=None, gap_seconds=None, stuck_seconds=600.0,
+                  width=12.0, dpi=100):
+    """Render one session log to ``output`` (PNG or PDF by extension); returns the row count."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.dates as mdates
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    _, columns, _ = read_log_header(path)
+    channels = sorted(columns)
+    start, end = log_time_range(path)
+    decimator = TrendDecimator(start, end, int(width * dpi), len(channels))
+    summary = analyze_log(path, set_temperature, gap_seconds, stuck_seconds, observer=decimator)
+    times, minimum, maximum, mean, duty = decimator.result()
+    # Log times are naive local times counted from EPOCH; map them back the same way.
+    dates = mdates.date2num([EPOCH + timedelta(seconds=float(t)) for t in times])
+
+    # The statistics are one monospace text block; a matplotlib table of
+    # this size takes longer to lay out than the whole trend.
+    legend = len(channels) <= 20
+    table_height = 0.16 * (len(channels) + 2)
+    height = 7 + table_height
+    fig = Figure(figsize=(width, height), dpi=dpi)
+    FigureCanvasAgg(fig)
+    grid = fig.add_gridspec(3, 1, height_ratios=[4.5, 1.2, table_height], hspace=0.3,
+                            left=0.07, right=0.86 if legend else 0.97, top=1 - 0.7 / height, bottom=0.2 / height)
+    trend = fig.add_subplot(grid[0])
+    fan = fig.add_subplot(grid[1], sharex=trend)
+    table = fig.add_subplot(grid[2])
+
+    # Each channel is its min/max envelope with the column mean on top.
+    for index, channel in enumerate(channels):
+        line, = trend.plot(dates, mean[:, index], linewidth=0.8, label=f'Ch {channel}')
+        trend.fill_between(dates, minimum[:, index], maximum[:, index], color=line.get_color(), alpha=0.25, linewidth=0)
+    present = ~np.isnan(mean)
+    if present.any():
+        average = np.where(present.any(axis=1), np.nansum(mean, axis=1) / np.maximum(present.sum(axis=1), 1), np.nan)
+        trend.plot(dates, average, color='black', linewidth=1.6, label='Average')
+    if set_temperature is not None:
+        trend.axhline(set_temperature, color='red', linestyle='--', linewidth=1, label=f'Set {set_temperature:g} °C')
+    trend.set_ylabel("Temperature (°C)")
+    trend.grid(True, color='lightgray')
+    if legend:
+        trend.legend(loc='upper left', bbox_to_anchor=(1.01, 1), fontsize='small')
+
+    fan.fill_between(dates, 0, duty * 100, step='mid', color='tab:green', alpha=0.6, linewidth=0)
+    fan.set_ylim(0, 100)
+    fan.set_ylabel("Fan duty (%)")
+    fan.grid(True, color='lightgray')
+    fan.xaxis.set_major_formatter(mdates.ConciseDateFormatter(fan.xaxis.get_major_locator()))
+    trend.tick_params(labelbottom=False)
+
+    table.axis('off')
+    lines = ["".join(f"{heading:>{width}}" for heading, _, width in TABLE_COLUMNS)]
+    for row in summary:
+        lines.append("".join(f"{row[key]!s:>{width}}" for _, key, width in TABLE_COLUMNS))
+    table.text(0, 1, "\n".join(lines), family='monospace', fontsize=8, va='top', transform=table.transAxes)
+
+    first = summary[0] if summary else {}
+    fan_duty = f"fan duty {first['fan_duty_pct']}%" if first.get('fan_duty_pct', '') != '' else "no fan status"
+    fig.suptitle(f"{os.path.basename(path)}: {first.get('start', '')} to {first.get('end', '')}, "
+                 f"{first.get('rows', 0)} rows, {fan_duty}, {first.get('gaps', 0)} gaps")
+    fig.savefig(output)
+    return first.get('rows', 0)
+
+
+def _render_task(args):
+    path, output = args[:2]
+    started = time.perf_counter()
+    try:
+        rows = render_report(*args)
+        return path, output, rows, time.perf_counter() - started, None
+    except (OSError, ValueError, csv.Error) as e:
+        return path, output, 0, time.perf_counter() - started, str(e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render PNG/PDF reports of temperature_log_*.csv sessions in parallel.")
+    parser.add_argument("paths", nargs='+', help="log files, directories or glob patterns")
+    parser.add_argument("--set-temperature", type=float, help="set point drawn on the trend and used for the above-% column")
+    parser.add_argument("--gap-seconds", type=float, help="interval counted as a logging gap (default: 3x the typical interval)")
+    parser.add_argument("--stuck-minutes", type=float, default=10.0, help="identical readings for this long flag a stuck sensor")
+    parser.add_argument("--format", choices=('png', 'pdf'), default='png')
+    parser.add_argument("--output-dir", default='reports', help="directory the reports are written to")
+    parser.add_argument("--width", type=float, default=12.0, help="figure width in inches; the trend has one bucket per pixel")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    paths = expand_paths(args.paths)
+    if not paths:
+        parser.error("no log files found")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    tasks = [(path, os.path.join(args.output_dir, f"{os.path.splitext(os.path.basename(path))[0]}_report.{args.format}"),
+              args.set_temperature, args.gap_seconds, args.stuck_minutes * 60, args.width, args.dpi) for path in paths]
+    started = time.perf_counter()
+    failures = 0
+    pool = ProcessPoolExecutor(max_workers=min(args.workers, len(tasks))) if args.workers > 1 and len(tasks) > 1 else None
+    try:
+        for path, output, rows, elapsed, error in (pool.map(_render_task, tasks) if pool else map(_render_task, tasks)):
+            if error:
+                failures += 1
+                print(f"Skipped {path}: {error}", file=sys.stderr)
+                continue
+            print(f"Rendered {path} ({rows} rows) to {output} in {elapsed:.1f} s", file=sys.stderr)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    print(f"Rendered {len(paths) - failures} of {len(paths)} reports in {elapsed:.1f} s", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
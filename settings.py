@@ -0,0 +1,96 @@
+import atexit
+import configparser
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+ver = config.get('DEFAULT', 'version', fallback="v3.12")
+
+log_directory = config.get('paths', 'log_directory', fallback='logs')
+os.makedirs(log_directory, exist_ok=True)
+
+
+def parse_channel_list(text):
+    channels = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = (int(p) for p in part.split('-'))
+            channels.extend(range(first, last + 1))
+        else:
+            channels.append(int(part))
+    return sorted(set(channels))
+
+
+def get_temperature_channels():
+    if config.has_option('channels', 'temp_channels'):
+        return parse_channel_list(config.get('channels', 'temp_channels'))
+    start = config.getint('channels', 'temp_channels_start', fallback=101)
+    end = config.getint('channels', 'temp_channels_end', fallback=120)
+    return list(range(start, end + 1))
+
+
+def get_fan_channels():
+    return list(range(config.getint('channels', 'fan_channels_start', fallback=201),
+                      config.getint('channels', 'fan_channels_end', fallback=215) + 1))
+
+
+def fan_zone_sections():
+    return [section for section in config.sections() if section.startswith('zone:')]
+
+
+log_writer = None
+
+
+def configure_logging(prefix='temperature_monitor'):
+    global log_writer
+    log_file = os.path.join(log_directory, f'{prefix}_{datetime.now().strftime("%Y%m%d")}.log')
+    root = logging.getLogger()
+    if root.handlers:
+        return log_file
+    from log_handlers import LogWriter, QueueingHandler, RateLimitFilter
+
+    # The file is written by a background thread; callers only enqueue records.
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file,
+        maxBytes=int(config.getfloat('logging', 'max_megabytes', fallback=10) * 1024 * 1024),
+        backupCount=config.getint('logging', 'backup_count', fallback=5))
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    log_queue = queue.Queue(maxsize=config.getint('logging', 'queue_size', fallback=10000))
+    queue_handler = QueueingHandler(log_queue)
+    rate_limit = RateLimitFilter(burst=config.getint('logging', 'rate_limit_burst', fallback=5),
+                                 interval=config.getfloat('logging', 'rate_limit_interval', fallback=60))
+    queue_handler.addFilter(rate_limit)
+    root.addHandler(queue_handler)
+    root.setLevel(config.get('logging', 'level', fallback='DEBUG').upper())
+
+    log_writer = LogWriter(log_queue, file_handler, queue_handler, rate_limit)
+    log_writer.start()
+    atexit.register(stop_logging)
+    return log_file
+
+
+def stop_logging():
+    global log_writer
+    if log_writer is None:
+        return
+    for handler in logging.getLogger().handlers[:]:
+        if handler is log_writer.queue_handler:
+            logging.getLogger().removeHandler(handler)
+    log_writer.stop()
+    log_writer = None
+
+
+def logging_stats():
+    if log_writer is None:
+        return {}
+    return {'log_queue': log_writer.queue.qsize(),
+            'log_dropped': log_writer.queue_handler.dropped,
+            'log_suppressed': log_writer.rate_limit.suppressed_total}
@@ -0,0 +1,194 @@
+"""Stand-in for a DAQ970A / 34970A resource so the app can be exercised offline.
+
+The object mimics the small part of a pyvisa resource the application uses
+(query, write, close) and answers the SCPI commands the monitor sends.
+serve_scpi() exposes it on a raw SCPI TCP socket instead:
+
+    python sim_instrument.py --port 5025
+"""
+import argparse
+import asyncio
+import logging
+import math
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+IDN_RESPONSE = "Keysight Technologies,DAQ970A,MY00000000,A.03.01-01.00-03.01-00.02-01-01"
+# What the instrument reads for an open thermocouple.
+OVERLOAD = 9.9e37
+
+_CHANNEL_LIST_RE = re.compile(r'\(@([0-9,:\s]+)\)')
+
+
+def parse_channel_list(command):
+    match = _CHANNEL_LIST_RE.search(command)
+    if not match:
+        return []
+    channels = []
+    for part in match.group(1).split(','):
+        part = part.strip()
+        if ':' in part:
+            first, last = (int(p) for p in part.split(':'))
+            channels.extend(range(first, last + 1))
+        elif part:
+            channels.append(int(part))
+    return channels
+
+
+class SimulatedInstrument:
+    def __init__(self, latency=0.0, base_temperature=25.0, amplitude=5.0, period=600.0, noise=0.05, seed=None):
+        self.latency = latency
+        self.base_temperature = base_temperature
+        self.amplitude = amplitude
+        self.period = period
+        self.noise = noise
+        self.closed_relays = set()
+        # FORM:READ:TIME ON appends the instrument clock to every reading.
+        self.reading_time = False
+        # Channels whose measurements fail, like an open thermocouple or a
+        # missing card on a real instrument.
+        self.failing_channels = set()
+        # Channels on a missing card: serve_scpi leaves their queries
+        # unanswered.
+        self.silent_channels = set()
+        self.command_count = 0
+        self._random = random.Random(seed)
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def temperature(self, channel):
+        elapsed = time.monotonic() - self._start
+        phase = (channel % 100) * 0.7
+        value = self.base_temperature + self.amplitude * math.sin(2 * math.pi * elapsed / self.period + phase)
+        return value + self._random.gauss(0, self.noise)
+
+    def _count(self):
+        with self._lock:
+            self.command_count += 1
+
+    def query(self, command):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return self.answer(command)
+
+    def write(self, command):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return self.execute(command)
+
+    def answer(self, command):
+        self._count()
+        command = command.strip().upper()
+        if command == "*IDN?":
+            return IDN_RESPONSE
+        if command == "*OPC?":
+            return "1"
+        if command.startswith("MEAS:TEMP?") or command.startswith("MEASURE:TEMPERATURE?"):
+            channels = parse_channel_list(command)
+            failing = self.failing_channels.union(self.silent_channels).intersection(channels)
+            if failing:
+                raise ValueError(f"Measurement failed on channel {min(failing)}")
+            return ",".join(self.format_reading(self.temperature(ch)) for ch in channels)
+        if command.startswith("ROUTE:CLOSE?"):
+            return ",".join("1" if ch in self.closed_relays else "0" for ch in parse_channel_list(command))
+        raise ValueError(f"Unsupported query: {command}")
+
+    def format_reading(self, value):
+        if not self.reading_time:
+            return f"{value:+.8E}"
+        now = datetime.now()
+        seconds = now.second + now.microsecond / 1e6
+        return f"{value:+.8E},{now.year},{now.month:02d},{now.day:02d},{now.hour:02d},{now.minute:02d},{seconds:06.3f}"
+
+    def execute(self, command):
+        self._count()
+        command = command.strip().upper()
+        if command.startswith("FORM:READ:TIME:TYPE") or command.startswith("FORMAT:READING:TIME:TYPE"):
+            if command.split()[-1] not in ("ABS", "ABSOLUTE"):
+                raise ValueError(f"Unsupported time type: {command}")
+        elif command.startswith("FORM:READ:TIME") or command.startswith("FORMAT:READING:TIME"):
+            self.reading_time = command.split()[-1] in ("ON", "1")
+        elif command.startswith("ROUTE:CLOSE"):
+            self.closed_relays.update(parse_channel_list(command))
+        elif command.startswith("ROUTE:OPEN"):
+            self.closed_relays.difference_update(parse_channel_list(command))
+        return len(command)
+
+    def clear(self):
+        pass
+
+    def close(self):
+        pass
+
+
+async def serve_scpi(instrument, host='127.0.0.1', port=5025):
+    """Serve ``instrument`` as a raw SCPI socket, like port 5025 of a LAN DAQ970A.
+
+    Commands are newline terminated and handled one at a time per connection,
+    so pipelined queries are answered in order. A measurement on a failing
+    channel answers with the overload reading, as the real instrument does for
+    an open thermocouple. Unsupported queries, and measurements on a silent
+    channel, get no answer, which leaves the client to time out.
+    """
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode(errors='replace').strip()
+                if not command:
+                    continue
+                if instrument.latency > 0:
+                    await asyncio.sleep(instrument.latency)
+                try:
+                    if '?' in command.split()[0]:
+                        if instrument.silent_channels.intersection(parse_channel_list(command)):
+                            continue
+                        try:
+                            response = instrument.answer(command)
+                        except ValueError:
+                            channels = parse_channel_list(command)
+                            if not instrument.failing_channels.intersection(channels):
+                                raise
+                            response = ",".join(instrument.format_reading(OVERLOAD) for _ in channels)
+                        writer.write(response.encode() + b"\n")
+                        await writer.drain()
+                    else:
+                        instrument.execute(command)
+                except ValueError as e:
+                    logging.warning(f"Simulated instrument: {e}")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a simulated DAQ970A on a raw SCPI socket.")
+    parser.add_argument("--host", default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=5025)
+    parser.add_argument("--latency", type=float, default=0.0, help="per-command latency in seconds")
+    args = parser.parse_args(argv)
+
+    async def run():
+        server = await serve_scpi(SimulatedInstrument(latency=args.latency), args.host, args.port)
+        print(f"Simulated DAQ970A listening on TCPIP::{args.host}::{args.port}::SOCKET")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""SQLite history store with 1 min and 1 h rollup tiers.
+
+HistoryStore wraps one SQLite database in WAL mode. Raw readings go into
+``samples`` (one row per channel per reading, keyed by channel and time). As
+each batch is inserted, the per-channel min/max/sum/count of the 1 minute and
+1 hour buckets it touches are upserted into ``rollup_1m`` and ``rollup_1h``, so
+the rollups never have to be rebuilt. Readings already in ``samples`` are
+skipped and left out of the rollups, so importing a log twice counts it once
+(as long as its raw rows are still within retention). Every tier has its own
+retention.
+
+SQLiteSink is what the acquisition engine uses: ``add()`` only puts the reading
+on a queue, and a writer thread batches the inserts, so the monitoring loop
+never waits on the disk.
+
+Query the history from the command line:
+
+    python storage.py --channel 101 --tier 1h --days 30
+"""
+import argparse
+import logging
+import math
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from settings import config, log_directory
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    ended REAL,
+    log_file TEXT
+);
+CREATE TABLE IF NOT EXISTS channels (
+    channel INTEGER PRIMARY KEY,
+    thermocouple_type TEXT
+);
+CREATE TABLE IF NOT EXISTS samples (
+    channel INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (channel, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_1m (
+    channel INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    min_value REAL NOT NULL,
+    max_value REAL NOT NULL,
+    sum_value REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (channel, bucket)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rollup_1m_bucket ON rollup_1m (bucket);
+CREATE TABLE IF NOT EXISTS rollup_1h (
+    channel INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    min_value REAL NOT NULL,
+    max_value REAL NOT NULL,
+    sum_value REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (channel, bucket)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rollup_1h_bucket ON rollup_1h (bucket);
+"""
+
+# A batch with readings already in samples is staged here to find the new ones.
+STAGING_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS incoming (
+    channel INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (channel, ts)
+) WITHOUT ROWID;
+"""
+
+# Tier name -> (table, bucket width in seconds); raw samples have no bucket.
+TIERS = {'raw': ('samples', None), '1m': ('rollup_1m', 60), '1h': ('rollup_1h', 3600)}
+
+ROLLUP_UPSERT = """
+INSERT INTO {table} (channel, bucket, min_value, max_value, sum_value, count) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (channel, bucket) DO UPDATE SET
+    min_value = min(min_value, excluded.min_value),
+    max_value = max(max_value, excluded.max_value),
+    sum_value = sum_value + excluded.sum_value,
+    count = count + excluded.count
+"""
+
+
+def rollup_rows(rows, width):
+    buckets = {}
+    for channel, ts, value in rows:
+        key = (channel, int(ts // width) * width)
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [value, value, value, 1]
+        else:
+            if value < bucket[0]:
+                bucket[0] = value
+            if value > bucket[1]:
+                bucket[1] = value
+            bucket[2] += value
+            bucket[3] += 1
+    return [(channel, start, *bucket) for (channel, start), bucket in buckets.items()]
+
+
+class HistoryStore:
+    def __init__(self, path, retention_days=None):
+        self.path = path
+        # Days to keep per tier; 0 or missing keeps the tier forever.
+        self.retention_days = retention_days or {}
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.executescript(STAGING_SCHEMA)
+        self.session_id = None
+
+    def close(self):
+        self.connection.close()
+
+    def begin_session(self, started, channels, thermocouple_types, log_file=None):
+        with self.connection:
+            cursor = self.connection.execute("INSERT INTO sessions (started, log_file) VALUES (?, ?)", (started, log_file))
+            self.session_id = cursor.lastrowid
+            self.connection.executemany("INSERT OR REPLACE INTO channels VALUES (?, ?)",
+                                        [(ch, thermocouple_types.get(ch)) for ch in channels])
+
+    def end_session(self, ended):
+        if self.session_id is None:
+            return
+        with self.connection:
+            self.connection.execute("UPDATE sessions SET ended = ? WHERE id = ?", (ended, self.session_id))
+        self.session_id = None
+
+    def insert(self, readings):
+        """Insert (timestamp, {channel: value}[, {channel: timestamp}]) readings and update the rollups.
+
+        Channels with their own timestamp in the optional third element are
+        stored at that time instead of the row's. Readings already stored are
+        skipped. Returns the number of rows added.
+        """
+        rows = []
+        for ts, temperatures, *channel_times in readings:
+            times = channel_times[0] if channel_times else None
+            rows.extend((channel, times.get(channel, ts) if times else ts, value)
+                        for channel, value in temperatures.items()
+                        if value is not None and not math.isnan(value))
+        if not rows:
+            return 0
+        with self.connection:
+            # An outermost SAVEPOINT would be its own transaction, committed
+            # by RELEASE before the rollups are written; samples and rollups
+            # must commit together.
+            self.connection.execute("BEGIN")
+            self.connection.execute("SAVEPOINT batch")
+            before = self.connection.total_changes
+            self.connection.executemany("INSERT OR IGNORE INTO samples VALUES (?, ?, ?)", rows)
+            if self.connection.total_changes - before < len(rows):
+                # Some readings are already stored (a log imported twice):
+                # stage the batch to find the new ones, which alone are rolled up.
+                self.connection.execute("ROLLBACK TO batch")
+                self.connection.execute("DELETE FROM incoming")
+                self.connection.executemany("INSERT OR IGNORE INTO incoming VALUES (?, ?, ?)", rows)
+                self.connection.execute("DELETE FROM incoming WHERE EXISTS "
+                                        "(SELECT 1 FROM samples WHERE samples.channel = incoming.channel AND samples.ts = incoming.ts)")
+                rows = self.connection.execute("SELECT channel, ts, value FROM incoming").fetchall()
+                self.connection.execute("INSERT INTO samples SELECT channel, ts, value FROM incoming")
+            self.connection.execute("RELEASE batch")
+            for table, width in TIERS.values():
+                if width:
+                    self.connection.executemany(ROLLUP_UPSERT.format(table=table), rollup_rows(rows, width))
+        return len(rows)
+
+    def apply_retention(self, now=None):
+        now = time.time() if now is None else now
+        channels = [row[0] for row in self.connection.execute("SELECT channel FROM channels")]
+        deleted = 0
+        with self.connection:
+            for tier, (table, width) in TIERS.items():
+                days = self.retention_days.get(tier)
+                if not days:
+                    continue
+                column = 'ts' if width is None else 'bucket'
+                cutoff = now - days * 86400
+                for channel in channels:
+                    deleted += self.connection.execute(f"DELETE FROM {table} WHERE channel = ? AND {column} < ?",
+                                                       (channel, cutoff)).rowcount
+        if deleted:
+            logging.info(f"History retention removed {deleted} rows from {self.path}")
+        return deleted
+
+    def query(self, channel, start, end, tier='raw'):
+        """Return rows for ``channel`` between start and end (epoch seconds).
+
+        Raw rows are (ts, value); rollup rows are (bucket_start, min, max, mean).
+        A channel of None aggregates the rollups over all channels.
+        """
+        table, width = TIERS[tier]
+        if width is None:
+            if channel is None:
+                raise ValueError("Raw queries need a channel")
+            return self.connection.execute(
+                "SELECT ts, value FROM samples WHERE channel = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (channel, start, end)).fetchall()
+        if channel is None:
+            return self.connection.execute(
+                f"SELECT bucket, min(min_value), max(max_value), sum(sum_value) / sum(count) FROM {table} "
+                f"WHERE bucket BETWEEN ? AND ? GROUP BY bucket ORDER BY bucket",
+                (start, end)).fetchall()
+        return self.connection.execute(
+            f"SELECT bucket, min_value, max_value, sum_value / count FROM {table} "
+            f"WHERE channel = ? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+            (channel, start, end)).fetchall()
+
+    def channels(self):
+        return self.connection.execute("SELECT channel, thermocouple_type FROM channels ORDER BY channel").fetchall()
+
+
+class SQLiteSink:
+    """Feeds a HistoryStore from a writer thread so inserts never block the event loop."""
+
+    def __init__(self, path, batch_interval=1.0, batch_size=10000, retention_days=None, retention_interval=3600):
+        self.path = path
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.retention_interval = retention_interval
+        self.rows_written = 0
+        self.failed = False
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="sqlite-sink", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_config(cls):
+        return cls(config.get('storage', 'database', fallback=os.path.join(log_directory, 'temperature_history.db')),
+                   batch_interval=config.getfloat('storage', 'batch_interval', fallback=1.0),
+                   retention_days={
+                       'raw': config.getfloat('storage', 'retention_raw_days', fallback=7),
+                       '1m': config.getfloat('storage', 'retention_1m_days', fallback=90),
+                       '1h': config.getfloat('storage', 'retention_1h_days', fallback=0),
+                   })
+
+    def add(self, timestamp, temperatures, channel_times=None):
+        if not self.failed:
+            self.queue.put(('sample', (timestamp, temperatures, channel_times)))
+
+    def begin_session(self, channels, thermocouple_types, log_file=None):
+        self.queue.put(('begin', (time.time(), list(channels), dict(thermocouple_types), log_file)))
+
+    def end_session(self):
+        self.queue.put(('end', (time.time(),)))
+
+    def flush(self, timeout=None):
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        self.queue.put(('close', None))
+        self.thread.join(timeout)
+
+    def _run(self):
+        try:
+            store = HistoryStore(self.path, self.retention_days)
+        except sqlite3.Error as e:
+            logging.error(f"Could not open history database {self.path}: {e}")
+            self.failed = True
+            store = None
+
+        batch = []
+        deadline = time.monotonic() + self.batch_interval
+        next_retention = 0
+        while True:
+            try:
+                command, argument = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                command, argument = None, None
+
+            if command == 'sample':
+                batch.append(argument)
+                if len(batch) < self.batch_size and time.monotonic() < deadline:
+                    continue
+
+            if store is not None:
+                try:
+                    if batch:
+                        self.rows_written += store.insert(batch)
+                    if command == 'begin':
+                        store.begin_session(*argument)
+                    elif command == 'end':
+                        store.end_session(*argument)
+                    if time.monotonic() >= next_retention:
+                        store.apply_retention()
+                        next_retention = time.monotonic() + self.retention_interval
+                except sqlite3.Error as e:
+                    logging.error(f"Error writing history database {self.path}: {e}")
+            batch = []
+            deadline = time.monotonic() + self.batch_interval
+
+            if command == 'flush':
+                argument.set()
+            elif command == 'close':
+                break
+
+        if store is not None:
+            store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the SQLite temperature history.")
+    parser.add_argument("--database", default=config.get('storage', 'database', fallback=os.path.join(log_directory, 'temperature_history.db')))
+    parser.add_argument("--channel", type=int, help="channel to query; omit for all channels (rollup tiers only)")
+    parser.add_argument("--tier", choices=sorted(TIERS), default='1h')
+    parser.add_argument("--days", type=float, default=1.0, help="how far back to query")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.database)
+    try:
+        end = time.time()
+        started = time.perf_counter()
+        rows = store.query(args.channel, end - args.days * 86400, end, args.tier)
+        elapsed = time.perf_counter() - started
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        store.close()
+
+    for row in rows:
+        stamp = datetime.fromtimestamp(row[0]).strftime("%Y-%m-%d %H:%M:%S")
+        print(stamp, *(f"{value:.1f}" for value in row[1:]))
+    print(f"{len(rows)} rows in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())